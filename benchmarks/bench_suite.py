@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批处理性能测试
+
+用法:
+    python benchmarks/bench_suite.py [-j 1,2,4,8] [--orders fifo,largest-first] [--encoders fake]
+                                     [--baseline baseline.json] [--save-baseline]
+
+在可复现的测试图片集上，按不同并发数运行以下场景，取多次运行的最短耗时：
+
+    thumbnail_pillow   process_files -> process_thumbnail（Pillow后端）
+    thumbnail_ffmpeg   process_files -> process_thumbnail（ffmpeg后端）
+    avif_webp          process_files -> process_avif_webp（逐个文件调用optimizt）
+    avif_webp_batch    process_files（每次optimizt调用处理一组文件）
+    avif_webp_pillow   process_files -> process_avif_webp（Pillow在进程内编码）
+    directory          process_directory（缩略图）
+
+每个场景再按--orders中的任务顺序（见src/core/job_order.py）分别运行，图片集按
+small、medium、large的顺序生成，fifo相当于大图排在最后的最坏情况。
+
+默认使用fake_encoder.py中的ffmpeg/optimizt替身，编码耗时由--fake-delay模拟，
+--fake-delay-per-mb让耗时随文件大小增加，此时任务顺序的差别才会体现出来；
+测到的是调度和进程管理本身的开销；--encoders real 使用系统中安装的工具，
+此时avif_webp_pillow和avif_webp*的文件/秒可以直接比较两种后端。
+指定--baseline时与基线比较，耗时增加超过--tolerance视为退化，退出码为1。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from benchmarks import corpus, fake_encoder
+from src.core.image_processor import ImageProcessor, ProcessType, OPTIMIZT_CHUNK_SIZE
+from src.core.job_order import JOB_ORDERS
+from src.core.tools import ToolRegistry
+
+SCENARIOS = ("thumbnail_pillow", "thumbnail_ffmpeg", "avif_webp", "avif_webp_batch", "avif_webp_pillow", "directory")
+OUTPUT_SUFFIXES = ("_proc.jpg", ".webp", ".avif")
+
+
+def _parse_list(value: str, convert=str) -> list:
+    return [convert(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def _clean_outputs(directory: str):
+    """删除上一次运行生成的输出"""
+    for name in os.listdir(directory):
+        if name.endswith(OUTPUT_SUFFIXES):
+            os.remove(os.path.join(directory, name))
+
+
+def _create_processor(scenario: str, concurrency: int, tools: ToolRegistry, order: str) -> ImageProcessor:
+    backend = {"thumbnail_pillow": "pillow", "thumbnail_ffmpeg": "ffmpeg"}.get(scenario, "auto")
+    return ImageProcessor(
+        concurrency=concurrency,
+        thumbnail_backend=backend,
+        avif_webp_backend="pillow" if scenario == "avif_webp_pillow" else "optimizt",
+        optimizt_chunk_size=OPTIMIZT_CHUNK_SIZE if scenario == "avif_webp_batch" else 1,
+        tools=tools,
+        job_order=order
+    )
+
+
+def _available(processor: ImageProcessor, scenario: str) -> bool:
+    if scenario.startswith("avif_webp"):
+        return processor.has_avif_webp_backend
+    return processor.has_thumbnail_backend
+
+
+async def _run_once(processor: ImageProcessor, scenario: str, work_dir: str, files: list):
+    if scenario == "directory":
+        return await processor.process_directory(work_dir, ProcessType.THUMBNAIL)
+    process_type = ProcessType.AVIF_WEBP if scenario.startswith("avif_webp") else ProcessType.THUMBNAIL
+    return await processor.process_files(files, process_type)
+
+
+def measure(scenario: str, concurrency: int, work_dir: str, files: list, repeat: int, tools: ToolRegistry,
+            order: str):
+    """返回单个场景的测量结果，工具不可用时返回None"""
+    processor = _create_processor(scenario, concurrency, tools, order)
+    if not _available(processor, scenario):
+        return None
+    best = None
+    failed = 0
+    try:
+        for _ in range(repeat):
+            _clean_outputs(work_dir)
+            start = time.perf_counter()
+            results = asyncio.run(_run_once(processor, scenario, work_dir, files))
+            elapsed = time.perf_counter() - start
+            failed = max(failed, sum(1 for result in results if not result.success))
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        processor.close()
+    _clean_outputs(work_dir)
+    return {
+        "seconds": best,
+        "files_per_second": len(files) / best if best else None,
+        "failed": failed,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """与基线比较，返回退化的场景数"""
+    regressions = 0
+    base_results = baseline.get("results", {})
+    if baseline.get("meta", {}).get("config") != results["meta"]["config"]:
+        print("注意: 基线的测试参数与本次不同，比较结果仅供参考")
+    print(f"\n{'场景':<40}{'基线 (s)':>12}{'本次 (s)':>12}{'变化':>10}")
+    for key, current in results["results"].items():
+        base = base_results.get(key)
+        if not base or not base.get("seconds"):
+            print(f"{key:<40}{'-':>12}{current['seconds']:>12.3f}{'新增':>10}")
+            continue
+        change = current["seconds"] / base["seconds"] - 1
+        mark = ""
+        if change > tolerance:
+            mark = "  退化"
+            regressions += 1
+        print(f"{key:<40}{base['seconds']:>12.3f}{current['seconds']:>12.3f}{change:>+10.1%}{mark}")
+    return regressions
+
+
+def run(args) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or os.path.join(tmp, "corpus")
+        files = corpus.generate(corpus_dir, args.count, args.sizes)
+        # 在副本上运行，避免在图片集目录中留下输出
+        work_dir = os.path.join(tmp, "work")
+        os.makedirs(work_dir)
+        work_files = []
+        for path in files:
+            target = os.path.join(work_dir, os.path.basename(path))
+            shutil.copyfile(path, target)
+            work_files.append(target)
+
+        if args.encoders == "fake":
+            bin_dir = fake_encoder.install(os.path.join(tmp, "bin"))
+            os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+            os.environ["BENCH_ENCODER_DELAY"] = str(args.fake_delay)
+            os.environ["BENCH_ENCODER_STARTUP"] = str(args.fake_startup)
+            os.environ["BENCH_ENCODER_DELAY_PER_MB"] = str(args.fake_delay_per_mb)
+        # 使用独立的工具缓存，不影响也不依赖用户数据目录
+        tools = ToolRegistry(cache_path=os.path.join(tmp, "tools.json"))
+
+        config = {
+            "corpus": corpus.corpus_spec(args.count, args.sizes),
+            "encoders": args.encoders,
+            "fake_delay": args.fake_delay if args.encoders == "fake" else None,
+            "fake_startup": args.fake_startup if args.encoders == "fake" else None,
+            "fake_delay_per_mb": args.fake_delay_per_mb if args.encoders == "fake" else None,
+            "repeat": args.repeat,
+        }
+        output = {
+            "meta": {
+                "config": json.loads(json.dumps(config)),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            },
+            "results": {},
+        }
+
+        print(f"图片集: {len(files)} 个文件，编码器: {args.encoders}")
+        print(f"{'场景':<40}{'耗时 (s)':>12}{'文件/秒':>12}{'失败':>8}")
+        for scenario in args.scenarios:
+            available = True
+            for concurrency in args.concurrency:
+                for order in args.orders:
+                    key = f"{scenario}@j{concurrency}@{order}"
+                    result = measure(scenario, concurrency, work_dir, work_files, args.repeat, tools, order)
+                    if result is None:
+                        print(f"{key:<40}{'工具不可用，跳过':>12}")
+                        available = False
+                        break
+                    output["results"][key] = result
+                    print(f"{key:<40}{result['seconds']:>12.3f}{result['files_per_second']:>12.1f}{result['failed']:>8}")
+                if not available:
+                    break
+
+    regressions = 0
+    if args.baseline and not args.save_baseline:
+        try:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取基线失败: {e}")
+            return 2
+        regressions = compare(output, baseline, args.tolerance)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {args.baseline}")
+    if regressions:
+        print(f"\n{regressions} 个场景耗时增加超过 {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批处理性能测试")
+    parser.add_argument("-j", "--concurrency", type=lambda v: _parse_list(v, int), default=[1, 2, 4, 8],
+                        help="逗号分隔的并发数，默认1,2,4,8")
+    parser.add_argument("--scenarios", type=_parse_list, default=list(SCENARIOS),
+                        help=f"逗号分隔的场景，默认全部: {','.join(SCENARIOS)}")
+    parser.add_argument("--orders", type=_parse_list, default=list(JOB_ORDERS),
+                        help=f"逗号分隔的任务顺序，默认全部: {','.join(JOB_ORDERS)}")
+    parser.add_argument("--encoders", choices=("fake", "real"), default="fake",
+                        help="fake使用替身程序（默认），real使用系统中安装的ffmpeg/optimizt")
+    parser.add_argument("--fake-delay", type=float, default=0.0, help="替身程序每个文件的编码耗时（秒）")
+    parser.add_argument("--fake-startup", type=float, default=0.0, help="替身程序每次启动的耗时（秒）")
+    parser.add_argument("--fake-delay-per-mb", type=float, default=0.0, help="替身程序每MB输入额外的编码耗时（秒）")
+    parser.add_argument("--corpus", help="图片集目录，默认生成到临时目录")
+    parser.add_argument("--count", type=int, default=4, help="每种尺寸的图片数")
+    parser.add_argument("--sizes", type=corpus.parse_sizes, default=list(corpus.SIZES),
+                        help="逗号分隔的尺寸: small,medium,large")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景重复次数")
+    parser.add_argument("--baseline", help="基线文件，存在时与之比较")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="判定退化的耗时增幅，默认0.15")
+    parser.add_argument("-o", "--output", help="把本次结果写入JSON文件")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(unknown)}")
+    unknown = [name for name in args.orders if name not in JOB_ORDERS]
+    if unknown:
+        parser.error(f"未知的任务顺序: {', '.join(unknown)}")
+    args.repeat = max(1, args.repeat)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+缩略图后端对比测试
+
+用法:
+    python benchmarks/bench_thumbnail.py 图片或目录 [...] [--repeat 3]
+
+每个文件都会复制到临时目录，分别用 pillow 和 ffmpeg 后端生成缩略图，
+输出每个文件在各后端下的耗时（取多次运行的最小值）。
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.core.image_processor import ImageProcessor, THUMBNAIL_BACKENDS
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def collect_files(paths):
+    """收集待测试的图片文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(IMAGE_EXTENSIONS) and not name.endswith('_proc.jpg'):
+                        files.append(os.path.join(root, name))
+        else:
+            files.append(path)
+    return files
+
+
+async def time_backend(processor: ImageProcessor, input_path: str, repeat: int):
+    """返回单个文件的最短耗时（秒），失败时返回None"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await processor.process_thumbnail(input_path)
+        elapsed = time.perf_counter() - start
+        if not result.success:
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+async def run(files, repeat: int):
+    processors = {name: ImageProcessor(thumbnail_backend=name) for name in THUMBNAIL_BACKENDS}
+    available = [name for name, p in processors.items() if p.has_thumbnail_backend]
+    if not available:
+        print("没有可用的缩略图后端")
+        return 1
+
+    totals = {name: 0.0 for name in available}
+    header = f"{'文件':<40}" + "".join(f"{name + ' (ms)':>14}" for name in available)
+    print(header)
+    with tempfile.TemporaryDirectory() as tmp:
+        for index, path in enumerate(files):
+            # 复制到临时目录，避免在源目录留下_proc.jpg
+            work_path = os.path.join(tmp, f"{index}{os.path.splitext(path)[1]}")
+            shutil.copyfile(path, work_path)
+            row = f"{os.path.basename(path)[:39]:<40}"
+            for name in available:
+                elapsed = await time_backend(processors[name], work_path, repeat)
+                if elapsed is None:
+                    row += f"{'失败':>14}"
+                else:
+                    totals[name] += elapsed
+                    row += f"{elapsed * 1000:>14.2f}"
+            print(row)
+
+    for processor in processors.values():
+        processor.close()
+    print("-" * len(header))
+    print(f"{'合计':<40}" + "".join(f"{totals[name] * 1000:>14.2f}" for name in available))
+    if files and len(available) == 2 and totals["pillow"] > 0:
+        print(f"pillow 相对 ffmpeg 加速: {totals['ffmpeg'] / totals['pillow']:.1f}x")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比缩略图后端的单文件耗时")
+    parser.add_argument("paths", nargs="+", help="图片文件或目录")
+    parser.add_argument("--repeat", type=int, default=3, help="每个文件重复次数")
+    args = parser.parse_args()
+    return asyncio.run(run(collect_files(args.paths), max(1, args.repeat)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
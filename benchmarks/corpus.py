@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+可复现的测试图片集
+
+按固定随机种子生成PNG和JPEG图片：低分辨率随机噪声放大后叠加色块，
+压缩难度接近真实照片和截图。同样的参数总是生成同样的图片。
+
+    python benchmarks/corpus.py 输出目录 [--count 4] [--sizes small,medium,large]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+from PIL import Image, ImageDraw
+
+SIZES = {
+    "small": (800, 600),
+    "medium": (1920, 1280),
+    "large": (4032, 3024),
+}
+SEED = 20240101
+SPEC_FILENAME = "corpus.json"
+
+
+def _make_image(rng: random.Random, width: int, height: int) -> Image.Image:
+    # 低分辨率噪声放大后得到平滑的色彩变化
+    small = (max(1, width // 32), max(1, height // 32))
+    planes = [
+        Image.frombytes("L", small, rng.randbytes(small[0] * small[1])).resize((width, height), Image.Resampling.BICUBIC)
+        for _ in range(3)
+    ]
+    image = Image.merge("RGB", planes)
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1 = min(width, x0 + rng.randrange(width // 8, width // 2))
+        y1 = min(height, y0 + rng.randrange(height // 8, height // 2))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+    return image
+
+
+def corpus_spec(count: int, sizes) -> dict:
+    return {"seed": SEED, "count": count, "sizes": {name: SIZES[name] for name in sizes}}
+
+
+def generate(directory: str, count: int = 4, sizes=tuple(SIZES)) -> list:
+    """生成图片集并返回文件列表；目录中已有相同参数的图片集时直接复用"""
+    spec = corpus_spec(count, sizes)
+    spec_path = os.path.join(directory, SPEC_FILENAME)
+    try:
+        with open(spec_path, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+    except (OSError, ValueError):
+        existing = None
+    if existing is not None and existing.get("spec") == json.loads(json.dumps(spec)):
+        files = [os.path.join(directory, name) for name in existing["files"]]
+        if all(os.path.exists(path) for path in files):
+            return files
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(SEED)
+    names = []
+    for size_name in sizes:
+        width, height = SIZES[size_name]
+        for index in range(count):
+            image = _make_image(rng, width, height)
+            # PNG和JPEG交替
+            if index % 2 == 0:
+                name = f"{size_name}_{index:03d}.png"
+                image.save(os.path.join(directory, name), "PNG", compress_level=6)
+            else:
+                name = f"{size_name}_{index:03d}.jpg"
+                image.save(os.path.join(directory, name), "JPEG", quality=90)
+            names.append(name)
+
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump({"spec": spec, "files": names}, f, indent=2)
+    return [os.path.join(directory, name) for name in names]
+
+
+def parse_sizes(value: str) -> list:
+    sizes = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in sizes if name not in SIZES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知的尺寸: {', '.join(unknown)}，可选 {', '.join(SIZES)}")
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成可复现的测试图片集")
+    parser.add_argument("directory", help="输出目录")
+    parser.add_argument("--count", type=int, default=4, help="每种尺寸的图片数")
+    parser.add_argument("--sizes", type=parse_sizes, default=list(SIZES), help="逗号分隔的尺寸: small,medium,large")
+    args = parser.parse_args()
+    files = generate(args.directory, args.count, args.sizes)
+    print(f"共 {len(files)} 个文件: {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ffmpeg/optimizt的替身
+
+只解析本项目实际使用的参数，按环境变量模拟启动和编码耗时，
+输出文件内容取输入文件的前1/4。用来在没有ffmpeg、Node.js的机器上
+单独测量调度和进程管理的开销。
+
+    BENCH_ENCODER_STARTUP  每次启动的耗时（秒），模拟Node.js启动，默认0
+    BENCH_ENCODER_DELAY    每个输入文件的编码耗时（秒），默认0
+    BENCH_ENCODER_DELAY_PER_MB  每MB输入额外的编码耗时（秒），模拟大图更慢，默认0
+    BENCH_ENCODER_FAIL     文件名包含该字符串时编码失败
+"""
+import os
+import sys
+import time
+
+
+def _env_float(name: str) -> float:
+    try:
+        return float(os.environ.get(name, "0"))
+    except ValueError:
+        return 0.0
+
+
+def _encode(input_path: str, output_path: str) -> bool:
+    fail = os.environ.get("BENCH_ENCODER_FAIL")
+    if fail and fail in os.path.basename(input_path):
+        return False
+    with open(input_path, "rb") as f:
+        data = f.read()
+    time.sleep(_env_float("BENCH_ENCODER_DELAY") + _env_float("BENCH_ENCODER_DELAY_PER_MB") * len(data) / 1_000_000)
+    with open(output_path, "wb") as f:
+        f.write(data[:max(1, len(data) // 4)])
+    return True
+
+
+def fake_ffmpeg(args) -> int:
+    if "-version" in args:
+        print("ffmpeg version fake-bench")
+        return 0
+    if "-encoders" in args:
+        print(" V....D mjpeg                MJPEG (Motion JPEG)")
+        return 0
+    try:
+        input_path = args[args.index("-i") + 1]
+    except (ValueError, IndexError):
+        return 1
+    # 输出路径是"-y"之外的最后一个参数
+    outputs = [arg for arg in args if arg != "-y"]
+    return 0 if _encode(input_path, outputs[-1]) else 1
+
+
+def fake_optimizt(args) -> int:
+    if "--version" in args:
+        print("0.0.0-fake-bench")
+        return 0
+    formats = [fmt for fmt in ("webp", "avif") if f"--{fmt}" in args]
+    status = 0
+    for input_path in (arg for arg in args if not arg.startswith("--")):
+        base = os.path.splitext(input_path)[0]
+        for fmt in formats:
+            if not _encode(input_path, f"{base}.{fmt}"):
+                status = 1
+    return status
+
+
+TOOLS = {"ffmpeg": fake_ffmpeg, "optimizt": fake_optimizt}
+
+
+def install(bin_dir: str) -> str:
+    """在bin_dir中生成ffmpeg和optimizt的启动脚本，返回bin_dir"""
+    os.makedirs(bin_dir, exist_ok=True)
+    script = os.path.abspath(__file__)
+    for name in TOOLS:
+        if os.name == "nt":
+            path = os.path.join(bin_dir, f"{name}.cmd")
+            content = f'@"{sys.executable}" "{script}" {name} %*\r\n'
+        else:
+            path = os.path.join(bin_dir, name)
+            content = f'#!/bin/sh\nexec "{sys.executable}" "{script}" {name} "$@"\n'
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        if os.name != "nt":
+            os.chmod(path, 0o755)
+    return bin_dir
+
+
+def main() -> int:
+    if len(sys.argv) < 2 or sys.argv[1] not in TOOLS:
+        print(f"用法: {os.path.basename(__file__)} {{{','.join(TOOLS)}}} 参数...", file=sys.stderr)
+        return 2
+    time.sleep(_env_float("BENCH_ENCODER_STARTUP"))
+    return TOOLS[sys.argv[1]](sys.argv[2:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
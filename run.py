@@ -3,12 +3,21 @@
 
 import os
 import sys
+import multiprocessing
 
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
-from src.main import main
-
 if __name__ == "__main__":
+    # 打包成exe后，进程池的工作进程也从这里启动
+    multiprocessing.freeze_support()
+
+    # 带子命令时以命令行模式运行，不加载Tk界面
+    from src.cli import COMMANDS
+    if len(sys.argv) > 1 and (sys.argv[1] in COMMANDS or sys.argv[1] in ("-h", "--help")):
+        from src.cli import main as cli_main
+        sys.exit(cli_main())
+
+    from src.main import main
     main() 
\ No newline at end of file
@@ -0,0 +1,486 @@
+"""
+命令行批处理模式
+
+不依赖Tk，可在CI或部署脚本中无界面运行：
+
+    python run.py process 图片或目录 [...] --mode both -j 8 --json
+    python run.py process --resume
+    python run.py watch 目录 --mode both
+    python run.py plan 图片或目录 [...] --mode both
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import time
+from dataclasses import asdict
+from typing import List, Optional, Tuple
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.core import pillow_engine
+from src.core.image_processor import (
+    ImageProcessor, ProcessType, ProcessResult, THUMBNAIL_BACKENDS, AVIF_WEBP_BACKENDS,
+    OPTIMIZT_CHUNK_SIZE, JOB_TIMEOUT
+)
+from src.core.executor import EXECUTOR_MODES, PixelExecutor
+from src.core.job_order import JOB_ORDERS
+from src.core.journal import JobJournal
+from src.core.lqip import LqipManifest
+from src.core.memory_budget import MemoryBudget
+from src.core.quality_search import QualityTarget, ssim_available
+from src.core.manifest import BuildManifest
+from src.core.metrics import summarize
+from src.core.planner import plan_batch
+from src.core.throughput import ThroughputHistory
+from src.utils.helpers import format_file_size
+from src.utils.logging_setup import LOG_LEVELS, json_from_env, level_from_env, setup_logging
+from src.core.watcher import ImageWatcher
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_MISSING_TOOL = 3
+EXIT_INTERRUPTED = 130
+
+COMMANDS = ("process", "watch", "plan")
+
+MODES = {
+    "thumbnail": [ProcessType.THUMBNAIL],
+    "avif-webp": [ProcessType.AVIF_WEBP],
+    "both": [ProcessType.THUMBNAIL, ProcessType.AVIF_WEBP],
+    "srcset": [ProcessType.SRCSET],
+}
+
+
+def _int_list(value: str) -> List[int]:
+    try:
+        widths = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的宽度列表: {value}")
+    if not widths or any(width <= 0 for width in widths):
+        raise argparse.ArgumentTypeError(f"无效的宽度列表: {value}")
+    return widths
+
+
+def _format_list(value: str) -> List[str]:
+    formats = [item.strip().lower() for item in value.split(",") if item.strip()]
+    unknown = [fmt for fmt in formats if fmt not in pillow_engine.SRCSET_FORMATS]
+    if not formats or unknown:
+        raise argparse.ArgumentTypeError(f"无效的格式列表: {value}，可选 {','.join(pillow_engine.SRCSET_FORMATS)}")
+    return formats
+
+
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2}
+
+
+def _byte_size(value: str) -> int:
+    """解析 200KB、1.5M、80000 这样的大小"""
+    text = value.strip().upper()
+    number = text.rstrip("KMB")
+    try:
+        size = int(float(number) * SIZE_UNITS[text[len(number):]])
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError(f"无效的大小: {value}")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"无效的大小: {value}")
+    return size
+
+
+def _ssim_threshold(value: str) -> float:
+    try:
+        threshold = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的SSIM阈值: {value}")
+    if not 0 < threshold < 1:
+        raise argparse.ArgumentTypeError(f"SSIM阈值必须在0和1之间: {value}")
+    return threshold
+
+
+def _ratio(value: str) -> float:
+    try:
+        ratio = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的比例: {value}")
+    if not 0 <= ratio < 1:
+        raise argparse.ArgumentTypeError(f"比例必须在0和1之间: {value}")
+    return ratio
+
+
+def _quality_target(args) -> Optional[QualityTarget]:
+    if args.target_size:
+        return QualityTarget("size", args.target_size)
+    if args.target_ssim:
+        return QualityTarget("ssim", args.target_ssim)
+    return None
+
+
+def _add_common_arguments(parser: argparse.ArgumentParser):
+    """process和watch共用的参数"""
+    parser.add_argument("--mode", choices=sorted(MODES), default="both", help="处理类型，默认both")
+    parser.add_argument("-j", "--concurrency", type=int, default=None,
+                        help="同时处理的文件数，默认为CPU核心数")
+    parser.add_argument("--thumbnail-backend", choices=("auto",) + THUMBNAIL_BACKENDS, default="auto",
+                        help="缩略图后端，默认auto")
+    parser.add_argument("--avif-webp-backend", choices=("auto",) + AVIF_WEBP_BACKENDS, default="auto",
+                        help="avif/webp后端，auto优先使用optimizt，未安装时使用Pillow，默认auto")
+    parser.add_argument("--webp-quality", type=int, default=pillow_engine.WEBP_QUALITY,
+                        help=f"Pillow后端的webp质量（0-100），默认{pillow_engine.WEBP_QUALITY}")
+    parser.add_argument("--webp-method", type=int, default=pillow_engine.WEBP_METHOD,
+                        help=f"Pillow后端的webp压缩方法（0最快-6最慢），默认{pillow_engine.WEBP_METHOD}")
+    parser.add_argument("--avif-quality", type=int, default=pillow_engine.AVIF_QUALITY,
+                        help=f"Pillow后端的avif质量（0-100），默认{pillow_engine.AVIF_QUALITY}")
+    parser.add_argument("--avif-speed", type=int, default=pillow_engine.AVIF_SPEED,
+                        help=f"Pillow后端的avif编码速度（0最慢-10最快），默认{pillow_engine.AVIF_SPEED}")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--target-size", type=_byte_size, metavar="SIZE", default=None,
+                        help="为每张图片搜索webp/avif画质，使文件不超过该大小（如200KB），使用Pillow后端")
+    target.add_argument("--target-ssim", type=_ssim_threshold, metavar="SSIM", default=None,
+                        help="为每张图片搜索与原图SSIM不低于该值（如0.95）的最低webp/avif画质，需要NumPy")
+    parser.add_argument("--min-saving", type=_ratio, metavar="RATIO", default=None,
+                        help="webp/avif至少比源文件小该比例（如0.05），否则删除该输出；avif不比webp小时也删除")
+    parser.add_argument("--flag-larger", action="store_true",
+                        help="配合--min-saving，只在结果中标记不合格的输出而不删除")
+    parser.add_argument("--optimize-sources", action="store_true",
+                        help="生成webp/avif后无损压缩源文件（PNG用Pillow，JPEG需要jpegtran），仅在变小时替换")
+    parser.add_argument("--optimizt-chunk-size", type=int, default=OPTIMIZT_CHUNK_SIZE,
+                        help=f"每次调用optimizt处理的最大文件数，1表示逐个处理，默认{OPTIMIZT_CHUNK_SIZE}")
+    parser.add_argument("--widths", type=_int_list, default=list(pillow_engine.SRCSET_WIDTHS),
+                        help=f"srcset的目标宽度，逗号分隔，默认{','.join(map(str, pillow_engine.SRCSET_WIDTHS))}")
+    parser.add_argument("--formats", type=_format_list, default=None,
+                        help="srcset的输出格式，逗号分隔，默认为Pillow支持的webp,avif")
+    parser.add_argument("--executor", choices=EXECUTOR_MODES, default="process",
+                        help="Pillow解码和编码的执行方式：process使用进程池（默认），thread使用线程池")
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT,
+                        help=f"单个文件的超时时间（秒），0表示不限制，默认{JOB_TIMEOUT}")
+    parser.add_argument("--memory-budget", type=int, metavar="MB", default=None,
+                        help="同时解码的图片预计占用内存的上限（MB），默认为物理内存的一半")
+    parser.add_argument("--max-pixels", type=float, metavar="MP", default=pillow_engine.MAX_IMAGE_PIXELS / 1_000_000,
+                        help="超过该像素数（百万）的图片直接拒绝，防止解压炸弹，默认200，0表示不限制")
+    parser.add_argument("--order", choices=JOB_ORDERS, default="largest-first",
+                        help="任务顺序：largest-first按像素数从大到小（默认，总耗时最短），"
+                             "smallest-first小图先做（更快看到结果），fifo按给出的顺序")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="不合并内容相同的源文件（默认只编码一次，其余的用硬链接/reflink/复制得到输出）")
+    parser.add_argument("--lqip", metavar="FILE", default=None,
+                        help="生成缩略图时把尺寸、base64占位图、主色调和BlurHash写入该JSON清单")
+    parser.add_argument("--manifest", default=None, help="增量构建清单路径，默认使用用户数据目录")
+    parser.add_argument("--no-manifest", action="store_true", help="不使用清单，仅按输出文件是否存在跳过")
+    parser.add_argument("--log-file", metavar="FILE", default=None, help="把日志写入该文件（按大小轮转）")
+    parser.add_argument("--log-level", type=str.upper, choices=LOG_LEVELS, default=None,
+                        help="日志级别，默认取环境变量BLOG_IMAGE_TOOL_LOG_LEVEL；未指定--log-file时作用于标准错误输出")
+    parser.add_argument("--log-json", action="store_true", help="日志文件使用JSON Lines格式，每个任务一行并带耗时")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果到标准输出")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出逐个文件的进度")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="run.py", description="博客图片处理工具（命令行模式）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    process = subparsers.add_parser("process", help="处理图片文件或目录")
+    process.add_argument("paths", nargs="*", help="图片文件或目录（目录会递归处理）")
+    _add_common_arguments(process)
+    process.add_argument("--summary", metavar="FILE", help="把运行统计（吞吐量、延迟分位数、节省空间）写入JSON文件")
+    process.add_argument("--resume", action="store_true",
+                         help="继续上次被中断的处理，只处理没有完成的文件（各自沿用当时的处理类型）")
+    process.add_argument("--journal", metavar="FILE", default=None, help="任务日志路径，默认使用用户数据目录")
+    process.add_argument("--no-journal", action="store_true", help="不记录任务日志，中断后无法继续")
+
+    plan = subparsers.add_parser("plan", help="只列出将要处理的文件并估算耗时，不做任何处理")
+    plan.add_argument("paths", nargs="+", help="图片文件或目录（目录会递归处理）")
+    _add_common_arguments(plan)
+    plan.add_argument("-v", "--verbose", action="store_true", help="列出每个被跳过的文件")
+
+    watch = subparsers.add_parser("watch", help="监视目录，自动处理新增和修改的图片")
+    watch.add_argument("directory", help="要监视的目录")
+    _add_common_arguments(watch)
+    watch.add_argument("--debounce", type=float, default=1.0, help="文件停止变化多少秒后才处理，默认1秒")
+    watch.add_argument("--poll", action="store_true", help="强制使用轮询而不是inotify")
+    watch.add_argument("--poll-interval", type=float, default=2.0, help="轮询间隔秒数，默认2秒")
+    watch.add_argument("--no-initial-scan", action="store_true", help="启动时不处理目录中已有的图片")
+    return parser
+
+
+def _missing_tool(processor: ImageProcessor, process_type: ProcessType) -> Optional[str]:
+    """返回缺失的工具名称"""
+    if process_type == ProcessType.THUMBNAIL and not processor.has_thumbnail_backend:
+        return "ffmpeg/Pillow"
+    if process_type == ProcessType.AVIF_WEBP and not processor.has_avif_webp_backend:
+        if processor.quality_target is not None:
+            return "Pillow（需支持webp/avif）"
+        return {"optimizt": "optimizt", "pillow": "Pillow（需支持webp/avif）"}.get(
+            processor.avif_webp_backend, "optimizt/Pillow"
+        )
+    if process_type == ProcessType.SRCSET and not (pillow_engine.is_available() and processor.srcset_formats):
+        return "Pillow（需支持webp/avif）"
+    return None
+
+
+def _result_to_dict(result: ProcessResult, process_type: ProcessType) -> dict:
+    data = asdict(result)
+    data["compression_ratio"] = result.compression_ratio
+    data["process_type"] = process_type.value
+    return data
+
+
+async def _run_process(args, processor: ImageProcessor, resume_runs=()) -> Tuple[List[ProcessResult], List[dict]]:
+    """按处理类型依次处理所有路径（或继续任务日志中未完成的运行），返回结果和对应的JSON记录"""
+    # 进度写到标准错误，保证--json时标准输出只有结果
+    progress_stream = sys.stderr if args.json else sys.stdout
+    results = []
+    records = []
+
+    def reporter(process_type: ProcessType):
+        def report(result: ProcessResult):
+            results.append(result)
+            records.append(_result_to_dict(result, process_type))
+            if not args.quiet:
+                status = "OK  " if result.success else "FAIL"
+                print(f"[{status}] {process_type.value}: {result.input_path} - {result.message}",
+                      file=progress_stream, flush=True)
+        return report
+
+    for run in resume_runs:
+        process_type = ProcessType(run.process_type)
+        if not args.quiet:
+            rescan = "" if run.scanned else f"，并重新扫描 {run.directory} 中没有枚举到的文件"
+            print(f"继续 {process_type.value}: 剩余 {run.pending}/{run.total} 个文件{rescan}",
+                  file=progress_stream, flush=True)
+        await processor.resume(run.run_id, progress_callback=reporter(process_type))
+    if resume_runs:
+        return results, records
+
+    for process_type in MODES[args.mode]:
+        report = reporter(process_type)
+        files = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                await processor.process_directory(path, process_type, progress_callback=report)
+            elif processor.selection_skip_reason(path, process_type) is None:
+                files.append(path)
+        if files:
+            await processor.process_files(files, process_type, progress_callback=report)
+
+    return results, records
+
+
+def _create_processor(args, manifest: Optional[BuildManifest], journal: Optional[JobJournal] = None) -> ImageProcessor:
+    return ImageProcessor(
+        concurrency=args.concurrency,
+        thumbnail_backend=args.thumbnail_backend,
+        manifest=manifest,
+        optimizt_chunk_size=args.optimizt_chunk_size,
+        throughput=ThroughputHistory(),
+        job_timeout=args.timeout or None,
+        srcset_widths=args.widths,
+        srcset_formats=args.formats,
+        avif_webp_backend=args.avif_webp_backend,
+        webp_quality=args.webp_quality,
+        webp_method=args.webp_method,
+        avif_quality=args.avif_quality,
+        avif_speed=args.avif_speed,
+        executor=PixelExecutor(args.executor),
+        lqip_manifest=LqipManifest(args.lqip) if args.lqip else None,
+        quality_target=_quality_target(args),
+        min_saving=args.min_saving,
+        budget_action="flag" if args.flag_larger else "delete",
+        optimize_sources=args.optimize_sources,
+        memory_budget=MemoryBudget(args.memory_budget * 1024 * 1024 if args.memory_budget else None),
+        max_pixels=int(args.max_pixels * 1_000_000) or None,
+        journal=journal,
+        deduplicate=not args.no_dedup,
+        job_order=args.order
+    )
+
+
+def _check_tools(args, processor: ImageProcessor, process_types: Optional[List[ProcessType]] = None) -> bool:
+    """检查所需工具，缺失时输出提示"""
+    for process_type in process_types or MODES[args.mode]:
+        tool = _missing_tool(processor, process_type)
+        if tool:
+            print(f"{tool}未安装", file=sys.stderr)
+            return False
+    return True
+
+
+def run_process(args) -> int:
+    """执行process子命令"""
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        print(f"路径不存在: {', '.join(missing)}", file=sys.stderr)
+        return EXIT_USAGE
+
+    manifest = None
+    if not args.no_manifest:
+        manifest = BuildManifest(args.manifest)
+    journal = None
+    if not args.no_journal:
+        journal = JobJournal(args.journal)
+
+    processor = None
+    try:
+        resume_runs = []
+        if args.resume:
+            resume_runs = journal.unfinished_runs()
+            if not resume_runs:
+                print("没有需要继续的处理", file=sys.stderr)
+                return EXIT_OK
+        processor = _create_processor(args, manifest, journal)
+        if not _check_tools(args, processor, [ProcessType(run.process_type) for run in resume_runs]):
+            return EXIT_MISSING_TOOL
+
+        started = time.perf_counter()
+        results, records = asyncio.run(_run_process(args, processor, resume_runs))
+        summary = summarize(results, time.perf_counter() - started)
+    finally:
+        if processor is not None:
+            processor.close()
+        if manifest is not None:
+            manifest.close()
+        if journal is not None:
+            journal.close()
+
+    if args.summary:
+        summary.write_json(args.summary)
+    if args.json:
+        json.dump(
+            {"results": records, "summary": summary.to_dict()},
+            sys.stdout,
+            ensure_ascii=False,
+            indent=2
+        )
+        sys.stdout.write("\n")
+    elif not args.quiet:
+        for line in summary.format_lines():
+            print(line)
+
+    return EXIT_FAILED if summary.failed else EXIT_OK
+
+
+def run_plan(args) -> int:
+    """执行plan子命令"""
+    manifest = None
+    if not args.no_manifest:
+        manifest = BuildManifest(args.manifest)
+
+    processor = None
+    try:
+        processor = _create_processor(args, manifest)
+        plans = [plan_batch(processor, args.paths, process_type) for process_type in MODES[args.mode]]
+    finally:
+        if processor is not None:
+            processor.close()
+        if manifest is not None:
+            manifest.close()
+
+    if args.json:
+        json.dump({"plans": [plan.to_dict() for plan in plans]}, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+        return EXIT_OK
+
+    for plan in plans:
+        if plan.estimated_seconds is None:
+            estimate = "无历史数据，无法估算"
+        else:
+            estimate = f"{plan.estimated_seconds:.1f} 秒"
+        print(f"{plan.process_type.value}: {len(plan.jobs)} 个任务，跳过 {len(plan.skipped)} 个")
+        print(f"  输入 {format_file_size(plan.total_bytes)}，{plan.total_pixels / 1_000_000:.1f} 百万像素，"
+              f"预计耗时 {estimate}（并发 {plan.concurrency}）")
+        for reason, count in sorted(plan.skip_counts().items()):
+            print(f"  跳过 - {reason}: {count}")
+        if args.verbose:
+            for item in plan.skipped:
+                print(f"    {item.path}: {item.reason}")
+    return EXIT_OK
+
+
+def run_watch(args) -> int:
+    """执行watch子命令，按Ctrl+C退出"""
+    if not os.path.isdir(args.directory):
+        print(f"目录不存在: {args.directory}", file=sys.stderr)
+        return EXIT_USAGE
+
+    def report(result: ProcessResult):
+        if args.json:
+            # 每个结果一行JSON，便于其他程序逐行读取
+            print(json.dumps(asdict(result), ensure_ascii=False), flush=True)
+        elif not args.quiet:
+            status = "OK  " if result.success else "FAIL"
+            print(f"[{status}] {result.input_path} - {result.message}", flush=True)
+
+    manifest = None
+    if not args.no_manifest:
+        manifest = BuildManifest(args.manifest)
+
+    processor = None
+    try:
+        processor = _create_processor(args, manifest)
+        if not _check_tools(args, processor):
+            return EXIT_MISSING_TOOL
+
+        watcher = ImageWatcher(
+            processor,
+            args.directory,
+            MODES[args.mode],
+            debounce=args.debounce,
+            poll_interval=args.poll_interval,
+            use_inotify=False if args.poll else None,
+            progress_callback=report
+        )
+        if not args.quiet:
+            print(f"正在监视 {watcher.directory}，按 Ctrl+C 退出", file=sys.stderr)
+        try:
+            asyncio.run(watcher.run(initial_scan=not args.no_initial_scan))
+        except KeyboardInterrupt:
+            pass
+    finally:
+        if processor is not None:
+            processor.close()
+        if manifest is not None:
+            manifest.close()
+    return EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # 标准错误默认只输出警告；写日志文件时文件使用指定的级别
+    if args.log_file:
+        console_level = "WARNING"
+    else:
+        console_level = args.log_level or level_from_env("WARNING")
+    setup_logging(args.log_file, args.log_level or level_from_env(), args.log_json or json_from_env(), console_level)
+    if args.target_size or args.target_ssim:
+        if args.avif_webp_backend == "optimizt":
+            parser.error("--target-size/--target-ssim 需要使用Pillow后端")
+        if args.target_ssim and not ssim_available():
+            parser.error("--target-ssim 需要安装NumPy")
+    if args.command == "process":
+        if args.resume and args.paths:
+            parser.error("--resume 不能同时指定路径")
+        if args.resume and args.no_journal:
+            parser.error("--resume 需要任务日志，不能与 --no-journal 同时使用")
+        if not args.resume and not args.paths:
+            parser.error("请指定图片文件或目录，或使用 --resume")
+    try:
+        if args.command == "process":
+            return run_process(args)
+        if args.command == "watch":
+            return run_watch(args)
+        if args.command == "plan":
+            return run_plan(args)
+    except KeyboardInterrupt:
+        print("处理已终止！", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    return EXIT_USAGE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
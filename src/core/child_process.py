@@ -0,0 +1,101 @@
+"""
+外部编码器子进程的启动、超时和结束
+
+每个子进程都放在独立的进程组中（Windows上为新的进程组），
+超时或被取消时先请求结束整个进程树，等待片刻后仍未退出再强制结束，
+避免optimizt.cmd -> node这样的子进程残留。
+"""
+import os
+import time
+import signal
+import asyncio
+from typing import Dict, List, Optional
+
+# 请求结束后等待多久再强制结束
+TERMINATE_GRACE = 3.0
+
+
+class ChildTimeoutError(Exception):
+    """子进程运行超时"""
+
+
+def _spawn_options() -> dict:
+    if os.name == "nt":
+        return {"creationflags": 0x00000200}  # CREATE_NEW_PROCESS_GROUP
+    return {"start_new_session": True}
+
+
+async def _taskkill(pid: int, force: bool):
+    args = ["taskkill", "/T", "/PID", str(pid)]
+    if force:
+        args.insert(1, "/F")
+    try:
+        killer = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        await killer.wait()
+    except OSError:
+        pass
+
+
+def _signal_group(pid: int, sig: int):
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def kill_process_tree(process: asyncio.subprocess.Process, grace: float = TERMINATE_GRACE):
+    """先请求结束整个进程树，超过grace秒仍未退出则强制结束"""
+    if process.returncode is not None:
+        return
+    if os.name == "nt":
+        await _taskkill(process.pid, force=False)
+    else:
+        _signal_group(process.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+        return
+    except asyncio.TimeoutError:
+        pass
+    if os.name == "nt":
+        await _taskkill(process.pid, force=True)
+    else:
+        _signal_group(process.pid, signal.SIGKILL)
+    await process.wait()
+
+
+async def run_child(
+    cmd: List[str],
+    timeout: Optional[float] = None,
+    timings: Optional[Dict[str, float]] = None
+) -> int:
+    """运行子进程并返回退出码
+
+    超时抛出ChildTimeoutError；所在任务被取消时会先结束整个进程树再继续抛出CancelledError。
+    传入timings时记录启动进程（spawn）和等待其退出（encode）的耗时。
+    """
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+        **_spawn_options()
+    )
+    spawned = time.perf_counter()
+    if timings is not None:
+        timings["spawn"] = spawned - started
+    try:
+        return await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        await kill_process_tree(process)
+        raise ChildTimeoutError(f"超过 {timeout:g} 秒未完成")
+    except asyncio.CancelledError:
+        # 取消时不能等待太久，放到独立任务里并等待其完成
+        await asyncio.shield(asyncio.ensure_future(kill_process_tree(process)))
+        raise
+    finally:
+        if timings is not None:
+            timings["encode"] = time.perf_counter() - spawned
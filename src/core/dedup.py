@@ -0,0 +1,121 @@
+"""
+内容相同的源图片去重
+
+同一张截图或横幅常被复制到多篇文章的目录中，逐个编码会重复做最耗时的工作。
+批处理中先按文件大小筛选，只有大小与之前的文件相同时才计算内容哈希；
+内容完全相同的文件只编码第一个，其余的等它完成后用硬链接或reflink得到输出，
+两者都不支持（如跨磁盘、FAT32）时复制文件。
+"""
+import os
+import shutil
+import asyncio
+import tempfile
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，跳过reflink
+    fcntl = None
+
+from src.core.manifest import hash_source
+from src.core.pillow_engine import TEMP_SUFFIX, temp_prefix
+
+# Linux的FICLONE ioctl，在btrfs、XFS等文件系统上创建共享数据块的写时复制副本
+FICLONE = 0x40049409
+
+
+def _reflink(source: str, target: str):
+    if fcntl is None:
+        raise OSError("不支持reflink")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def materialize(source: str, target: str) -> str:
+    """让target成为source的副本，依次尝试硬链接、reflink和复制，返回使用的方式"""
+    fd, tmp_path = tempfile.mkstemp(suffix=TEMP_SUFFIX, prefix=temp_prefix(target), dir=os.path.dirname(target) or ".")
+    os.close(fd)
+    # 只借用唯一的文件名，os.link不能覆盖已有的文件
+    os.remove(tmp_path)
+    for mode, link in (("hardlink", os.link), ("reflink", _reflink)):
+        try:
+            link(source, tmp_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            continue
+        os.replace(tmp_path, target)
+        return mode
+    try:
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return "copy"
+
+
+def break_hardlink(path: str):
+    """外部编码器会原地改写输出文件，写入前删除带硬链接的输出，避免改动另一份"""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+class DuplicateIndex:
+    """一次批处理中见过的源文件
+
+    按文件大小分组，只有出现大小相同的文件时才计算哈希（每个文件最多一次）。
+    每个不重复的文件登记一个结果，内容相同的文件等待它处理完成。
+    """
+
+    def __init__(self):
+        self._by_size: Dict[int, List[str]] = {}
+        self._hashes: Dict[str, asyncio.Future] = {}
+        self._results: Dict[str, asyncio.Future] = {}
+
+    def digest(self, path: str) -> asyncio.Future:
+        """文件内容哈希，在线程池中计算并缓存"""
+        if path not in self._hashes:
+            self._hashes[path] = asyncio.get_running_loop().run_in_executor(None, hash_source, path)
+        return self._hashes[path]
+
+    async def find(self, path: str) -> Optional[str]:
+        """返回先出现的内容相同的文件
+
+        没有时把path登记为可被复用的文件，处理完成后须调用publish。
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        candidates = self._by_size.setdefault(size, [])
+        index = 0
+        # 计算哈希期间可能有新文件登记，检查到列表末尾后才登记自己
+        while index < len(candidates):
+            candidate = candidates[index]
+            index += 1
+            try:
+                if await self.digest(candidate) == await self.digest(path):
+                    return candidate
+            except OSError:
+                continue
+        candidates.append(path)
+        self._results[path] = asyncio.get_running_loop().create_future()
+        return None
+
+    async def result_of(self, path: str):
+        """等待登记的文件处理完成，返回其结果（出错时为None）"""
+        return await self._results[path]
+
+    def publish(self, path: str, result):
+        future = self._results.get(path)
+        if future is not None and not future.done():
+            future.set_result(result)
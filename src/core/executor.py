@@ -0,0 +1,125 @@
+"""
+进程内图片处理（Pillow）的执行器
+
+解码、缩放和编码都是CPU密集的纯Python调用，放在事件循环线程里会阻塞界面，
+放在线程池里又会受GIL限制，因此默认交给进程池执行：
+任务只传文件路径和编码参数，像素数据在工作进程内读写，不经过进程间传递；
+返回值只有输出路径、尺寸和耗时这样的小对象。
+工作进程处理一定数量的任务后会被替换，避免长时间批处理时内存不断增长。
+
+已经开始执行的进程池任务无法取消：任务超时或被停止时终止整个进程池并在下次使用时重新创建，
+卡住的编码不会继续占用工作进程，也不会在之后写出输出；同一进程池中被连带终止的其他任务
+自动重新提交。线程方式下已开始的任务只能等它结束。
+"""
+import os
+import time
+import asyncio
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+EXECUTOR_MODES = ("process", "thread")
+# 每个工作进程处理多少个任务后被替换
+MAX_TASKS_PER_CHILD = 100
+# Windows上ProcessPoolExecutor最多支持61个工作进程
+MAX_WORKERS_LIMIT = 61
+
+
+def _call_timed(func: Callable, args: tuple) -> tuple:
+    """在工作进程中执行，把耗时和开始时间随结果一起返回（调用方传入的字典无法跨进程修改）"""
+    # 跨进程比较用墙上时间，perf_counter的起点在各进程中不一定相同
+    started = time.time()
+    timings: Dict[str, float] = {}
+    return func(*args, timings=timings), timings, started
+
+
+def _terminate_workers(pool: ProcessPoolExecutor):
+    """立即结束进程池中的工作进程，进程池随后被标记为不可用"""
+    terminate = getattr(pool, "terminate_workers", None)  # Python 3.14+
+    if terminate is not None:
+        terminate()
+        return
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+
+
+class PixelExecutor:
+    """CPU密集任务的执行器，进程池在第一次使用时才创建"""
+
+    def __init__(
+        self,
+        mode: str = "process",
+        max_workers: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = MAX_TASKS_PER_CHILD
+    ):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"未知的执行方式: {mode}")
+        self.mode = mode
+        self.max_workers = max(1, min(max_workers or os.cpu_count() or 1, MAX_WORKERS_LIMIT))
+        self.max_tasks_per_child = max_tasks_per_child
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # 因任务超时或取消而被终止的进程池
+        self._recycled = weakref.WeakSet()
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.mode != "process":
+            return None  # 使用事件循环默认的线程池
+        if self._pool is None:
+            # 指定max_tasks_per_child时使用spawn方式启动工作进程
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                max_tasks_per_child=self.max_tasks_per_child
+            )
+        return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        if self._pool is pool:
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _recycle(self, pool: ProcessPoolExecutor):
+        """终止进程池，正在执行的任务收到BrokenProcessPool，下一个任务使用新的进程池"""
+        self._recycled.add(pool)
+        if self._pool is pool:
+            self._pool = None
+        _terminate_workers(pool)
+        pool.shutdown(wait=False)
+
+    async def run(self, func: Callable, *args, timings: Optional[Dict[str, float]] = None) -> Any:
+        """执行func(*args, timings=...)，func必须是模块级函数，参数只包含路径和数字等小对象
+
+        传入timings时，从提交到工作进程开始执行的等待时间（包括启动工作进程）累加到pool_wait。
+        """
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        while True:
+            pool = self._get_pool()
+            if pool is None:
+                value, worker_timings, started = await loop.run_in_executor(None, _call_timed, func, args)
+                break
+            try:
+                future = pool.submit(_call_timed, func, args)
+                value, worker_timings, started = await asyncio.wrap_future(future)
+                break
+            except BrokenProcessPool:
+                if pool in self._recycled:
+                    continue  # 被其他任务的超时或取消连带终止，重新提交
+                # 工作进程异常退出（如内存不足）后进程池不能再用，下一个任务重新创建
+                self._discard(pool)
+                raise
+            except asyncio.CancelledError:
+                # 还没开始的任务可以直接取消，已经开始的只能终止工作进程
+                if not future.cancel() and not future.done():
+                    self._recycle(pool)
+                raise
+        if timings is not None:
+            timings.update(worker_timings)
+            timings["pool_wait"] = timings.get("pool_wait", 0.0) + max(0.0, started - submitted)
+        return value
+
+    def shutdown(self):
+        """结束工作进程，不等待未开始的任务"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
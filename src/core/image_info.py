@@ -0,0 +1,83 @@
+"""
+只读取文件头获取图片尺寸，不解码像素数据
+
+一次批处理中预估、排序和处理都要用到尺寸，结果按路径、修改时间和文件大小缓存，
+每个文件只读取一次文件头。
+"""
+import os
+import struct
+import functools
+from typing import BinaryIO, Optional, Tuple
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 带尺寸信息的JPEG SOF标记（排除DHT/JPG/DAC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _png_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    header = f.read(24)
+    if len(header) < 24 or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def _jpeg_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        # 跳过填充字节，找到下一个标记
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # 没有长度字段的标记
+        if marker == 0xD9:
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+# 缓存的文件数，足够覆盖一次批处理中同时在估算、排序和处理的文件
+SIZE_CACHE_ENTRIES = 65536
+
+
+def read_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """读取PNG/JPEG图片的宽高，无法识别时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _cached_size(path, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=SIZE_CACHE_ENTRIES)
+def _cached_size(path: str, mtime_ns: int, file_size: int) -> Optional[Tuple[int, int]]:
+    """文件被修改后mtime或大小改变，缓存自然失效"""
+    return _read_size(path)
+
+
+def _read_size(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8)
+            if head == PNG_SIGNATURE:
+                f.seek(0)
+                return _png_size(f)
+            if head[:2] == b"\xff\xd8":
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        pass
+    return None
@@ -1,10 +1,30 @@
 import os
+import time
+import uuid
+import shutil
 import asyncio
+import logging
+import tempfile
+import itertools
 import subprocess
-from typing import List, Optional, Tuple
-from dataclasses import dataclass
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from dataclasses import dataclass, field
 from enum import Enum
 
+from src.core import dedup, lqip, output_budget, pillow_engine, quality_search
+from src.core.child_process import ChildTimeoutError, run_child
+from src.core.executor import PixelExecutor
+from src.core.image_info import read_image_size
+from src.core.job_order import JOB_ORDERS, order_paths, order_stream
+from src.core.journal import JobJournal
+from src.core.manifest import BuildManifest, hash_source
+from src.core.memory_budget import MemoryBudget
+from src.core.throughput import ThroughputHistory
+from src.core.tools import ToolRegistry
+from src.core.scheduler import BatchScheduler, iterate_in_thread, maybe_await
+from src.utils.helpers import format_file_size
+
 class ProcessMode(Enum):
     SINGLE = "single"
     FOLDER = "folder"
@@ -12,6 +32,7 @@ class ProcessMode(Enum):
 class ProcessType(Enum):
     THUMBNAIL = "thumbnail"
     AVIF_WEBP = "avif_webp"
+    SRCSET = "srcset"
 
 @dataclass
 class ProcessResult:
@@ -19,47 +40,217 @@ class ProcessResult:
     message: str
     input_path: str
     output_paths: List[str]
+    # 输出已是最新、没有实际处理
+    skipped: bool = False
+    # 各阶段耗时（秒）：queue_wait、memory_wait（等待内存预算）、pool_wait（等待进程池的工作进程）、
+    # spawn、decode（Pillow解码和缩放）、encode（编码，外部编码器为整个进程的耗时）、write以及total，
+    # 批量调用optimizt时spawn/encode/write/total为平均分摊到每个文件的耗时
+    timings: Dict[str, float] = field(default_factory=dict)
+    input_bytes: int = 0
+    output_bytes: int = 0
+    # 本次写出的输出按类型（thumbnail、webp、avif、srcset-webp等）汇总的大小
+    kind_bytes: Dict[str, int] = field(default_factory=dict)
+    # 因不比源文件小而删除的输出
+    dropped_paths: List[str] = field(default_factory=list)
+    # 源文件被无损压缩改写时节省的字节数
+    source_saved_bytes: int = 0
+    # 与本批中另一源文件内容相同时复用了其输出，saved_seconds为省下的编码耗时（估计）
+    duplicate_of: Optional[str] = None
+    saved_seconds: float = 0.0
+
+    @property
+    def compression_ratio(self) -> Optional[float]:
+        """输出总大小与输入大小之比"""
+        if not self.input_bytes or not self.output_bytes:
+            return None
+        return self.output_bytes / self.input_bytes
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+THUMBNAIL_BACKENDS = ("pillow", "ffmpeg")
+
+# 各后端的编码参数，参数变化后清单会判定旧输出过期
+THUMBNAIL_PARAMS = {
+    "pillow": {"width": pillow_engine.THUMBNAIL_WIDTH, "quality": pillow_engine.THUMBNAIL_QUALITY},
+    "ffmpeg": {"width": 17, "q:v": 2, "compression_level": 50},
+}
+OPTIMIZT_PARAMS = {"force": True}
+AVIF_WEBP_BACKENDS = ("optimizt", "pillow")
+SRCSET_BACKEND = "pillow-srcset"
+# 单次optimizt调用的默认文件数和命令行长度上限
+OPTIMIZT_CHUNK_SIZE = 16
+OPTIMIZT_MAX_COMMAND_LENGTH = 24000
+# 单个文件的默认超时时间（秒）
+JOB_TIMEOUT = 300
+# 估算解码内存时每像素的字节数：RGBA缓冲区加上缩放和编码器的临时数据
+DECODE_BYTES_PER_PIXEL = {"thumbnail": 4, "avif_webp": 12, "srcset": 8}
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+# 文件系统时间戳精度有限，判断输出是否为本次写入时留出的余量
+MTIME_SLACK_NS = 2_000_000_000
+
+def _written_since(path: str, started_ns: int) -> bool:
+    """文件是否在started_ns之后写入过"""
+    try:
+        return os.stat(path).st_mtime_ns >= started_ns - MTIME_SLACK_NS
+    except OSError:
+        return False
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _temp_tag() -> str:
+    """Pillow任务的临时文件标记，任务超时或被取消时工作进程已被终止，按标记删除它写了一半的临时文件"""
+    return uuid.uuid4().hex[:12]
+
+def _set_queue_wait(result, seconds: float):
+    """调度器回调：记录任务在队列中的等待时间"""
+    for item in (result if isinstance(result, list) else [result]):
+        item.timings["queue_wait"] = seconds
+
+async def _aiter(items) -> AsyncIterator:
+    """把普通可迭代对象和异步迭代器统一成异步迭代器"""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
 
 class ImageProcessor:
-    def __init__(self):
-        self._ffmpeg_path = self._find_ffmpeg()
-        self._optimizt_path = self._find_optimizt()
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        thumbnail_backend: str = "auto",
+        manifest: Optional[BuildManifest] = None,
+        optimizt_chunk_size: int = OPTIMIZT_CHUNK_SIZE,
+        throughput: Optional[ThroughputHistory] = None,
+        tools: Optional[ToolRegistry] = None,
+        job_timeout: Optional[float] = JOB_TIMEOUT,
+        srcset_widths: Iterable[int] = pillow_engine.SRCSET_WIDTHS,
+        srcset_formats: Optional[Iterable[str]] = None,
+        avif_webp_backend: str = "auto",
+        webp_quality: int = pillow_engine.WEBP_QUALITY,
+        webp_method: int = pillow_engine.WEBP_METHOD,
+        avif_quality: int = pillow_engine.AVIF_QUALITY,
+        avif_speed: int = pillow_engine.AVIF_SPEED,
+        executor: Optional[PixelExecutor] = None,
+        lqip_manifest: Optional[lqip.LqipManifest] = None,
+        quality_target: Optional[quality_search.QualityTarget] = None,
+        quality_memo: Optional[quality_search.QualityMemo] = None,
+        min_saving: Optional[float] = None,
+        budget_action: str = "delete",
+        optimize_sources: bool = False,
+        memory_budget: Optional[MemoryBudget] = None,
+        max_pixels: Optional[int] = pillow_engine.MAX_IMAGE_PIXELS,
+        journal: Optional[JobJournal] = None,
+        deduplicate: bool = True,
+        job_order: str = "largest-first"
+    ):
+        # 外部工具在第一次用到时才查找，探测结果缓存在磁盘上
+        self.tools = tools if tools is not None else ToolRegistry()
+        # 同时运行的子进程数量，默认为CPU核心数
+        self.scheduler = BatchScheduler(concurrency)
+        # 缩略图后端: auto优先使用进程内的Pillow，不可用时回退到ffmpeg
+        if thumbnail_backend not in ("auto",) + THUMBNAIL_BACKENDS:
+            raise ValueError(f"未知的缩略图后端: {thumbnail_backend}")
+        self.thumbnail_backend = thumbnail_backend
+        # 增量构建清单，为None时仅根据输出文件是否存在来判断是否跳过
+        self.manifest = manifest
+        # 每次optimizt调用处理的最大文件数，1表示逐个文件调用
+        self.optimizt_chunk_size = max(1, optimizt_chunk_size)
+        # 吞吐量历史，用于估算批处理耗时
+        self.throughput = throughput
+        # 单个文件的超时时间（秒），None表示不限制
+        self.job_timeout = job_timeout
+        # srcset的目标宽度和格式，格式默认为Pillow支持的webp/avif
+        self.srcset_widths = tuple(srcset_widths)
+        if srcset_formats is None:
+            srcset_formats = pillow_engine.supported_formats()
+        unknown = [fmt for fmt in srcset_formats if fmt not in pillow_engine.SRCSET_FORMATS]
+        if unknown:
+            raise ValueError(f"未知的srcset格式: {', '.join(unknown)}")
+        self.srcset_formats = tuple(srcset_formats)
+        # avif/webp后端: auto优先使用optimizt，未安装时使用Pillow在进程内编码
+        if avif_webp_backend not in ("auto",) + AVIF_WEBP_BACKENDS:
+            raise ValueError(f"未知的avif/webp后端: {avif_webp_backend}")
+        self.avif_webp_backend = avif_webp_backend
+        # 按目标大小或SSIM搜索webp/avif画质，只有Pillow后端支持
+        if quality_target is not None:
+            if avif_webp_backend == "optimizt":
+                raise ValueError("按目标大小或SSIM搜索画质需要使用Pillow后端")
+            if quality_target.mode == "ssim" and not quality_search.ssim_available():
+                raise ValueError("按SSIM搜索画质需要安装NumPy")
+            if quality_memo is None:
+                quality_memo = quality_search.QualityMemo()
+        self.quality_target = quality_target
+        self.quality_memo = quality_memo
+        # webp/avif至少要比源文件小min_saving（如0.05），否则删除或只标记，None表示不检查
+        if budget_action not in output_budget.BUDGET_ACTIONS:
+            raise ValueError(f"未知的处理方式: {budget_action}")
+        self.min_saving = min_saving
+        self.budget_action = budget_action
+        # 生成webp/avif后无损压缩源PNG/JPEG
+        self.optimize_sources = optimize_sources
+        # 占位图清单，生成缩略图时顺带记录尺寸、data URI、主色调和BlurHash
+        self.lqip_manifest = lqip_manifest
+        # 按估算的解码内存限制同时处理的大图数量
+        self.memory_budget = memory_budget if memory_budget is not None else MemoryBudget()
+        # 文件头中的像素数超过max_pixels时直接拒绝，None表示不检查
+        self.max_pixels = max_pixels
+        # 任务日志，记录每个文件的排队/开始/完成状态，中断后可以恢复
+        self.journal = journal
+        # 批处理中内容相同的源文件只编码一次，其余的链接或复制输出
+        self.deduplicate = deduplicate
+        # 任务顺序：largest-first按文件头中的像素数从大到小（总耗时最短），smallest-first小图先做，fifo不排序
+        if job_order not in JOB_ORDERS:
+            raise ValueError(f"未知的任务顺序: {job_order}")
+        self.job_order = job_order
+        # 日志中标识每个任务的编号
+        self._job_ids = itertools.count(1)
+        # Pillow的解码和编码在进程池中执行，不阻塞事件循环也不受GIL限制
+        self.executor = executor if executor is not None else PixelExecutor()
+        # Pillow后端的编码参数，参数变化后清单会判定旧输出过期
+        self.pillow_encode_params = {
+            "webp": {"quality": webp_quality, "method": webp_method},
+            "avif": {"quality": avif_quality, "speed": avif_speed},
+        }
         
+    @property
+    def _ffmpeg_path(self) -> Optional[str]:
+        """ffmpeg可执行文件路径（首次访问时查找）"""
+        return self.tools.get("ffmpeg").path
+
+    @property
+    def _optimizt_path(self) -> Optional[str]:
+        """optimizt可执行文件路径（首次访问时查找）"""
+        return self.tools.get("optimizt").path
+
+    @property
+    def _jpegtran_path(self) -> Optional[str]:
+        """jpegtran可执行文件路径（首次访问时查找）"""
+        return self.tools.get("jpegtran").path
+
+    @property
+    def _drops_outputs(self) -> bool:
+        """是否会删除不比源文件小的输出，此时清单中登记为已删除的输出视为最新"""
+        return self.min_saving is not None and self.budget_action == "delete"
+
     def _check_environment(self):
-        """检查环境配置"""
-        # 检查ffmpeg
-        ffmpeg_path = self._find_ffmpeg()
-        if ffmpeg_path:
-            self._ffmpeg_path = ffmpeg_path
-        else:
-            self._ffmpeg_path = None
-            
-        # 检查optimizt
-        optimizt_path = self._find_optimizt()
-        if optimizt_path:
-            self._optimizt_path = optimizt_path
-        else:
-            self._optimizt_path = None
+        """重新检查环境配置"""
+        self.tools.refresh()
+        self._find_ffmpeg()
+        self._find_optimizt()
             
     def _find_ffmpeg(self) -> Optional[str]:
         """查找ffmpeg可执行文件路径"""
-        try:
-            subprocess.run(["ffmpeg", "-version"], capture_output=True)
-            return "ffmpeg"
-        except FileNotFoundError:
-            return None
+        return self._ffmpeg_path
             
     def _find_optimizt(self) -> Optional[str]:
         """查找optimizt可执行文件路径"""
-        try:
-            subprocess.run(["optimizt", "--version"], capture_output=True)
-            return "optimizt"
-        except FileNotFoundError:
-            npm_path = os.path.join(os.environ.get('USERPROFILE', ''), 'AppData', 'Roaming', 'npm')
-            optimizt_cmd = os.path.join(npm_path, 'optimizt.cmd')
-            if os.path.exists(optimizt_cmd):
-                return optimizt_cmd
-            return None
+        return self._optimizt_path
         
     def _check_command(self, command: str) -> bool:
         """检查命令是否可用"""
@@ -133,20 +324,232 @@ class ImageProcessor:
         except:
             return False
 
-    async def process_thumbnail(self, input_path: str) -> ProcessResult:
-        """异步处理缩略图"""
-        if not self._ffmpeg_path:
+    def _resolve_thumbnail_backend(self) -> Optional[str]:
+        """确定实际使用的缩略图后端"""
+        if self.thumbnail_backend == "pillow":
+            return "pillow" if pillow_engine.is_available() else None
+        if self.thumbnail_backend == "ffmpeg":
+            return "ffmpeg" if self._ffmpeg_path else None
+        if pillow_engine.is_available():
+            return "pillow"
+        if self._ffmpeg_path:
+            return "ffmpeg"
+        return None
+
+    @property
+    def has_thumbnail_backend(self) -> bool:
+        """是否有可用的缩略图后端"""
+        return self._resolve_thumbnail_backend() is not None
+
+    def _is_output_current(self, input_path: str, output_path: str, backend: str, params: dict) -> bool:
+        """检查输出文件是否为最新"""
+        if self.manifest is None:
+            return os.path.exists(output_path)
+        return self.manifest.is_up_to_date(input_path, output_path, backend, params, self._drops_outputs)
+
+    async def _record_outputs(
+        self,
+        input_path: str,
+        output_paths: List[str],
+        backend: str,
+        params: dict,
+        timings: Optional[Dict[str, float]] = None
+    ):
+        """把新生成的输出登记到清单，传入timings时耗时计入write阶段"""
+        started = time.perf_counter()
+        if self.manifest is not None and output_paths:
+            loop = asyncio.get_running_loop()
+            source_hash = await self._source_hash(input_path)
+            for output_path in output_paths:
+                await loop.run_in_executor(
+                    None, self.manifest.record, input_path, output_path, backend, params, source_hash
+                )
+        if timings is not None:
+            timings["write"] = timings.get("write", 0.0) + time.perf_counter() - started
+
+    @staticmethod
+    async def _source_hash(input_path: str) -> Optional[str]:
+        """在线程池中计算源文件哈希，同一源文件只读一遍，文件不存在时返回None"""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, hash_source, input_path)
+        except OSError:
+            return None
+
+    def close(self):
+        """释放进程池等资源"""
+        self.executor.shutdown()
+
+    def cancel(self):
+        """立即终止当前批处理（需在事件循环线程中调用）
+
+        正在运行的任务会被取消，对应的编码器子进程连同其子进程一起结束，
+        写了一半的输出文件会被删除。
+        """
+        self.scheduler.cancel()
+
+    def _remove_partial_outputs(self, output_paths: List[str], started_ns: int):
+        """删除本次任务开始后写入的输出文件"""
+        for output_path in output_paths:
+            if _written_since(output_path, started_ns):
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    continue
+                if self.manifest is not None:
+                    self.manifest.forget(output_path)
+
+    async def _run_encoder(
+        self,
+        cmd: List[str],
+        output_paths: List[str],
+        timeout: Optional[float],
+        cleanup_on_error: bool = True,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[Optional[int], Optional[str]]:
+        """运行编码器子进程，返回(退出码, 错误信息)
+
+        超时或被取消时结束整个进程树并删除写了一半的输出。
+        """
+        started_ns = time.time_ns()
+        for output_path in output_paths:
+            dedup.break_hardlink(output_path)
+        try:
+            returncode = await run_child(cmd, timeout, timings)
+        except ChildTimeoutError as e:
+            self._remove_partial_outputs(output_paths, started_ns)
+            return None, f"处理超时: {str(e)}"
+        except asyncio.CancelledError:
+            self._remove_partial_outputs(output_paths, started_ns)
+            raise
+        if returncode != 0 and cleanup_on_error:
+            self._remove_partial_outputs(output_paths, started_ns)
+        return returncode, None
+
+    async def process_thumbnail(self, input_path: str, checked: bool = False) -> ProcessResult:
+        """异步处理缩略图
+
+        checked为True表示调用方已用directory_skip_reason确认过需要处理，
+        此时只有占位图清单缺少记录（缩略图可能已是最新）时才再查清单。
+        """
+        backend = self._resolve_thumbnail_backend()
+        recheck = not checked or (self.lqip_manifest is not None and not self.lqip_manifest.has(input_path))
+        if backend and self.manifest is not None and recheck:
+            loop = asyncio.get_running_loop()
+            reason = await loop.run_in_executor(
+                None, self.output_skip_reason, input_path, ProcessType.THUMBNAIL
+            )
+            if reason:
+                result = ProcessResult(
+                    success=True,
+                    message="文件已是最新，跳过处理",
+                    input_path=input_path,
+                    output_paths=[f"{os.path.splitext(input_path)[0]}_proc.jpg"],
+                    skipped=True
+                )
+                await self._add_placeholder(result)
+                return result
+        if backend == "pillow":
+            return await self._thumbnail_pillow(input_path)
+        if backend == "ffmpeg":
+            result = await self._thumbnail_ffmpeg(input_path)
+            await self._add_placeholder(result)
+            return result
+        if self.thumbnail_backend == "pillow":
+            message = "Pillow未安装"
+        else:
+            message = "ffmpeg未安装"
+        return ProcessResult(
+            success=False,
+            message=message,
+            input_path=input_path,
+            output_paths=[]
+        )
+
+    async def _add_placeholder(self, result: ProcessResult):
+        """根据已有的缩略图补充占位图清单（ffmpeg后端或缩略图已是最新时）"""
+        if self.lqip_manifest is None or not result.success:
+            return
+        if result.skipped and self.lqip_manifest.has(result.input_path):
+            return
+        try:
+            entry = await self.executor.run(
+                lqip.placeholder_from_file, result.input_path, result.output_paths[0], self.max_pixels
+            )
+        except Exception as e:
+            result.message += f"（占位图生成失败: {str(e)}）"
+            return
+        self.lqip_manifest.add(result.input_path, entry)
+
+    async def _thumbnail_pillow(self, input_path: str) -> ProcessResult:
+        """使用Pillow在进程内生成缩略图"""
+        timings = {}
+        output_path = f"{os.path.splitext(input_path)[0]}_proc.jpg"
+        temp_tag = _temp_tag()
+        try:
+            # 解码和编码在进程池中执行；输出先写临时文件再替换，不会留下半个文件
+            # 需要占位图清单时在同一次解码中计算
+            make = pillow_engine.make_thumbnail if self.lqip_manifest is None else lqip.make_thumbnail_with_placeholder
+            value = await asyncio.wait_for(
+                self.executor.run(
+                    make, input_path, output_path,
+                    pillow_engine.THUMBNAIL_WIDTH, pillow_engine.THUMBNAIL_QUALITY, self.max_pixels, temp_tag,
+                    timings=timings
+                ),
+                self.job_timeout
+            )
+            if self.lqip_manifest is not None:
+                self.lqip_manifest.add(input_path, value)
+            await self._record_outputs(input_path, [output_path], "pillow", THUMBNAIL_PARAMS["pillow"], timings)
+            return ProcessResult(
+                success=True,
+                message="处理成功",
+                input_path=input_path,
+                output_paths=[output_path],
+                timings=timings
+            )
+        except asyncio.CancelledError:
+            pillow_engine.remove_temp_files([output_path], temp_tag)
+            raise
+        except asyncio.TimeoutError:
+            pillow_engine.remove_temp_files([output_path], temp_tag)
             return ProcessResult(
                 success=False,
-                message="ffmpeg未安装",
+                message=f"处理超时: 超过 {self.job_timeout:g} 秒未完成",
                 input_path=input_path,
-                output_paths=[]
+                output_paths=[],
+                timings=timings
             )
+        except Exception as e:
+            return ProcessResult(
+                success=False,
+                message=f"处理出错: {str(e)}",
+                input_path=input_path,
+                output_paths=[],
+                timings=timings
+            )
+
+    @staticmethod
+    def _ffmpeg_lowres(input_path: str) -> int:
+        """ffmpeg的-lowres级别（0~3），与Pillow的draft缩小倍数一致"""
+        if not input_path.lower().endswith(JPEG_EXTENSIONS):
+            return 0
+        size = read_image_size(input_path)
+        if not size:
+            return 0
+        scale = pillow_engine.draft_scale(size[0], THUMBNAIL_PARAMS["ffmpeg"]["width"])
+        return scale.bit_length() - 1
 
+    async def _thumbnail_ffmpeg(self, input_path: str) -> ProcessResult:
+        """使用ffmpeg子进程生成缩略图"""
+        timings = {}
         try:
             output_path = f"{os.path.splitext(input_path)[0]}_proc.jpg"
-            cmd = [
-                self._ffmpeg_path,
+            cmd = [self._ffmpeg_path]
+            # JPEG由解码器直接以1/2~1/8分辨率解码（-lowres为输入选项，须在-i之前）
+            lowres = await asyncio.get_running_loop().run_in_executor(None, self._ffmpeg_lowres, input_path)
+            if lowres:
+                cmd += ["-lowres", str(lowres)]
+            cmd += [
                 "-i", input_path,
                 "-vf", "scale=17:-1",
                 "-q:v", "2",
@@ -155,64 +558,117 @@ class ImageProcessor:
                 "-y"
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.DEVNULL
-            )
-            
-            await process.wait()
+            returncode, error = await self._run_encoder(cmd, [output_path], self.job_timeout, timings=timings)
+            if error:
+                return ProcessResult(
+                    success=False,
+                    message=error,
+                    input_path=input_path,
+                    output_paths=[],
+                    timings=timings
+                )
             
-            if process.returncode == 0:
+            if returncode == 0:
+                await self._record_outputs(input_path, [output_path], "ffmpeg", THUMBNAIL_PARAMS["ffmpeg"], timings)
                 return ProcessResult(
                     success=True,
                     message="处理成功",
                     input_path=input_path,
-                    output_paths=[output_path]
+                    output_paths=[output_path],
+                    timings=timings
                 )
             else:
                 return ProcessResult(
                     success=False,
                     message="处理失败",
                     input_path=input_path,
-                    output_paths=[]
+                    output_paths=[],
+                    timings=timings
                 )
         except Exception as e:
             return ProcessResult(
                 success=False,
                 message=f"处理出错: {str(e)}",
                 input_path=input_path,
-                output_paths=[]
+                output_paths=[],
+                timings=timings
             )
 
+    def _resolve_avif_webp_backend(self) -> Optional[str]:
+        """确定实际使用的avif/webp后端"""
+        pillow_ok = len(pillow_engine.supported_formats(("webp", "avif"))) == 2
+        if self.avif_webp_backend == "pillow" or self.quality_target is not None:
+            return "pillow" if pillow_ok else None
+        if self.avif_webp_backend == "optimizt":
+            return "optimizt" if self._optimizt_path else None
+        if self._optimizt_path:
+            return "optimizt"
+        return "pillow" if pillow_ok else None
+
+    @property
+    def has_avif_webp_backend(self) -> bool:
+        """是否有可用的avif/webp后端"""
+        return self._resolve_avif_webp_backend() is not None
+
+    def _avif_webp_params(self, fmt: str) -> Tuple[str, dict]:
+        """返回清单中记录的(后端, 编码参数)"""
+        if self._resolve_avif_webp_backend() == "pillow":
+            if self.quality_target is not None:
+                return "pillow", {**self._search_params(fmt), **self.quality_target.params()}
+            return "pillow", self.pillow_encode_params[fmt]
+        return "optimizt", OPTIMIZT_PARAMS
+
+    def _search_params(self, fmt: str) -> dict:
+        """搜索画质时的其余编码参数"""
+        return {key: value for key, value in self.pillow_encode_params[fmt].items() if key != "quality"}
+
+    def _avif_webp_targets(self, input_path: str) -> Tuple[str, str, bool, bool]:
+        """返回webp/avif输出路径以及是否需要重新生成"""
+        base_path = os.path.splitext(input_path)[0]
+        webp_path = f"{base_path}.webp"
+        avif_path = f"{base_path}.avif"
+        need_webp = not self._is_output_current(input_path, webp_path, *self._avif_webp_params("webp"))
+        need_avif = not self._is_output_current(input_path, avif_path, *self._avif_webp_params("avif"))
+        return webp_path, avif_path, need_webp, need_avif
+
+    def _avif_webp_skipped(self, input_path: str, webp_path: str, avif_path: str) -> ProcessResult:
+        return ProcessResult(
+            success=True,
+            message="文件已存在，跳过处理",
+            input_path=input_path,
+            output_paths=[path for path in (webp_path, avif_path) if os.path.exists(path)],
+            skipped=True
+        )
+
     async def process_avif_webp(self, input_path: str) -> ProcessResult:
         """异步处理avif/webp格式"""
-        if not self._optimizt_path:
+        backend = self._resolve_avif_webp_backend()
+        if backend == "pillow":
+            return await self._avif_webp_pillow(input_path)
+        if backend is None:
+            if self.avif_webp_backend == "pillow":
+                message = "Pillow不支持webp/avif"
+            else:
+                message = "optimizt未安装"
             return ProcessResult(
                 success=False,
-                message="optimizt未安装",
+                message=message,
                 input_path=input_path,
                 output_paths=[]
             )
 
+        timings = {}
         try:
-            base_path = os.path.splitext(input_path)[0]
-            webp_path = f"{base_path}.webp"
-            avif_path = f"{base_path}.avif"
-            
             cmd = [self._optimizt_path, "--force"]
             
             # 检查是否需要生成webp和avif
-            need_webp = not os.path.exists(webp_path)
-            need_avif = not os.path.exists(avif_path)
+            loop = asyncio.get_running_loop()
+            webp_path, avif_path, need_webp, need_avif = await loop.run_in_executor(
+                None, self._avif_webp_targets, input_path
+            )
             
             if not need_webp and not need_avif:
-                return ProcessResult(
-                    success=True,
-                    message="文件已存在，跳过处理",
-                    input_path=input_path,
-                    output_paths=[webp_path, avif_path]
-                )
+                return self._avif_webp_skipped(input_path, webp_path, avif_path)
             
             if need_webp:
                 cmd.append("--webp")
@@ -221,90 +677,1053 @@ class ImageProcessor:
             
             cmd.append(input_path)
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.DEVNULL
-            )
-            
-            await process.wait()
+            targets = ([webp_path] if need_webp else []) + ([avif_path] if need_avif else [])
+            returncode, error = await self._run_encoder(cmd, targets, self.job_timeout, timings=timings)
+            if error:
+                return ProcessResult(
+                    success=False,
+                    message=error,
+                    input_path=input_path,
+                    output_paths=[],
+                    timings=timings
+                )
             
-            if process.returncode == 0:
+            if returncode == 0:
                 output_paths = []
                 if need_webp and os.path.exists(webp_path):
                     output_paths.append(webp_path)
                 if need_avif and os.path.exists(avif_path):
                     output_paths.append(avif_path)
+                await self._record_outputs(input_path, output_paths, "optimizt", OPTIMIZT_PARAMS, timings)
                     
                 return ProcessResult(
                     success=True,
                     message="处理成功",
                     input_path=input_path,
-                    output_paths=output_paths
+                    output_paths=output_paths,
+                    timings=timings
                 )
             else:
                 return ProcessResult(
                     success=False,
                     message="处理失败",
                     input_path=input_path,
-                    output_paths=[]
+                    output_paths=[],
+                    timings=timings
+                )
+        except Exception as e:
+            return ProcessResult(
+                success=False,
+                message=f"处理出错: {str(e)}",
+                input_path=input_path,
+                output_paths=[],
+                timings=timings
+            )
+
+    async def _avif_webp_pillow(self, input_path: str) -> ProcessResult:
+        """使用Pillow在进程内编码webp/avif，源图片只解码一次"""
+        timings = {}
+        outputs = {}
+        temp_tag = _temp_tag()
+        try:
+            loop = asyncio.get_running_loop()
+            webp_path, avif_path, need_webp, need_avif = await loop.run_in_executor(
+                None, self._avif_webp_targets, input_path
+            )
+            if not need_webp and not need_avif:
+                return self._avif_webp_skipped(input_path, webp_path, avif_path)
+
+            if need_webp:
+                outputs["webp"] = webp_path
+            if need_avif:
+                outputs["avif"] = avif_path
+            message = "处理成功"
+            if self.quality_target is not None:
+                chosen = await asyncio.wait_for(
+                    self._encode_to_target(input_path, outputs, temp_tag, timings), self.job_timeout
                 )
+                output_paths = [info["path"] for info in chosen.values()]
+                qualities = ", ".join(f"{fmt} q={info['quality']}" for fmt, info in chosen.items())
+                message = f"处理成功（{qualities}）"
+            else:
+                output_paths = await asyncio.wait_for(
+                    self.executor.run(
+                        pillow_engine.convert_formats, input_path, outputs, self.pillow_encode_params, self.max_pixels,
+                        temp_tag, timings=timings
+                    ),
+                    self.job_timeout
+                )
+            for fmt, output_path in outputs.items():
+                await self._record_outputs(input_path, [output_path], *self._avif_webp_params(fmt), timings)
+            return ProcessResult(
+                success=True,
+                message=message,
+                input_path=input_path,
+                output_paths=output_paths,
+                timings=timings
+            )
+        except asyncio.CancelledError:
+            pillow_engine.remove_temp_files(outputs.values(), temp_tag)
+            raise
+        except asyncio.TimeoutError:
+            pillow_engine.remove_temp_files(outputs.values(), temp_tag)
+            return ProcessResult(
+                success=False,
+                message=f"处理超时: 超过 {self.job_timeout:g} 秒未完成",
+                input_path=input_path,
+                output_paths=[],
+                timings=timings
+            )
         except Exception as e:
             return ProcessResult(
                 success=False,
                 message=f"处理出错: {str(e)}",
                 input_path=input_path,
+                output_paths=[],
+                timings=timings
+            )
+
+    async def _encode_to_target(
+        self, input_path: str, outputs: Dict[str, str], temp_tag: str, timings: Dict[str, float]
+    ) -> Dict[str, dict]:
+        """按目标搜索画质并写出，选定的画质记入画质记忆"""
+        source_hash = await asyncio.get_running_loop().run_in_executor(None, hash_source, input_path)
+        params = {fmt: self._search_params(fmt) for fmt in outputs}
+        guesses = {
+            fmt: self.quality_memo.guess(
+                source_hash, fmt, self._avif_webp_params(fmt)[1], self.pillow_encode_params[fmt]["quality"]
+            )
+            for fmt in outputs
+        }
+        chosen = await self.executor.run(
+            quality_search.encode_to_target, input_path, outputs, params, self.quality_target, guesses,
+            self.max_pixels, temp_tag, timings=timings
+        )
+        for fmt, info in chosen.items():
+            self.quality_memo.record(source_hash, fmt, self._avif_webp_params(fmt)[1], info["quality"])
+        return chosen
+
+    async def _optimize_source(self, input_path: str) -> int:
+        """无损压缩源文件，返回节省的字节数
+
+        改写后更新清单中这个源文件的所有记录（缩略图、srcset等），像素不变，已有的输出仍然是最新的。
+        """
+        loop = asyncio.get_running_loop()
+        previous = None
+        if self.manifest is not None:
+            previous = await loop.run_in_executor(None, lambda: (os.stat(input_path), hash_source(input_path)))
+        saved = await self._rewrite_source(input_path)
+        if saved and previous is not None:
+            await loop.run_in_executor(None, self.manifest.refresh_source, input_path, *previous)
+        return saved
+
+    async def _rewrite_source(self, input_path: str) -> int:
+        """用Pillow（PNG）或jpegtran（JPEG）无损压缩源文件，变小时替换，返回节省的字节数"""
+        ext = os.path.splitext(input_path)[1].lower()
+        if ext == ".png":
+            if not pillow_engine.is_available():
+                return 0
+            temp_tag = _temp_tag()
+            try:
+                return await self.executor.run(output_budget.optimize_png, input_path, self.max_pixels, temp_tag)
+            except asyncio.CancelledError:
+                pillow_engine.remove_temp_files([input_path], temp_tag)
+                raise
+        loop = asyncio.get_running_loop()
+        jpegtran = await loop.run_in_executor(None, lambda: self._jpegtran_path)
+        if not jpegtran:
+            return 0
+        fd, tmp_path = tempfile.mkstemp(
+            suffix=pillow_engine.TEMP_SUFFIX, prefix=pillow_engine.temp_prefix(input_path),
+            dir=os.path.dirname(input_path) or "."
+        )
+        os.close(fd)
+        try:
+            cmd = output_budget.jpegtran_command(jpegtran, input_path, tmp_path)
+            returncode, error = await self._run_encoder(cmd, [tmp_path], self.job_timeout)
+            if error or returncode != 0:
+                return 0
+            saved = _file_size(input_path) - _file_size(tmp_path)
+            if saved <= 0:
+                return 0
+            shutil.copymode(input_path, tmp_path)
+            os.replace(tmp_path, input_path)
+            return saved
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _enforce_output_budget(self, result: ProcessResult):
+        """webp/avif编码后的检查：可选地无损压缩源文件，再删除或标记不比源文件小的输出"""
+        if not result.success or result.skipped or not result.output_paths:
+            return
+        if self.min_saving is None and not self.optimize_sources:
+            return
+        notes = []
+        try:
+            if self.optimize_sources:
+                # 无损压缩源文件是一次重新编码
+                started = time.perf_counter()
+                saved = await self._optimize_source(result.input_path)
+                result.timings["encode"] = result.timings.get("encode", 0.0) + time.perf_counter() - started
+                result.source_saved_bytes = saved
+                if saved:
+                    notes.append(f"源文件无损压缩节省 {format_file_size(saved)}")
+            started = time.perf_counter()
+            rejected = {}
+            source_hash = None
+            if self.min_saving is not None:
+                loop = asyncio.get_running_loop()
+                rejected = await loop.run_in_executor(
+                    None, output_budget.check_outputs, result.input_path, result.output_paths, self.min_saving
+                )
+            for output_path, reason in rejected.items():
+                if self.budget_action == "delete":
+                    os.remove(output_path)
+                    result.output_paths.remove(output_path)
+                    result.dropped_paths.append(output_path)
+                    if self.manifest is not None:
+                        fmt = os.path.splitext(output_path)[1].lstrip(".")
+                        source_hash = source_hash or await self._source_hash(result.input_path)
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.manifest.record_dropped, result.input_path, output_path,
+                            *self._avif_webp_params(fmt), source_hash
+                        )
+                    notes.append(f"已删除{reason}")
+                else:
+                    notes.append(reason)
+        except OSError as e:
+            notes.append(f"体积检查失败: {str(e)}")
+        if notes:
+            result.message += f"（{'；'.join(notes)}）"
+        result.timings["write"] = result.timings.get("write", 0.0) + time.perf_counter() - started
+
+    async def _optimizt_units(
+        self, paths, duplicates: Optional[dedup.DuplicateIndex] = None
+    ) -> AsyncIterator[Union[ProcessResult, List[tuple], str]]:
+        """把待处理文件按输出格式分组切块
+
+        每组的块大小从1开始倍增到optimizt_chunk_size，第一批文件可以立即开始编码，
+        小批量时也能拆成多个块并行；同时限制单条命令的长度，避免超过Windows命令行上限。
+        已是最新的文件直接产出跳过结果。与之前的文件内容相同的文件最后单独产出路径，
+        此时它等待的文件都已经开始处理。
+        """
+        loop = asyncio.get_running_loop()
+        groups = {}
+        followers = []
+
+        async for input_path in _aiter(paths):
+            oversized = self._oversized(input_path, await loop.run_in_executor(None, read_image_size, input_path))
+            if oversized is not None:
+                yield oversized
+                continue
+            webp_path, avif_path, need_webp, need_avif = await loop.run_in_executor(
+                None, self._avif_webp_targets, input_path
+            )
+            if not need_webp and not need_avif:
+                yield self._avif_webp_skipped(input_path, webp_path, avif_path)
+                continue
+            if duplicates is not None and await duplicates.find(input_path) is not None:
+                followers.append(input_path)
+                continue
+
+            group = groups.setdefault((need_webp, need_avif), {"jobs": [], "size": 1, "length": 0})
+            if group["jobs"] and group["length"] + len(input_path) > OPTIMIZT_MAX_COMMAND_LENGTH:
+                yield group["jobs"]
+                group["jobs"], group["length"] = [], 0
+            group["jobs"].append((input_path, webp_path, avif_path, need_webp, need_avif))
+            group["length"] += len(input_path) + 3
+            if len(group["jobs"]) >= group["size"]:
+                yield group["jobs"]
+                group["jobs"], group["length"] = [], 0
+                group["size"] = min(group["size"] * 2, self.optimizt_chunk_size)
+
+        for group in groups.values():
+            if group["jobs"]:
+                yield group["jobs"]
+        for input_path in followers:
+            yield input_path
+
+    def _chunk_memory(self, chunk: List[tuple]) -> int:
+        """一组optimizt文件的内存估算之和"""
+        return sum(
+            self._estimate_memory(job[0], read_image_size(job[0]), ProcessType.AVIF_WEBP) for job in chunk
+        )
+
+    async def _run_optimizt_chunk(self, chunk: List[tuple]) -> List[ProcessResult]:
+        """一次optimizt调用处理一组文件，再把输出对应回每个文件"""
+        _, _, _, need_webp, need_avif = chunk[0]
+        cmd = [self._optimizt_path, "--force"]
+        if need_webp:
+            cmd.append("--webp")
+        if need_avif:
+            cmd.append("--avif")
+        cmd.extend(job[0] for job in chunk)
+
+        started_ns = time.time_ns()
+        started = time.perf_counter()
+        targets = []
+        for _, webp_path, avif_path, _, _ in chunk:
+            targets += ([webp_path] if need_webp else []) + ([avif_path] if need_avif else [])
+        timeout = self.job_timeout * len(chunk) if self.job_timeout else None
+        chunk_timings = {}
+        try:
+            # 返回码非0时部分文件可能已经成功，不删除输出，下面逐个文件核对
+            _, error = await self._run_encoder(cmd, targets, timeout, cleanup_on_error=False, timings=chunk_timings)
+        except Exception as e:
+            error = f"处理出错: {str(e)}"
+        if error:
+            return [
+                ProcessResult(
+                    success=False,
+                    message=error,
+                    input_path=job[0],
+                    output_paths=[]
+                )
+                for job in chunk
+            ]
+
+        def fresh(path):
+            return _written_since(path, started_ns)
+
+        # 一次调用的启动和编码耗时平均分摊到每个文件
+        shared_timings = {key: value / len(chunk) for key, value in chunk_timings.items()}
+        results = []
+        for input_path, webp_path, avif_path, _, _ in chunk:
+            timings = dict(shared_timings)
+            output_paths = []
+            if need_webp and fresh(webp_path):
+                output_paths.append(webp_path)
+            if need_avif and fresh(avif_path):
+                output_paths.append(avif_path)
+            # 即使整体返回码非0，已经生成全部输出的文件仍视为成功
+            if len(output_paths) == int(need_webp) + int(need_avif):
+                await self._record_outputs(input_path, output_paths, "optimizt", OPTIMIZT_PARAMS, timings)
+                results.append(ProcessResult(
+                    success=True,
+                    message="处理成功",
+                    input_path=input_path,
+                    output_paths=output_paths,
+                    timings=timings
+                ))
+            else:
+                results.append(ProcessResult(
+                    success=False,
+                    message="处理失败",
+                    input_path=input_path,
+                    output_paths=output_paths,
+                    timings=timings
+                ))
+        for result in results:
+            await self._enforce_output_budget(result)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            result.timings["total"] = elapsed / len(chunk)
+            self._measure_bytes(result, ProcessType.AVIF_WEBP)
+            self._log_result(result, ProcessType.AVIF_WEBP)
+        await self._record_throughput(
+            ProcessType.AVIF_WEBP,
+            [result.input_path for result in results if result.success],
+            elapsed
+        )
+        return results
+
+    async def process_avif_webp_batch(
+        self,
+        paths: Union[Iterable[str], AsyncIterator[str]],
+        progress_callback=None,
+        should_stop=None,
+        start_callback=None,
+        duplicates: Optional[dedup.DuplicateIndex] = None
+    ) -> List[ProcessResult]:
+        """批量处理avif/webp，每个optimizt进程处理一组文件以分摊Node.js的启动开销"""
+        if not self._optimizt_path:
+            results = []
+            async for path in _aiter(paths):
+                result = ProcessResult(success=False, message="optimizt未安装", input_path=path, output_paths=[])
+                results.append(result)
+                if progress_callback:
+                    await maybe_await(progress_callback(result))
+            return results
+
+        results = []
+
+        async def run_unit(unit):
+            if isinstance(unit, ProcessResult):
+                return [unit]
+            if isinstance(unit, str):
+                # 内容与之前的文件相同：复用其输出，不能复用时单独编码
+                return [await self.process_file(unit, ProcessType.AVIF_WEBP, duplicates)]
+            chunk_results = []
+            try:
+                # 一个optimizt进程同时持有这一组文件的像素数据，按整组的估算预留内存
+                nbytes = await asyncio.get_running_loop().run_in_executor(None, self._chunk_memory, unit)
+                waiting = time.perf_counter()
+                async with self.memory_budget.reserve(nbytes):
+                    memory_wait = time.perf_counter() - waiting
+                    chunk_results = await self._run_optimizt_chunk(unit)
+                for result in chunk_results:
+                    result.timings["memory_wait"] = memory_wait
+                return chunk_results
+            finally:
+                if duplicates is not None:
+                    by_path = {result.input_path: result for result in chunk_results}
+                    for job in unit:
+                        duplicates.publish(job[0], by_path.get(job[0]))
+
+        async def on_unit_start(unit):
+            if start_callback and isinstance(unit, str):
+                await maybe_await(start_callback(unit))
+            elif start_callback and not isinstance(unit, ProcessResult):
+                for job in unit:
+                    await maybe_await(start_callback(job[0]))
+
+        async def on_unit_done(unit_results):
+            for result in unit_results:
+                results.append(result)
+                if progress_callback:
+                    await maybe_await(progress_callback(result))
+
+        await self.scheduler.run(
+            self._optimizt_units(paths, duplicates),
+            run_unit,
+            progress_callback=on_unit_done,
+            should_stop=should_stop,
+            start_callback=on_unit_start,
+            wait_callback=_set_queue_wait
+        )
+        return results
+
+    @staticmethod
+    def _srcset_params(width: int, fmt: str) -> dict:
+        return {"width": width, "format": fmt, "quality": pillow_engine.SRCSET_QUALITY[fmt]}
+
+    def _srcset_targets(self, input_path: str, is_current=None) -> List[Tuple[str, dict, bool]]:
+        """返回srcset的(输出路径, 编码参数, 是否需要重新生成)，宽度大于源图片的不生成"""
+        size = read_image_size(input_path)
+        widths = pillow_engine.variant_widths(size[0], self.srcset_widths) if size else self.srcset_widths
+        if is_current is None:
+            is_current = lambda path, params: self._is_output_current(input_path, path, SRCSET_BACKEND, params)
+        targets = []
+        for width in widths:
+            for fmt in self.srcset_formats:
+                path = pillow_engine.variant_path(input_path, width, fmt)
+                params = self._srcset_params(width, fmt)
+                targets.append((path, params, not is_current(path, params)))
+        return targets
+
+    @staticmethod
+    def _srcset_skip_reason(targets: List[Tuple[str, dict, bool]]) -> Optional[str]:
+        if not targets:
+            return "源图片小于所有目标宽度"
+        if not any(need for _, _, need in targets):
+            return "srcset已是最新"
+        return None
+
+    async def process_srcset(self, input_path: str) -> ProcessResult:
+        """生成srcset所需的多个宽度和格式，源图片只解码一次"""
+        if not pillow_engine.is_available() or not self.srcset_formats:
+            return ProcessResult(
+                success=False,
+                message="Pillow未安装或不支持webp/avif",
+                input_path=input_path,
                 output_paths=[]
             )
 
-    def should_process_file(self, filepath: str) -> bool:
-        """检查文件是否需要处理"""
+        timings = {}
+        needed = set()
+        temp_tag = _temp_tag()
+        try:
+            loop = asyncio.get_running_loop()
+            targets = await loop.run_in_executor(None, self._srcset_targets, input_path)
+            if not targets:
+                return ProcessResult(
+                    success=True,
+                    message="源图片小于所有目标宽度，跳过处理",
+                    input_path=input_path,
+                    output_paths=[],
+                    skipped=True
+                )
+            needed = {path for path, _, need in targets if need}
+            if not needed:
+                return ProcessResult(
+                    success=True,
+                    message="文件已是最新，跳过处理",
+                    input_path=input_path,
+                    output_paths=[path for path, _, _ in targets],
+                    skipped=True
+                )
+
+            output_paths = await asyncio.wait_for(
+                self.executor.run(
+                    pillow_engine.make_variants, input_path,
+                    self.srcset_widths, self.srcset_formats, needed, self.max_pixels, temp_tag, timings=timings
+                ),
+                self.job_timeout
+            )
+            params = {path: params for path, params, _ in targets}
+            for output_path in output_paths:
+                await self._record_outputs(input_path, [output_path], SRCSET_BACKEND, params[output_path], timings)
+            return ProcessResult(
+                success=True,
+                message="处理成功",
+                input_path=input_path,
+                output_paths=output_paths,
+                timings=timings
+            )
+        except asyncio.CancelledError:
+            pillow_engine.remove_temp_files(needed, temp_tag)
+            raise
+        except asyncio.TimeoutError:
+            pillow_engine.remove_temp_files(needed, temp_tag)
+            return ProcessResult(
+                success=False,
+                message=f"处理超时: 超过 {self.job_timeout:g} 秒未完成",
+                input_path=input_path,
+                output_paths=[],
+                timings=timings
+            )
+        except Exception as e:
+            return ProcessResult(
+                success=False,
+                message=f"处理出错: {str(e)}",
+                input_path=input_path,
+                output_paths=[],
+                timings=timings
+            )
+
+    def selection_skip_reason(self, filepath: str, process_type: ProcessType) -> Optional[str]:
+        """手动选择的文件的排除规则，返回跳过原因，需要处理时返回None"""
+        # 获取文件名（不含扩展名）和扩展名
+        filename = os.path.splitext(os.path.basename(filepath))[0]
+        ext = os.path.splitext(filepath)[1].lower()
+        
+        # 1. 跳过webp和avif格式（两种处理类型都适用）
+        if ext in ['.webp', '.avif']:
+            return "webp/avif格式"
+            
+        # 根据处理类型应用不同的排除规则
+        if process_type == ProcessType.THUMBNAIL:
+            # 2. 跳过index和banner文件（精确匹配）
+            if filename in ['index', 'banner']:
+                return "index/banner文件"
+                
+            # 3. 跳过以_proc结尾的文件
+            if filename.endswith('_proc'):
+                return "缩略图文件"
+                
+        return None
+
+    def output_skip_reason(self, filepath: str, process_type: ProcessType) -> Optional[str]:
+        """文件处理时是否会因为输出已是最新而跳过，返回跳过原因"""
+        if process_type == ProcessType.THUMBNAIL:
+            # 没有清单时缩略图总是重新生成
+            backend = self._resolve_thumbnail_backend()
+            if backend and self.manifest is not None and self.manifest.is_up_to_date(
+                filepath, f"{os.path.splitext(filepath)[0]}_proc.jpg", backend, THUMBNAIL_PARAMS[backend]
+            ):
+                return "缩略图已是最新"
+            return None
+
+        if process_type == ProcessType.SRCSET:
+            return self._srcset_skip_reason(self._srcset_targets(filepath))
+
+        _, _, need_webp, need_avif = self._avif_webp_targets(filepath)
+        if not need_webp and not need_avif:
+            return "webp/avif已是最新"
+        return None
+
+    def directory_skip_reason(
+        self,
+        filepath: str,
+        process_type: ProcessType = ProcessType.THUMBNAIL,
+        sibling_names: Optional[Set[str]] = None
+    ) -> Optional[str]:
+        """目录处理的排除规则，返回跳过原因，需要处理时返回None
+
+        sibling_names为同目录下的文件名集合（经os.path.normcase处理），
+        提供时在不使用清单的情况下直接查集合，不再逐个stat输出文件。
+        """
         filename = os.path.basename(filepath).lower()
+        if filename.endswith("_proc.jpg"):
+            return "缩略图文件"
         skip_keywords = ["banner", "index", "proc"]
         if any(keyword in filename for keyword in skip_keywords):
-            return False
+            return "文件名包含banner/index/proc"
         
+        def is_current(output_path, backend, params):
+            if self.manifest is None or backend is None:
+                if sibling_names is not None:
+                    return os.path.normcase(os.path.basename(output_path)) in sibling_names
+                return os.path.exists(output_path)
+            return self.manifest.is_up_to_date(filepath, output_path, backend, params, self._drops_outputs)
+
         filename_without_ext = os.path.splitext(filepath)[0]
-        processed_file = f"{filename_without_ext}_proc.jpg"
-        
-        return not os.path.exists(processed_file)
+        if process_type == ProcessType.THUMBNAIL:
+            backend = self._resolve_thumbnail_backend()
+            # 缩略图已是最新但占位图清单中还没有记录时仍交给process_thumbnail补充
+            if (is_current(f"{filename_without_ext}_proc.jpg", backend, THUMBNAIL_PARAMS.get(backend))
+                    and (self.lqip_manifest is None or self.lqip_manifest.has(filepath))):
+                return "缩略图已是最新"
+            return None
+
+        if process_type == ProcessType.SRCSET:
+            targets = self._srcset_targets(
+                filepath, lambda path, params: is_current(path, SRCSET_BACKEND, params)
+            )
+            return self._srcset_skip_reason(targets)
+
+        if (is_current(f"{filename_without_ext}.webp", *self._avif_webp_params("webp"))
+                and is_current(f"{filename_without_ext}.avif", *self._avif_webp_params("avif"))):
+            return "webp/avif已是最新"
+        return None
+
+    def should_process_file(self, filepath: str, process_type: ProcessType = ProcessType.THUMBNAIL) -> bool:
+        """检查文件是否需要处理"""
+        return self.directory_skip_reason(filepath, process_type) is None
+
+    def scan_directory(self, directory: str, process_type: ProcessType) -> Iterator[str]:
+        """枚举目录中需要处理的文件"""
+        for path, reason in self.iter_directory(directory, process_type):
+            if reason is None:
+                yield path
+
+    def iter_directory(self, directory: str, process_type: ProcessType) -> Iterator[Tuple[str, Optional[str]]]:
+        """用os.scandir逐层枚举目录中的图片，同一遍中应用排除规则，产出(路径, 跳过原因)
+
+        每个目录只读取一次，输出文件是否存在通过同目录文件名集合判断，
+        当前目录的文件先于子目录产出，保证第一批任务尽快开始。
+        """
+        pending = deque([directory])
+        while pending:
+            current = pending.popleft()
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError:
+                continue  # 与os.walk一致，忽略无法读取的目录
+            names = {os.path.normcase(entry.name) for entry in entries}
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                except OSError:
+                    continue
+                if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                yield entry.path, self.directory_skip_reason(entry.path, process_type, names)
+
+    def throughput_key(self, process_type: ProcessType) -> str:
+        """吞吐量历史的分类键：处理类型和实际使用的后端"""
+        if process_type == ProcessType.THUMBNAIL:
+            return f"{process_type.value}:{self._resolve_thumbnail_backend()}"
+        if process_type == ProcessType.SRCSET:
+            return f"{process_type.value}:pillow"
+        if self.quality_target is not None:
+            # 搜索画质要编码多次，耗时单独统计
+            return f"{process_type.value}:pillow-{self.quality_target.mode}"
+        return f"{process_type.value}:{self._resolve_avif_webp_backend()}"
+
+    async def _record_throughput(self, process_type: ProcessType, input_paths: List[str], seconds: float):
+        """按源图片像素数记录耗时"""
+        if self.throughput is None or not input_paths:
+            return
+
+        def megapixels():
+            total = 0
+            for path in input_paths:
+                size = read_image_size(path)
+                if size:
+                    total += size[0] * size[1]
+            return total / 1_000_000
+
+        loop = asyncio.get_running_loop()
+        self.throughput.record(
+            self.throughput_key(process_type),
+            await loop.run_in_executor(None, megapixels),
+            seconds
+        )
+
+    def _oversized(self, input_path: str, size: Optional[Tuple[int, int]]) -> Optional[ProcessResult]:
+        """文件头中的尺寸超过上限时返回失败结果（解压炸弹），此时还没有分配任何像素内存"""
+        if size is None or not self.max_pixels or size[0] * size[1] <= self.max_pixels:
+            return None
+        return ProcessResult(
+            success=False,
+            message=f"图片尺寸过大: {size[0]}x{size[1]}，超过 {self.max_pixels / 1_000_000:g} 百万像素的上限",
+            input_path=input_path,
+            output_paths=[]
+        )
+
+    @staticmethod
+    def _estimate_memory(input_path: str, size: Optional[Tuple[int, int]], process_type: ProcessType) -> int:
+        """按源图片尺寸估算解码和编码需要的内存（字节）"""
+        if size is None:
+            return 0
+        pixels = size[0] * size[1]
+        if process_type == ProcessType.THUMBNAIL and input_path.lower().endswith(JPEG_EXTENSIONS):
+            # 缩略图的JPEG以缩小的分辨率解码
+            pixels //= pillow_engine.draft_scale(size[0], pillow_engine.THUMBNAIL_WIDTH) ** 2
+        return pixels * DECODE_BYTES_PER_PIXEL[process_type.value]
+
+    async def process_file(
+        self,
+        input_path: str,
+        process_type: ProcessType,
+        duplicates: Optional[dedup.DuplicateIndex] = None,
+        checked: bool = False
+    ) -> ProcessResult:
+        """按处理类型处理单个文件，传入duplicates时内容相同的文件复用先处理的那个的输出
+
+        checked为True表示文件已按directory_skip_reason检查过输出是否最新。
+        """
+        started = time.perf_counter()
+        size = await asyncio.get_running_loop().run_in_executor(None, read_image_size, input_path)
+        result = self._oversized(input_path, size)
+        if result is not None:
+            self._log_result(result, process_type)
+            return result
+        try:
+            leader = await duplicates.find(input_path) if duplicates is not None else None
+            if leader is not None:
+                result = await self._reuse_duplicate(input_path, leader, process_type, duplicates)
+            if result is None:
+                waiting = time.perf_counter()
+                async with self.memory_budget.reserve(self._estimate_memory(input_path, size, process_type)):
+                    memory_wait = time.perf_counter() - waiting
+                    if process_type == ProcessType.THUMBNAIL:
+                        result = await self.process_thumbnail(input_path, checked)
+                    elif process_type == ProcessType.SRCSET:
+                        result = await self.process_srcset(input_path)
+                    else:
+                        result = await self.process_avif_webp(input_path)
+                        await self._enforce_output_budget(result)
+                result.timings["memory_wait"] = memory_wait
+            elapsed = time.perf_counter() - started
+            result.timings["total"] = elapsed
+            self._measure_bytes(result, process_type)
+            self._log_result(result, process_type)
+        finally:
+            # 等待这个文件的重复文件在出错或被取消时收到None，改为自己处理
+            if duplicates is not None:
+                duplicates.publish(input_path, result)
+        if result.success and not result.skipped and result.duplicate_of is None:
+            await self._record_throughput(process_type, [input_path], elapsed)
+        return result
+
+    def _expected_outputs(self, input_path: str, process_type: ProcessType) -> List[str]:
+        """处理类型对应的全部输出路径"""
+        base_path = os.path.splitext(input_path)[0]
+        if process_type == ProcessType.THUMBNAIL:
+            return [f"{base_path}_proc.jpg"]
+        if process_type == ProcessType.SRCSET:
+            return [path for path, _, _ in self._srcset_targets(input_path, is_current=lambda path, params: True)]
+        return [f"{base_path}.webp", f"{base_path}.avif"]
+
+    def _copy_duplicate_outputs(
+        self, leader: str, input_path: str, process_type: ProcessType, source_hash: str
+    ) -> Optional[Tuple[List[str], List[str]]]:
+        """把leader的输出链接或复制为input_path的输出，返回(输出, 已删除的输出)，缺少输出时返回None"""
+        leader_base = os.path.splitext(leader)[0]
+        base_path = os.path.splitext(input_path)[0]
+        pairs = []
+        for leader_output in self._expected_outputs(leader, process_type):
+            output_path = base_path + leader_output[len(leader_base):]
+            if os.path.exists(leader_output):
+                pairs.append((leader_output, output_path, False))
+            elif self.manifest is not None and self.manifest.is_dropped(leader_output):
+                pairs.append((leader_output, output_path, True))
+            else:
+                return None
+        output_paths, dropped_paths = [], []
+        for leader_output, output_path, dropped in pairs:
+            if dropped:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                dropped_paths.append(output_path)
+            else:
+                dedup.materialize(leader_output, output_path)
+                output_paths.append(output_path)
+            if self.manifest is not None:
+                self.manifest.record_duplicate(input_path, output_path, leader_output, source_hash)
+        return output_paths, dropped_paths
+
+    async def _reuse_duplicate(
+        self, input_path: str, leader: str, process_type: ProcessType, duplicates: dedup.DuplicateIndex
+    ) -> Optional[ProcessResult]:
+        """等内容相同的leader处理完成后复用其输出，不能复用时返回None（照常处理）"""
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.output_skip_reason, input_path, process_type):
+            return None
+        leader_result = await duplicates.result_of(leader)
+        if leader_result is None or not leader_result.success:
+            return None
+        started = time.perf_counter()
+        try:
+            source_hash = await duplicates.digest(input_path)
+            copied = await loop.run_in_executor(
+                None, self._copy_duplicate_outputs, leader, input_path, process_type, source_hash
+            )
+        except OSError as e:
+            logging.warning(f"复用 {leader} 的输出失败: {e}")
+            return None
+        if copied is None:
+            return None
+        output_paths, dropped_paths = copied
+        result = ProcessResult(
+            success=True,
+            message=f"与 {os.path.basename(leader)} 内容相同，复用其输出",
+            input_path=input_path,
+            output_paths=output_paths,
+            timings={"write": time.perf_counter() - started},
+            dropped_paths=dropped_paths,
+            duplicate_of=leader
+        )
+        result.saved_seconds = await self._encode_seconds(input_path, leader_result, process_type)
+        if process_type == ProcessType.THUMBNAIL:
+            await self._add_placeholder(result)
+        elif process_type == ProcessType.AVIF_WEBP:
+            await self._enforce_output_budget(result)
+        return result
+
+    async def _encode_seconds(self, input_path: str, leader_result: ProcessResult, process_type: ProcessType) -> float:
+        """复用输出省下的编码耗时：leader本次解码、编码和写出的耗时（不含排队和等待资源），
+        leader已是最新时按吞吐量历史估算"""
+        if not leader_result.skipped:
+            return sum(leader_result.timings.get(stage, 0.0) for stage in ("decode", "encode", "write"))
+        if self.throughput is None:
+            return 0.0
+        rate = self.throughput.seconds_per_megapixel(self.throughput_key(process_type))
+        size = await asyncio.get_running_loop().run_in_executor(None, read_image_size, input_path)
+        if not rate or not size:
+            return 0.0
+        return rate * size[0] * size[1] / 1_000_000
+
+    def _log_result(self, result: ProcessResult, process_type: ProcessType):
+        """每个任务一条日志，JSON格式时耗时和大小作为单独字段输出"""
+        level = logging.DEBUG if result.success else logging.WARNING
+        logging.log(
+            level, "%s %s: %s", process_type.value, result.input_path, result.message,
+            extra={
+                "job_id": next(self._job_ids),
+                "process_type": process_type.value,
+                "input_path": result.input_path,
+                "success": result.success,
+                "timings": dict(result.timings),
+                "input_bytes": result.input_bytes,
+                "output_bytes": result.output_bytes,
+            }
+        )
+
+    @staticmethod
+    def _output_kind(output_path: str, process_type: ProcessType) -> str:
+        """运行统计中输出的类型"""
+        if process_type == ProcessType.THUMBNAIL:
+            return "thumbnail"
+        fmt = os.path.splitext(output_path)[1].lstrip(".").lower()
+        return f"srcset-{fmt}" if process_type == ProcessType.SRCSET else fmt
+
+    @classmethod
+    def _measure_bytes(cls, result: ProcessResult, process_type: ProcessType):
+        """记录实际处理的文件的输入大小（源文件被无损改写时为改写前的大小），以及本次写出的输出的大小"""
+        if not result.success or result.skipped:
+            return
+        result.input_bytes = _file_size(result.input_path) + result.source_saved_bytes
+        result.kind_bytes = {}
+        for path in result.output_paths:
+            kind = cls._output_kind(path, process_type)
+            result.kind_bytes[kind] = result.kind_bytes.get(kind, 0) + _file_size(path)
+        result.output_bytes = sum(result.kind_bytes.values())
+
+    async def process_files(
+        self,
+        paths: Union[Iterable[str], AsyncIterator[str]],
+        process_type: ProcessType,
+        progress_callback=None,
+        should_stop=None,
+        start_callback=None,
+        run_id: Optional[int] = None,
+        directory: Optional[str] = None,
+        checked: bool = False
+    ) -> List[ProcessResult]:
+        """并发处理文件列表（或异步产出的文件流），结果按完成顺序推送给progress_callback
+
+        使用任务日志时run_id为要继续的运行编号，为None时登记新的运行。
+        directory为文件流枚举的目录，登记在新的运行中，中断后恢复时重新扫描。
+        checked为True表示调用方已按directory_skip_reason过滤过，处理时不再重复检查缩略图是否最新。
+        文件列表按job_order排列，异步文件流由调用方决定顺序。
+        """
+        if not hasattr(paths, "__aiter__") and self.job_order != "fifo":
+            paths = await asyncio.get_running_loop().run_in_executor(None, order_paths, list(paths), self.job_order)
+        if self.journal is not None:
+            if run_id is None:
+                run_id = self.journal.start_run(process_type.value, directory)
+            paths, progress_callback, start_callback = self._journaled(
+                run_id, paths, progress_callback, start_callback
+            )
+        completed = False
+        duplicates = dedup.DuplicateIndex() if self.deduplicate else None
+
+        def error_result(file_path, e):
+            # 如果处理单个文件失败，创建一个失败的结果
+            return ProcessResult(
+                success=False,
+                message=f"处理出错: {str(e)}",
+                input_path=file_path,
+                output_paths=[]
+            )
+
+        try:
+            if (process_type == ProcessType.AVIF_WEBP and self.optimizt_chunk_size > 1
+                    and self._resolve_avif_webp_backend() != "pillow"):
+                results = await self.process_avif_webp_batch(
+                    paths,
+                    progress_callback=progress_callback,
+                    should_stop=should_stop,
+                    start_callback=start_callback,
+                    duplicates=duplicates
+                )
+                completed = not self.scheduler.cancelled and not (should_stop and should_stop())
+                return results
+
+            results = await self.scheduler.run(
+                paths,
+                lambda path: self.process_file(path, process_type, duplicates, checked),
+                progress_callback=progress_callback,
+                should_stop=should_stop,
+                start_callback=start_callback,
+                error_factory=error_result,
+                wait_callback=_set_queue_wait
+            )
+            completed = not self.scheduler.cancelled and not (should_stop and should_stop())
+            return results
+        finally:
+            if self.journal is not None:
+                # 被停止、取消或出错时保留未完成的记录，下次可以继续
+                if completed:
+                    self.journal.finish_run(run_id)
+                else:
+                    self.journal.flush()
+            if self.throughput is not None:
+                self.throughput.save()
+            if self.lqip_manifest is not None:
+                self.lqip_manifest.save()
+            if self.quality_memo is not None:
+                self.quality_memo.save()
+
+    def _journaled(self, run_id: int, paths, progress_callback, start_callback):
+        """在排队、开始和完成时写入任务日志"""
+        journal = self.journal
+        if hasattr(paths, "__aiter__"):
+            async def queued_paths():
+                async for path in paths:
+                    journal.queued(run_id, path)
+                    yield path
+                # 提前停止时不会执行到这里，运行保持未扫描完
+                journal.mark_scanned(run_id)
+            journaled_paths = queued_paths()
+        else:
+            # 文件列表在开始前整批登记，中途崩溃时尚未领取的文件也能恢复
+            journaled_paths = list(paths)
+            journal.queued_many(run_id, journaled_paths)
+
+        async def on_start(path):
+            journal.started(run_id, path)
+            if start_callback:
+                await maybe_await(start_callback(path))
+
+        async def on_result(result):
+            journal.finished(run_id, result.input_path, result.success, result.message)
+            if progress_callback:
+                await maybe_await(progress_callback(result))
+
+        return journaled_paths, on_result, on_start
+
+    async def resume(self, run_id: int, progress_callback=None, should_stop=None, start_callback=None):
+        """继续任务日志中没有完成的运行，返回(处理类型, 结果列表)"""
+        loop = asyncio.get_running_loop()
+        runs = await loop.run_in_executor(None, self.journal.unfinished_runs)
+        run = next((run for run in runs if run.run_id == run_id), None)
+        # 另一个进程已经开始继续这次运行时不重复处理
+        if run is None or not self.journal.claim(run_id):
+            return None, []
+        process_type = ProcessType(run.process_type)
+        paths = await loop.run_in_executor(None, self.journal.pending_paths, run_id)
+        # 源文件已被删除的记录直接跳过
+        paths = [path for path in paths if os.path.exists(path)]
+        if not run.scanned and os.path.isdir(run.directory):
+            paths = await self._resumed_directory(run, process_type, paths)
+        results = await self.process_files(
+            paths,
+            process_type,
+            progress_callback=progress_callback,
+            should_stop=should_stop,
+            start_callback=start_callback,
+            run_id=run_id
+        )
+        return process_type, results
+
+    async def _resumed_directory(self, run, process_type: ProcessType, pending: List[str]) -> AsyncIterator[str]:
+        """没有扫描完的目录运行：先处理日志中未完成的文件，再重新扫描目录处理中断时还没枚举到的文件
+
+        已完成或已失败的文件不再处理，其余已是最新的文件由清单跳过。
+        """
+        settled = await asyncio.get_running_loop().run_in_executor(None, self.journal.settled_paths, run.run_id)
+        seen = set(settled) | set(pending)
+
+        def scan():
+            for path, reason in self.iter_directory(run.directory, process_type):
+                if reason is None and os.path.abspath(path) not in seen:
+                    yield path
+
+        async def paths():
+            for path in pending:
+                yield path
+            stream = order_stream(iterate_in_thread(scan), self.job_order)
+            try:
+                async for path in stream:
+                    yield path
+            finally:
+                await stream.aclose()
+
+        return paths()
 
     async def process_directory(
         self,
         directory: str,
         process_type: ProcessType,
-        progress_callback=None
+        progress_callback=None,
+        should_stop=None,
+        start_callback=None,
+        discover_callback=None
     ) -> List[ProcessResult]:
-        """异步处理整个目录"""
+        """异步处理整个目录
+
+        discover_callback(路径, 跳过原因)在枚举线程中对每个找到的图片调用，需要处理时原因为None。
+        """
         results = []
+
+        def scan():
+            for path, reason in self.iter_directory(directory, process_type):
+                if discover_callback:
+                    discover_callback(path, reason)
+                if reason is None:
+                    yield path
+
         try:
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                        file_path = os.path.join(root, file)
-                        if self.should_process_file(file_path):
-                            try:
-                                if process_type == ProcessType.THUMBNAIL:
-                                    result = await self.process_thumbnail(file_path)
-                                else:
-                                    result = await self.process_avif_webp(file_path)
-                                    
-                                if result:  # 确保结果不为None
-                                    results.append(result)
-                                    if progress_callback:
-                                        await progress_callback(result)
-                            except Exception as e:
-                                # 如果处理单个文件失败，创建一个失败的结果
-                                error_result = ProcessResult(
-                                    success=False,
-                                    message=f"处理出错: {str(e)}",
-                                    input_path=file_path,
-                                    output_paths=[]
-                                )
-                                results.append(error_result)
-                                if progress_callback:
-                                    await progress_callback(error_result)
-                                
+            # 后台线程枚举目录，worker同时消费，不必等整个目录树扫描完；
+            # 在一个有限的窗口内按job_order挑选下一个文件
+            file_paths = order_stream(iterate_in_thread(scan), self.job_order)
+            results = await self.process_files(
+                file_paths,
+                process_type,
+                progress_callback=progress_callback,
+                should_stop=should_stop,
+                start_callback=start_callback,
+                directory=directory,
+                checked=True
+            )
         except Exception as e:
             # 如果整个目录处理过程出错，返回一个错误结果
             error_result = ProcessResult(
@@ -315,6 +1734,6 @@ class ImageProcessor:
             )
             results.append(error_result)
             if progress_callback:
-                await progress_callback(error_result)
+                await maybe_await(progress_callback(error_result))
                 
-        return results 
\ No newline at end of file
+        return results
@@ -0,0 +1,74 @@
+"""
+按估算耗时排列任务
+
+编码耗时大致与像素数成正比。混合批次里几张超大PNG排在最后时，其他worker
+早已空闲，只剩一个worker在处理大图。这里只读取文件头得到像素数作为耗时估计
+（读不出尺寸时用文件大小代替），按以下方式之一排列：
+
+    largest-first   耗时长的先做（LPT），总耗时最短，默认
+    smallest-first  小图先做，界面上的进度最快出现
+    fifo            保持原来的顺序
+
+目录是边枚举边处理的，无法预先排序，只在一个有限的窗口内按同样的规则挑选下一个任务。
+窗口从1开始逐渐扩大，第一个任务不必等待读取更多文件头就能开始。
+"""
+import os
+import heapq
+import asyncio
+import itertools
+from typing import AsyncIterator, List
+
+from src.core.image_info import read_image_size
+
+JOB_ORDERS = ("largest-first", "smallest-first", "fifo")
+# 目录流排序窗口的上限，窗口越大排序越接近全局
+STREAM_WINDOW = 64
+
+
+def job_cost(path: str) -> int:
+    """任务的相对耗时：文件头中的像素数，读不出尺寸时用文件大小"""
+    size = read_image_size(path)
+    if size:
+        return size[0] * size[1]
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def order_paths(paths: List[str], order: str) -> List[str]:
+    """按指定方式排列文件列表（稳定排序，耗时相同的保持原来的顺序）"""
+    if order == "fifo":
+        return list(paths)
+    costs = {path: job_cost(path) for path in paths}
+    return sorted(paths, key=costs.__getitem__, reverse=order == "largest-first")
+
+
+async def order_stream(paths: AsyncIterator[str], order: str, window: int = STREAM_WINDOW) -> AsyncIterator[str]:
+    """在已枚举的文件中按指定方式挑选下一个
+
+    窗口从1开始，每交出一个文件翻倍，直到window：第一个文件读完文件头就交出，
+    之后worker忙于处理已交出的文件时再逐渐扩大挑选的范围。
+    """
+    loop = asyncio.get_running_loop()
+    sign = -1 if order == "largest-first" else 1
+    # 序号保证耗时相同时先到先出
+    counter = itertools.count()
+    heap = []
+    current = 1
+    try:
+        async for path in paths:
+            if order == "fifo":
+                yield path
+                continue
+            cost = await loop.run_in_executor(None, job_cost, path)
+            heapq.heappush(heap, (sign * cost, next(counter), path))
+            if len(heap) >= current:
+                yield heapq.heappop(heap)[2]
+                current = min(current * 2, window)
+        while heap:
+            yield heapq.heappop(heap)[2]
+    finally:
+        # 提前结束时让上游（如枚举线程）也随之停止
+        if hasattr(paths, "aclose"):
+            await paths.aclose()
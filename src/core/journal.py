@@ -0,0 +1,304 @@
+"""
+可恢复的任务日志
+
+每次批处理记为一次运行，每个文件在排队、开始和完成时写入一条状态。
+程序被关闭或崩溃后，下次启动时可以只处理没有完成的文件，已完成的文件
+不会再检查输出。状态先缓存在内存中，按条数或时间间隔批量写入SQLite（WAL模式），
+不会给每个文件增加一次磁盘提交（没有新状态时由定时器写入）；崩溃时最多丢失最后一个间隔内的状态，
+这些文件会在恢复时重新处理，已是最新的输出仍会被清单跳过。
+
+正在处理某次运行的进程持有该运行的锁文件，进程退出（包括崩溃）时锁由系统释放；
+其他进程只会看到并恢复没有被锁住的运行，不会与仍在运行的进程重复处理。
+
+处理目录时文件是边枚举边登记的，中断时还没枚举到的文件不在日志中。这类运行记录目录路径，
+枚举完成后才标记为已扫描；没有扫描完的运行在恢复时重新扫描目录（已是最新的输出由清单跳过）。
+"""
+import os
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows使用msvcrt加锁
+    fcntl = None
+    import msvcrt
+
+from src.utils.helpers import get_app_data_dir
+
+JOURNAL_FILENAME = "journal.sqlite3"
+# 缓存的状态达到这么多条或距上次写入超过这么多秒时写入数据库
+FLUSH_BATCH = 200
+FLUSH_INTERVAL = 0.5
+# 保留的已完成运行记录数
+KEEP_FINISHED_RUNS = 50
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _try_lock(fd: int) -> bool:
+    """非阻塞地锁住文件，已被其他进程锁住时返回False"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd: int):
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+
+
+def default_journal_path() -> str:
+    """默认的任务日志文件路径"""
+    return os.path.join(get_app_data_dir(), JOURNAL_FILENAME)
+
+
+@dataclass
+class JournalRun:
+    run_id: int
+    process_type: str
+    created_at: float
+    total: int
+    pending: int
+    # 处理的目录，文件列表为None
+    directory: Optional[str] = None
+    # 目录是否已枚举完，没有时恢复需要重新扫描
+    scanned: bool = True
+
+
+class JobJournal:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_journal_path()
+        self._lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._last_flush = time.monotonic()
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        # 本进程正在处理的运行 -> 锁文件描述符
+        self._owned: Dict[int, int] = {}
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                process_type TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                run_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                state TEXT NOT NULL,
+                message TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, path)
+            );
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(runs)")}
+        # 旧版本的日志没有目录字段
+        if "directory" not in columns:
+            self._conn.execute("ALTER TABLE runs ADD COLUMN directory TEXT")
+        if "scanned" not in columns:
+            self._conn.execute("ALTER TABLE runs ADD COLUMN scanned INTEGER NOT NULL DEFAULT 1")
+        self._conn.commit()
+
+    def close(self):
+        """写入剩余状态，释放本进程持有的运行（下次可以继续）并关闭数据库连接"""
+        self.flush()
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._conn.close()
+        for run_id in list(self._owned):
+            self.release(run_id)
+
+    def _lock_path(self, run_id: int) -> str:
+        return f"{self.path}.run{run_id}.lock"
+
+    def claim(self, run_id: int) -> bool:
+        """由本进程处理这次运行，运行正在另一个进程中处理时返回False"""
+        if run_id in self._owned:
+            return True
+        fd = os.open(self._lock_path(run_id), os.O_RDWR | os.O_CREAT)
+        if not _try_lock(fd):
+            os.close(fd)
+            return False
+        self._owned[run_id] = fd
+        return True
+
+    def release(self, run_id: int):
+        """不再处理这次运行，其他进程可以继续它"""
+        fd = self._owned.pop(run_id, None)
+        if fd is not None:
+            _unlock(fd)
+            os.close(fd)
+
+    def _is_live(self, run_id: int) -> bool:
+        """运行是否正在本进程或其他进程中处理"""
+        if run_id in self._owned:
+            return True
+        if not os.path.exists(self._lock_path(run_id)):
+            return False
+        if not self.claim(run_id):
+            return True
+        self.release(run_id)
+        return False
+
+    def start_run(self, process_type: str, directory: Optional[str] = None) -> int:
+        """登记一次新的运行并由本进程持有，返回运行编号
+
+        处理目录时传入directory，枚举完成后须调用mark_scanned。
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (process_type, created_at, directory, scanned) VALUES (?, ?, ?, ?)",
+                (process_type, time.time(), directory and os.path.abspath(directory), int(directory is None))
+            )
+            self._conn.commit()
+            run_id = cursor.lastrowid
+        self.claim(run_id)
+        return run_id
+
+    def _append(self, run_id: int, path: str, state: str, message: Optional[str] = None):
+        with self._lock:
+            self._pending.append((run_id, os.path.abspath(path), state, message, time.time()))
+            due = len(self._pending) >= FLUSH_BATCH or time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+            if not due and self._timer is None:
+                # 之后没有新状态时也要在间隔内写入，长时间编码期间崩溃不会丢失已完成的记录
+                self._timer = threading.Timer(FLUSH_INTERVAL, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+            if self._closed:
+                return
+        self.flush()
+
+    def queued(self, run_id: int, path: str):
+        self._append(run_id, path, QUEUED)
+
+    def queued_many(self, run_id: int, paths: List[str]):
+        """一次登记整批文件"""
+        now = time.time()
+        with self._lock:
+            self._pending.extend((run_id, os.path.abspath(path), QUEUED, None, now) for path in paths)
+        self.flush()
+
+    def started(self, run_id: int, path: str):
+        self._append(run_id, path, RUNNING)
+
+    def finished(self, run_id: int, path: str, success: bool, message: Optional[str] = None):
+        self._append(run_id, path, DONE if success else FAILED, message)
+
+    def mark_scanned(self, run_id: int):
+        """目录已全部枚举，所有文件都已登记"""
+        self.flush()
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute("UPDATE runs SET scanned = 1 WHERE run_id = ?", (run_id,))
+            self._conn.commit()
+
+    def flush(self):
+        """把缓存的状态在一个事务中写入数据库"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not rows or self._closed:
+                return
+            self._conn.executemany(
+                "INSERT INTO jobs (run_id, path, state, message, updated_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(run_id, path) DO UPDATE SET"
+                " state = excluded.state, message = excluded.message, updated_at = excluded.updated_at",
+                rows
+            )
+            self._conn.commit()
+
+    def finish_run(self, run_id: int):
+        """运行全部完成：删除逐个文件的记录，只保留最近的运行摘要"""
+        self.flush()
+        self.release(run_id)
+        try:
+            os.remove(self._lock_path(run_id))
+        except OSError:
+            pass
+        with self._lock:
+            self._conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+            self._conn.execute(
+                "DELETE FROM runs WHERE finished_at IS NOT NULL AND run_id NOT IN"
+                " (SELECT run_id FROM runs WHERE finished_at IS NOT NULL ORDER BY run_id DESC LIMIT ?)",
+                (KEEP_FINISHED_RUNS,)
+            )
+            self._conn.commit()
+
+    def unfinished_runs(self) -> List[JournalRun]:
+        """没有完成、且还有文件未处理（或目录没有扫描完）的运行，按时间先后排列；
+        正在某个进程中处理的运行不返回"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT runs.run_id, runs.process_type, runs.created_at, COUNT(jobs.path),"
+                " COALESCE(SUM(jobs.state IN (?, ?)), 0), runs.directory, runs.scanned"
+                " FROM runs LEFT JOIN jobs ON jobs.run_id = runs.run_id"
+                " WHERE runs.finished_at IS NULL GROUP BY runs.run_id ORDER BY runs.run_id",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        runs = [
+            JournalRun(run_id, process_type, created_at, total, pending, directory, bool(scanned))
+            for run_id, process_type, created_at, total, pending, directory, scanned in rows
+            if not self._is_live(run_id)
+        ]
+        # 所有文件都已完成、只是没来得及登记结束的运行直接结束
+        for run in runs:
+            if not run.pending and run.scanned:
+                self.finish_run(run.run_id)
+        return [run for run in runs if run.pending or not run.scanned]
+
+    def pending_paths(self, run_id: int) -> List[str]:
+        """运行中还没有完成的文件（排队中或处理到一半），已完成和已失败的不再返回"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM jobs WHERE run_id = ? AND state IN (?, ?) ORDER BY rowid",
+                (run_id, QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def settled_paths(self, run_id: int) -> List[str]:
+        """运行中已完成或已失败的文件"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM jobs WHERE run_id = ? AND state IN (?, ?)", (run_id, DONE, FAILED)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def discard_run(self, run_id: int):
+        """放弃恢复"""
+        self.finish_run(run_id)
@@ -0,0 +1,193 @@
+"""
+低质量占位图（LQIP）清单
+
+生成缩略图的同时计算每张图片的原始尺寸、缩略图的base64 data URI、主色调和BlurHash，
+汇总到一个JSON文件中，博客页面可以直接内联占位图，不必再单独请求_proc.jpg。
+主色调和BlurHash用NumPy向量化计算，NumPy未安装时主色调退化为平均色，不生成BlurHash。
+"""
+import os
+import json
+import time
+import base64
+import logging
+from typing import Dict, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy是可选依赖
+    np = None
+
+from src.core import pillow_engine
+from src.core.pillow_engine import Image
+
+MANIFEST_VERSION = 1
+# 界面中选择清单文件时的默认文件名
+MANIFEST_FILENAME = "lqip.json"
+# BlurHash的分量数（横向×纵向）
+BLURHASH_COMPONENTS = (4, 3)
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _encode83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = min(1.0, max(0.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(pixels, components: Tuple[int, int] = BLURHASH_COMPONENTS) -> str:
+    """计算BlurHash，pixels为(高, 宽, 3)的uint8数组"""
+    x_components, y_components = components
+    height, width = pixels.shape[:2]
+    srgb = pixels[..., :3].astype(np.float64) / 255
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+
+    # 每个分量的余弦基函数，一次矩阵乘法得到全部分量
+    basis_x = np.cos(np.pi * np.arange(x_components)[:, None] * np.arange(width)[None, :] / width)
+    basis_y = np.cos(np.pi * np.arange(y_components)[:, None] * np.arange(height)[None, :] / height)
+    factors = np.einsum("jy,ix,yxc->jic", basis_y, basis_x, linear) / (width * height)
+    normalisation = np.full((y_components, x_components), 2.0)
+    normalisation[0, 0] = 1.0
+    factors = (factors * normalisation[..., None]).reshape(-1, 3)
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum = (quantised_max + 1) / 166
+    else:
+        quantised_max, maximum = 0, 1.0
+    result += _encode83(quantised_max, 1)
+    r, g, b = (_linear_to_srgb(value) for value in dc)
+    result += _encode83((r << 16) + (g << 8) + b, 4)
+
+    scaled = ac / maximum
+    quantised = np.clip(np.floor(np.sign(scaled) * np.abs(scaled) ** 0.5 * 9 + 9.5), 0, 18).astype(int)
+    for qr, qg, qb in quantised:
+        result += _encode83(int(qr) * 19 * 19 + int(qg) * 19 + int(qb), 2)
+    return result
+
+
+def dominant_color(pixels) -> str:
+    """主色调：按每通道4位量化后出现最多的颜色，取该组像素的平均值"""
+    flat = pixels[..., :3].reshape(-1, 3)
+    quantised = flat >> 4
+    keys = (quantised[:, 0].astype(np.int32) << 8) | (quantised[:, 1].astype(np.int32) << 4) | quantised[:, 2]
+    top = np.bincount(keys, minlength=4096).argmax()
+    r, g, b = flat[keys == top].mean(axis=0).round().astype(int)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _average_color(thumb) -> str:
+    r, g, b = thumb.convert("RGB").resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _entry(source_size: Tuple[int, int], thumb, thumb_data: bytes) -> dict:
+    data = base64.b64encode(thumb_data).decode("ascii")
+    entry = {
+        "width": source_size[0],
+        "height": source_size[1],
+        "placeholder": f"data:image/jpeg;base64,{data}",
+    }
+    if np is not None:
+        pixels = np.asarray(thumb.convert("RGB"))
+        entry["color"] = dominant_color(pixels)
+        entry["blurhash"] = blurhash(pixels)
+    else:
+        entry["color"] = _average_color(thumb)
+        entry["blurhash"] = None
+    return entry
+
+
+def make_thumbnail_with_placeholder(
+    input_path: str,
+    output_path: str,
+    width: int = pillow_engine.THUMBNAIL_WIDTH,
+    quality: int = pillow_engine.THUMBNAIL_QUALITY,
+    max_pixels: Optional[int] = pillow_engine.MAX_IMAGE_PIXELS,
+    temp_tag: str = "",
+    timings: Optional[Dict[str, float]] = None
+) -> dict:
+    """生成缩略图，同时返回占位图信息，源图片只解码一次"""
+    started = time.perf_counter()
+    with pillow_engine.open_image(input_path, max_pixels) as img:
+        source_size = img.size
+        thumb = pillow_engine.thumbnail_image(img, width)
+    decoded = time.perf_counter()
+    data = pillow_engine.encode_thumbnail(thumb, quality)
+    encoded = time.perf_counter()
+    pillow_engine.write_atomic(data, output_path, temp_tag)
+    if timings is not None:
+        timings["decode"] = decoded - started
+        timings["encode"] = encoded - decoded
+        timings["write"] = time.perf_counter() - encoded
+    return _entry(source_size, thumb, data)
+
+
+def placeholder_from_file(
+    input_path: str,
+    thumb_path: str,
+    max_pixels: Optional[int] = pillow_engine.MAX_IMAGE_PIXELS,
+    timings: Optional[Dict[str, float]] = None
+) -> dict:
+    """根据已有的缩略图计算占位图信息（ffmpeg后端或缩略图已是最新时）"""
+    with pillow_engine.open_image(input_path, max_pixels) as img:
+        source_size = img.size  # 只读取文件头
+    with Image.open(thumb_path) as thumb:
+        thumb.load()
+        with open(thumb_path, "rb") as f:
+            return _entry(source_size, thumb, f.read())
+
+
+class LqipManifest:
+    """占位图清单，键为相对于清单所在目录的路径（使用/分隔）"""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(self.path)
+        self.entries: Dict[str, dict] = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("images", {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def key(self, image_path: str) -> str:
+        image_path = os.path.abspath(image_path)
+        try:
+            relative = os.path.relpath(image_path, self.root)
+        except ValueError:  # Windows上不在同一个盘符
+            return image_path.replace(os.sep, "/")
+        if relative.startswith(".."):
+            return image_path.replace(os.sep, "/")
+        return relative.replace(os.sep, "/")
+
+    def has(self, image_path: str) -> bool:
+        return self.key(image_path) in self.entries
+
+    def add(self, image_path: str, entry: dict):
+        self.entries[self.key(image_path)] = entry
+        self._dirty = True
+
+    def save(self):
+        """有变化时写入文件"""
+        if not self._dirty:
+            return
+        data = {"version": MANIFEST_VERSION, "images": dict(sorted(self.entries.items()))}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"保存占位图清单失败: {e}")
+            return
+        self._dirty = False
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from typing import Optional
+
+from src.utils.helpers import get_app_data_dir
+
+MANIFEST_FILENAME = "manifest.sqlite3"
+HASH_CHUNK_SIZE = 1024 * 1024
+# 按大小和修改时间缓存的源文件哈希数量
+HASH_CACHE_ENTRIES = 1024
+# 输出因不比源文件小而被删除时记录的大小
+DROPPED_SIZE = -1
+
+
+def default_manifest_path() -> str:
+    """默认的清单文件路径"""
+    return os.path.join(get_app_data_dir(), MANIFEST_FILENAME)
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容哈希"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=HASH_CACHE_ENTRIES)
+def _cached_hash(path: str, size: int, mtime_ns: int) -> str:
+    return hash_file(path)
+
+
+def hash_source(path: str) -> str:
+    """计算源文件内容哈希，大小和修改时间不变时复用上次的结果
+
+    一个源文件在一次处理中会被登记多个输出、查询画质记忆和查重，只需读一遍。
+    """
+    stat = os.stat(path)
+    return _cached_hash(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _normalize(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _encode_params(params: Optional[dict]) -> str:
+    return json.dumps(params or {}, sort_keys=True, ensure_ascii=False)
+
+
+class BuildManifest:
+    """增量构建清单
+
+    为每个输出文件记录源文件的大小、修改时间、内容哈希以及生成它的后端和参数。
+    判断是否最新时先比较大小和修改时间，只有两者不一致时才重新计算哈希。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_manifest_path()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outputs (
+                output_path TEXT PRIMARY KEY,
+                source_path TEXT NOT NULL,
+                source_size INTEGER NOT NULL,
+                source_mtime_ns INTEGER NOT NULL,
+                source_hash TEXT,
+                backend TEXT NOT NULL,
+                params TEXT NOT NULL,
+                output_size INTEGER NOT NULL,
+                output_mtime_ns INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _get(self, output_path: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT source_path, source_size, source_mtime_ns, source_hash, backend, params,"
+                " output_size, output_mtime_ns FROM outputs WHERE output_path = ?",
+                (_normalize(output_path),)
+            ).fetchone()
+
+    def _put(self, output_path: str, source_path: str, source_stat, source_hash: Optional[str],
+             backend: str, params: Optional[dict], output_stat):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _normalize(output_path),
+                    _normalize(source_path),
+                    source_stat.st_size,
+                    source_stat.st_mtime_ns,
+                    source_hash,
+                    backend,
+                    _encode_params(params),
+                    DROPPED_SIZE if output_stat is None else output_stat.st_size,
+                    DROPPED_SIZE if output_stat is None else output_stat.st_mtime_ns,
+                    time.time()
+                )
+            )
+            self._conn.commit()
+
+    def is_up_to_date(self, source_path: str, output_path: str, backend: str,
+                      params: Optional[dict] = None, allow_dropped: bool = False) -> bool:
+        """检查输出文件相对源文件和编码参数是否为最新
+
+        allow_dropped为True时，登记为已删除的输出在源文件和参数不变时也视为最新。
+        """
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return False
+        try:
+            output_stat = os.stat(output_path)
+        except OSError:
+            output_stat = None
+
+        row = self._get(output_path)
+        if output_stat is None:
+            if not allow_dropped or row is None or row[6] != DROPPED_SIZE:
+                return False
+        elif row is None:
+            # 没有记录但输出已存在且不比源文件旧（例如启用清单之前生成的文件），
+            # 直接登记为最新，避免首次运行时全部重新生成
+            if output_stat.st_mtime_ns >= source_stat.st_mtime_ns:
+                self._put(output_path, source_path, source_stat, None, backend, params, output_stat)
+                return True
+            return False
+
+        (rec_source, rec_size, rec_mtime, rec_hash, rec_backend, rec_params,
+         rec_output_size, rec_output_mtime) = row
+        if rec_source != _normalize(source_path):
+            return False
+        if rec_backend != backend or rec_params != _encode_params(params):
+            return False
+        # 输出被手动替换或修改过
+        if output_stat is not None and (
+            output_stat.st_size != rec_output_size or output_stat.st_mtime_ns != rec_output_mtime
+        ):
+            return False
+        if source_stat.st_size != rec_size:
+            return False
+        if source_stat.st_mtime_ns == rec_mtime:
+            return True
+
+        # 大小相同但修改时间变了，用内容哈希确认是否真的改动
+        if rec_hash is None:
+            return False
+        source_hash = hash_file(source_path)
+        if source_hash != rec_hash:
+            return False
+        self._put(output_path, source_path, source_stat, source_hash, backend, params, output_stat)
+        return True
+
+    def record(self, source_path: str, output_path: str, backend: str,
+               params: Optional[dict] = None, source_hash: Optional[str] = None):
+        """登记新生成的输出文件，source_hash为调用方已算好的源文件哈希"""
+        try:
+            source_stat = os.stat(source_path)
+            output_stat = os.stat(output_path)
+            source_hash = source_hash or hash_file(source_path)
+        except OSError:
+            return
+        self._put(output_path, source_path, source_stat, source_hash, backend, params, output_stat)
+
+    def record_dropped(self, source_path: str, output_path: str, backend: str,
+                       params: Optional[dict] = None, source_hash: Optional[str] = None):
+        """登记因不比源文件小而删除的输出，源文件和参数不变时不再重新生成"""
+        try:
+            source_stat = os.stat(source_path)
+            source_hash = source_hash or hash_file(source_path)
+        except OSError:
+            return
+        self._put(output_path, source_path, source_stat, source_hash, backend, params, None)
+
+    def is_dropped(self, output_path: str) -> bool:
+        """输出是否登记为因不比源文件小而删除"""
+        row = self._get(output_path)
+        return row is not None and row[6] == DROPPED_SIZE
+
+    def record_duplicate(self, source_path: str, output_path: str, reference_path: str,
+                         source_hash: Optional[str] = None):
+        """内容相同的源文件复用输出时，沿用参考输出记录中的后端和参数登记"""
+        row = self._get(reference_path)
+        if row is None:
+            return
+        try:
+            source_stat = os.stat(source_path)
+            output_stat = None if row[6] == DROPPED_SIZE else os.stat(output_path)
+        except OSError:
+            return
+        self._put(output_path, source_path, source_stat, source_hash or row[3], row[4], json.loads(row[5]),
+                  output_stat)
+
+    def refresh_source(self, source_path: str, previous_stat, previous_hash: Optional[str]):
+        """源文件被无损改写（像素不变）后，把对应改写前内容的记录更新为新的大小、修改时间和哈希
+
+        这些输出仍然有效，不更新时下次会因源文件变化而全部重新生成。
+        """
+        try:
+            source_stat = os.stat(source_path)
+            source_hash = hash_file(source_path)
+        except OSError:
+            return
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outputs SET source_size = ?, source_mtime_ns = ?, source_hash = ?, updated_at = ?"
+                " WHERE source_path = ? AND ((source_size = ? AND source_mtime_ns = ?) OR source_hash = ?)",
+                (
+                    source_stat.st_size, source_stat.st_mtime_ns, source_hash, time.time(),
+                    _normalize(source_path), previous_stat.st_size, previous_stat.st_mtime_ns, previous_hash
+                )
+            )
+            self._conn.commit()
+
+    def forget(self, output_path: str):
+        """删除输出文件的记录"""
+        with self._lock:
+            self._conn.execute("DELETE FROM outputs WHERE output_path = ?", (_normalize(output_path),))
+            self._conn.commit()
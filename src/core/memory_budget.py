@@ -0,0 +1,88 @@
+"""
+解码内存预算
+
+并发数按CPU核心数设置，但几张四千万像素的大图同时解码就可能耗尽构建机的内存。
+每个任务开始前按文件头中的尺寸估算解码需要的内存并从预算中预留，预算不足时
+等待其他任务释放；小图几乎不受影响，大图则自动降低并发。
+单个任务超过整个预算时，只要没有其他任务占用就允许运行，不会永远等待。
+"""
+import os
+import sys
+import asyncio
+import ctypes
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# 无法获取物理内存时使用的预算
+FALLBACK_BUDGET_BYTES = 2 * 1024 ** 3
+# 默认预算占物理内存的比例
+PHYSICAL_MEMORY_FRACTION = 0.5
+
+
+def physical_memory() -> Optional[int]:
+    """物理内存字节数，无法获取时返回None"""
+    if sys.platform == "win32":
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullTotalPhys
+        return None
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_budget() -> int:
+    """默认预算：物理内存的一半"""
+    total = physical_memory()
+    if not total:
+        return FALLBACK_BUDGET_BYTES
+    return int(total * PHYSICAL_MEMORY_FRACTION)
+
+
+class MemoryBudget:
+    """按字节数预留的异步信号量"""
+
+    def __init__(self, limit_bytes: Optional[int] = None):
+        self.limit = limit_bytes if limit_bytes is not None else default_budget()
+        self.used = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio的同步原语绑定事件循环，换了事件循环（如多次asyncio.run）时重新创建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.used = 0
+        return self._condition
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        """预留nbytes字节，退出时释放"""
+        nbytes = max(0, nbytes)
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.used == 0 or self.used + nbytes <= self.limit)
+            self.used += nbytes
+        try:
+            yield
+        finally:
+            async with condition:
+                self.used -= nbytes
+                condition.notify_all()
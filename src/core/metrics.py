@@ -0,0 +1,204 @@
+"""
+运行统计
+
+汇总一次批处理中每个文件的耗时和大小，得到吞吐量、延迟分位数和节省的空间，
+并保存为JSON，方便对比不同版本之间的性能变化。
+"""
+import os
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.core.image_processor import ProcessResult
+from src.utils.helpers import format_file_size, get_app_data_dir
+
+RUNS_DIRNAME = "runs"
+STAGES = ("queue_wait", "memory_wait", "pool_wait", "spawn", "decode", "encode", "write")
+# 与源文件分辨率相同、可以代替源文件的输出，只有这些计算节省的空间；
+# source为无损压缩改写后的源文件。缩略图和srcset宽度是另外的尺寸，只统计输出大小
+SAME_RESOLUTION_KINDS = ("webp", "avif", "source")
+
+
+def default_summary_path() -> str:
+    """按时间命名的统计文件路径，保存在用户数据目录的runs子目录中"""
+    name = time.strftime("%Y%m%d-%H%M%S") + ".json"
+    return os.path.join(get_app_data_dir(), RUNS_DIRNAME, name)
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+@dataclass
+class KindBytes:
+    """一类输出的文件数和输出总大小；分辨率与源文件相同的输出还统计对应源文件的总大小"""
+    files: int = 0
+    input_bytes: int = 0
+    output_bytes: int = 0
+    same_resolution: bool = False
+
+    @property
+    def saved(self) -> Optional[int]:
+        """源文件与输出总大小之差，负数表示输出更大；缩略图等不同尺寸的输出为None"""
+        if not self.same_resolution:
+            return None
+        return self.input_bytes - self.output_bytes
+
+
+@dataclass
+class RunSummary:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    wall_seconds: float = 0.0
+    # 只统计实际处理成功的文件，同一源文件被多种处理类型处理时只计一次
+    input_bytes: int = 0
+    output_bytes: int = 0
+    # 每个源文件与可以代替它的最小输出（webp、avif或改写后的源文件）之差的总和
+    bytes_saved: int = 0
+    latency_p50: Optional[float] = None
+    latency_p95: Optional[float] = None
+    latency_max: Optional[float] = None
+    # 按输出类型统计，只比较本次写出了该类输出的源文件
+    savings: Dict[str, KindBytes] = field(default_factory=dict)
+    # 各阶段耗时之和
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    # 复用了内容相同的源文件输出的文件数，以及省下的编码耗时
+    deduplicated: int = 0
+    dedup_saved_seconds: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded - self.skipped
+
+    @property
+    def files_per_second(self) -> Optional[float]:
+        if self.wall_seconds <= 0:
+            return None
+        return self.processed / self.wall_seconds
+
+    @property
+    def mb_per_second(self) -> Optional[float]:
+        if self.wall_seconds <= 0:
+            return None
+        return self.input_bytes / 1_000_000 / self.wall_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "wall_seconds": self.wall_seconds,
+            "files_per_second": self.files_per_second,
+            "mb_per_second": self.mb_per_second,
+            "latency_p50": self.latency_p50,
+            "latency_p95": self.latency_p95,
+            "latency_max": self.latency_max,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "bytes_saved": self.bytes_saved,
+            "savings": {
+                name: {"files": kind.files, "input_bytes": kind.input_bytes,
+                       "output_bytes": kind.output_bytes, "bytes_saved": kind.saved}
+                for name, kind in self.savings.items()
+            },
+            "stage_seconds": self.stage_seconds,
+            "deduplicated": self.deduplicated,
+            "dedup_saved_seconds": self.dedup_saved_seconds,
+        }
+
+    def format_lines(self) -> List[str]:
+        """界面和命令行显示用的摘要"""
+        lines = [f"共 {self.total} 个文件: {self.processed} 处理, {self.skipped} 跳过, {self.failed} 失败，"
+                 f"耗时 {self.wall_seconds:.1f} 秒"]
+        if self.processed:
+            lines.append(f"吞吐量: {self.files_per_second:.2f} 文件/秒, {self.mb_per_second:.2f} MB/秒")
+            lines.append(f"单文件耗时: p50 {self.latency_p50:.2f} 秒, p95 {self.latency_p95:.2f} 秒, "
+                         f"最长 {self.latency_max:.2f} 秒")
+            for name, kind in sorted(self.savings.items()):
+                if kind.saved is None:
+                    lines.append(f"{name}: {kind.files} 个, 输出 {format_file_size(kind.output_bytes)}")
+                    continue
+                sign = "" if kind.saved >= 0 else "-"
+                lines.append(f"{name}: {kind.files} 个, 源文件 {format_file_size(kind.input_bytes)}, "
+                             f"输出 {format_file_size(kind.output_bytes)}, 节省 {sign}{format_file_size(abs(kind.saved))}")
+            if any(kind.same_resolution for kind in self.savings.values()):
+                sign = "" if self.bytes_saved >= 0 else "-"
+                lines.append(f"按每个源文件最小的同尺寸输出计算，共节省 {sign}{format_file_size(abs(self.bytes_saved))}")
+            stages = [f"{stage} {seconds:.1f}" for stage, seconds in self.stage_seconds.items() if seconds >= 0.05]
+            if stages:
+                lines.append(f"各阶段耗时（秒，所有文件之和）: {', '.join(stages)}")
+        if self.deduplicated:
+            lines.append(f"重复图片: {self.deduplicated} 个复用了内容相同的图片的输出，"
+                         f"节省编码约 {self.dedup_saved_seconds:.1f} 秒")
+        return lines
+
+    def write_json(self, path: Optional[str] = None) -> str:
+        """保存为JSON，返回文件路径"""
+        path = path or default_summary_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+def _add_kinds(summary: RunSummary, result: ProcessResult):
+    """按输出类型累计大小，返回可以代替源文件的输出中最小的大小（没有时为None）"""
+    sizes = dict(result.kind_bytes)
+    if result.source_saved_bytes:
+        sizes["source"] = result.input_bytes - result.source_saved_bytes
+    smallest = None
+    for name, size in sizes.items():
+        same_resolution = name in SAME_RESOLUTION_KINDS
+        kind = summary.savings.setdefault(name, KindBytes(same_resolution=same_resolution))
+        kind.files += 1
+        kind.output_bytes += size
+        if same_resolution:
+            kind.input_bytes += result.input_bytes
+            smallest = size if smallest is None else min(smallest, size)
+    return smallest
+
+
+def summarize(results: List[ProcessResult], wall_seconds: float) -> RunSummary:
+    """汇总一次运行的结果"""
+    summary = RunSummary(total=len(results), wall_seconds=wall_seconds)
+    sources = set()
+    latencies = []
+    stage_seconds = {stage: 0.0 for stage in STAGES}
+    for result in results:
+        if not result.success:
+            summary.failed += 1
+            continue
+        summary.succeeded += 1
+        if result.skipped:
+            summary.skipped += 1
+            continue
+        if result.duplicate_of is not None:
+            summary.deduplicated += 1
+            summary.dedup_saved_seconds += result.saved_seconds
+        if result.input_path not in sources:
+            sources.add(result.input_path)
+            summary.input_bytes += result.input_bytes
+        summary.output_bytes += result.output_bytes
+        smallest = _add_kinds(summary, result)
+        if smallest is not None:
+            summary.bytes_saved += result.input_bytes - smallest
+        if "total" in result.timings:
+            latencies.append(result.timings["total"])
+        for stage in STAGES:
+            stage_seconds[stage] += result.timings.get(stage, 0.0)
+    summary.latency_p50 = _percentile(latencies, 50)
+    summary.latency_p95 = _percentile(latencies, 95)
+    summary.latency_max = max(latencies) if latencies else None
+    summary.stage_seconds = stage_seconds
+    return summary
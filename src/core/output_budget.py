@@ -0,0 +1,118 @@
+"""
+webp/avif输出的体积检查和源文件的无损压缩
+
+已经优化过的PNG/JPEG转成webp/avif后有时反而更大，<picture>中列出这样的
+source会让浏览器下载更多字节。编码完成后把每个新输出与源文件以及另一种
+格式比较，没有比源文件小到指定比例、或者比<picture>中排在后面的格式更大的
+输出会被删除（或只在结果中标记）。
+
+可选地在比较之前对源文件做无损压缩：PNG用Pillow以optimize重新压缩，
+校验像素一致后才替换；JPEG使用jpegtran优化霍夫曼表并转为渐进式。
+"""
+import io
+import os
+import time
+from typing import Dict, List, Optional
+
+from src.core.pillow_engine import MAX_IMAGE_PIXELS, encode_image, open_image, write_atomic
+
+try:
+    from PIL import PngImagePlugin
+except ImportError:
+    PngImagePlugin = None
+
+BUDGET_ACTIONS = ("delete", "flag")
+# <picture>中source的顺序，排在前面的格式应当比后面的小
+PICTURE_ORDER = ("avif", "webp")
+
+
+def _size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def check_outputs(source_path: str, candidates: List[str], min_saving: float) -> Dict[str, str]:
+    """检查新生成的输出，返回 不合格的输出路径 -> 原因
+
+    与源文件比较时要求至少小min_saving（如0.05表示5%），
+    与同名的其他格式输出比较时要求排在<picture>前面的格式更小。
+    """
+    source_size = _size(source_path)
+    if not source_size:
+        return {}
+    base_path = os.path.splitext(source_path)[0]
+    sizes = {}
+    for fmt in PICTURE_ORDER:
+        size = _size(f"{base_path}.{fmt}")
+        if size is not None:
+            sizes[fmt] = size
+
+    rejected = {}
+    for path in candidates:
+        fmt = os.path.splitext(path)[1].lstrip(".").lower()
+        size = sizes.get(fmt)
+        if size is None:
+            continue
+        saving = 1 - size / source_size
+        if saving >= min_saving:
+            continue
+        if saving > 0:
+            rejected[path] = f"{os.path.basename(path)}只比源文件小{saving:.0%}"
+        else:
+            rejected[path] = f"{os.path.basename(path)}比源文件大{-saving:.0%}"
+    for index, fmt in enumerate(PICTURE_ORDER):
+        path = f"{base_path}.{fmt}"
+        if path not in candidates or path in rejected:
+            continue
+        for later in PICTURE_ORDER[index + 1:]:
+            later_path = f"{base_path}.{later}"
+            if later in sizes and later_path not in rejected and sizes[fmt] >= sizes[later]:
+                rejected[path] = f"{os.path.basename(path)}不比{later}小"
+                break
+    return rejected
+
+
+def optimize_png(
+    path: str,
+    max_pixels: Optional[int] = MAX_IMAGE_PIXELS,
+    temp_tag: str = "",
+    timings: Optional[Dict[str, float]] = None
+) -> int:
+    """无损重新压缩PNG，像素不变且文件变小时才替换，返回节省的字节数"""
+    started = time.perf_counter()
+    original_size = os.path.getsize(path)
+    with open_image(path, max_pixels) as img:
+        img.load()
+        decoded = time.perf_counter()
+        params = {"optimize": True}
+        for key in ("transparency", "icc_profile", "exif", "dpi", "gamma"):
+            if key in img.info:
+                params[key] = img.info[key]
+        if getattr(img, "text", None):
+            pnginfo = PngImagePlugin.PngInfo()
+            for key, value in img.text.items():
+                pnginfo.add_text(key, value)
+            params["pnginfo"] = pnginfo
+        data = encode_image(img, "PNG", **params)
+        with open_image(io.BytesIO(data), max_pixels) as optimized:
+            same = (optimized.mode, optimized.size) == (img.mode, img.size)
+            if same:
+                same = optimized.tobytes() == img.tobytes() and optimized.getpalette() == img.getpalette()
+    encoded = time.perf_counter()
+    saved = original_size - len(data)
+    if same and saved > 0:
+        write_atomic(data, path, temp_tag)
+    else:
+        saved = 0
+    if timings is not None:
+        timings["decode"] = decoded - started
+        timings["encode"] = encoded - decoded
+        timings["write"] = time.perf_counter() - encoded
+    return saved
+
+
+def jpegtran_command(jpegtran_path: str, input_path: str, output_path: str) -> List[str]:
+    """保留全部元数据，优化霍夫曼表并转为渐进式（无损）"""
+    return [jpegtran_path, "-copy", "all", "-optimize", "-progressive", "-outfile", output_path, input_path]
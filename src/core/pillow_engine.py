@@ -0,0 +1,296 @@
+"""
+基于Pillow的进程内图片处理
+
+这里的函数都是模块级函数，参数和返回值只包含路径和数字，
+方便直接交给线程池或进程池执行。
+
+传入timings时分别记录解码和缩放（decode）、编码到内存（encode）和写文件（write）的耗时。
+输出先写同一目录下名称唯一的临时文件再替换，temp_tag为调用方给每个任务生成的标记，
+工作进程被终止后调用方按标记删除它留下的临时文件（见remove_temp_files）。
+"""
+import io
+import os
+import stat
+import time
+import tempfile
+import warnings
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow是可选依赖，缺失时回退到ffmpeg
+    Image = None
+
+try:
+    import pillow_avif  # noqa: F401  旧版Pillow通过这个插件支持AVIF
+except ImportError:
+    pass
+
+# 与ffmpeg路径的 "-q:v 2" 画质大致相当
+THUMBNAIL_QUALITY = 95
+THUMBNAIL_WIDTH = 17
+
+# srcset默认宽度和格式
+SRCSET_WIDTHS = (480, 960, 1600)
+SRCSET_FORMATS = ("webp", "avif")
+SRCSET_QUALITY = {"webp": 80, "avif": 60}
+_SAVE_FORMATS = {"webp": "WEBP", "avif": "AVIF"}
+
+# 整图转换webp/avif的默认参数：quality越高画质越好、文件越大；
+# webp的method为0~6，越大越慢压缩率越高，avif的speed为0~10，越大越快
+WEBP_QUALITY = 80
+WEBP_METHOD = 4
+AVIF_QUALITY = 60
+AVIF_SPEED = 6
+
+# JPEG解码时按1/2、1/4、1/8缩小（DCT缩放），保留目标尺寸的这么多倍再精确缩放
+DRAFT_OVERSAMPLE = 4
+MAX_DRAFT_SCALE = 8
+# 超过这个像素数的图片视为解压炸弹，不解码
+MAX_IMAGE_PIXELS = 200_000_000
+TEMP_SUFFIX = ".tmp"
+
+# mkstemp创建的文件只有所有者可以读写，替换前改为普通新建文件的权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def is_available() -> bool:
+    """检查Pillow是否可用"""
+    return Image is not None
+
+
+def open_image(fp, max_pixels: Optional[int] = MAX_IMAGE_PIXELS):
+    """打开图片，像素数超过max_pixels时Pillow抛出DecompressionBombError，None表示不检查
+
+    在执行任务的工作进程（或线程）中按处理器的上限设置Pillow的检查；处理前已按文件头检查过尺寸，
+    Pillow在上限一半以上时发出的警告只在这里忽略，不影响程序的其他部分。
+    """
+    # Pillow在超过MAX_IMAGE_PIXELS两倍时才报错
+    Image.MAX_IMAGE_PIXELS = (max_pixels + 1) // 2 if max_pixels else None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        return Image.open(fp)
+
+
+def supported_formats(formats: Iterable[str] = SRCSET_FORMATS) -> List[str]:
+    """返回当前Pillow能写出的格式"""
+    if Image is None:
+        return []
+    Image.init()
+    return [fmt for fmt in formats if _SAVE_FORMATS.get(fmt) in Image.SAVE]
+
+
+def encode_image(image, format: str, **params) -> bytes:
+    """编码到内存"""
+    buffer = io.BytesIO()
+    image.save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+def temp_prefix(output_path: str, temp_tag: str = "") -> str:
+    """输出的临时文件名前缀，mkstemp在其后加上随机字符"""
+    return f".{os.path.basename(output_path)}.{temp_tag}."
+
+
+def _file_mode(path: str) -> int:
+    """替换已有文件时沿用其权限"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def write_atomic(data: bytes, output_path: str, temp_tag: str = ""):
+    """先写临时文件再替换，中途失败或超时不会留下不完整的输出
+
+    临时文件名唯一，同一输出同时被多个进程写入（如被中断的运行遗留的工作进程）时互不影响。
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        suffix=TEMP_SUFFIX, prefix=temp_prefix(output_path, temp_tag), dir=os.path.dirname(output_path) or "."
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, _file_mode(output_path))
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def remove_temp_files(output_paths: Iterable[str], temp_tag: str):
+    """删除这些输出带有temp_tag的临时文件"""
+    for output_path in output_paths:
+        directory = os.path.dirname(output_path) or "."
+        prefix = temp_prefix(output_path, temp_tag)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if name.startswith(prefix) and name.endswith(TEMP_SUFFIX):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+
+def scaled_size(width: int, height: int, target_width: int) -> Tuple[int, int]:
+    """按宽度等比缩放，与ffmpeg的 scale=W:-1 取整方式一致"""
+    return target_width, max(1, round(height * target_width / width))
+
+
+def draft_scale(width: int, target_width: int) -> int:
+    """JPEG缩小解码的倍数（1、2、4、8），解码结果的宽度不小于目标的DRAFT_OVERSAMPLE倍"""
+    scale = 1
+    while scale < MAX_DRAFT_SCALE and width // (scale * 2) >= target_width * DRAFT_OVERSAMPLE:
+        scale *= 2
+    return scale
+
+
+def thumbnail_image(img, width: int = THUMBNAIL_WIDTH):
+    """按宽度缩放并转换为RGB，img须为尚未加载像素的图片"""
+    size = scaled_size(img.width, img.height, width)
+    # JPEG直接以缩小的分辨率解码，大图不必分配完整尺寸的缓冲区；其他格式不受影响
+    img.draft("RGB", (size[0] * DRAFT_OVERSAMPLE, size[1] * DRAFT_OVERSAMPLE))
+    # ffmpeg输出jpg时会直接丢弃alpha通道，这里保持一致
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img.resize(size, Image.Resampling.BICUBIC, reducing_gap=DRAFT_OVERSAMPLE)
+
+
+def encode_thumbnail(thumb, quality: int = THUMBNAIL_QUALITY) -> bytes:
+    return encode_image(thumb, "JPEG", quality=quality, subsampling="4:2:0")
+
+
+def make_thumbnail(
+    input_path: str,
+    output_path: str,
+    width: int = THUMBNAIL_WIDTH,
+    quality: int = THUMBNAIL_QUALITY,
+    max_pixels: Optional[int] = MAX_IMAGE_PIXELS,
+    temp_tag: str = "",
+    timings: Optional[Dict[str, float]] = None
+) -> Tuple[int, int]:
+    """生成缩略图，返回输出图片的尺寸"""
+    started = time.perf_counter()
+    with open_image(input_path, max_pixels) as img:
+        thumb = thumbnail_image(img, width)
+    decoded = time.perf_counter()
+    data = encode_thumbnail(thumb, quality)
+    encoded = time.perf_counter()
+    write_atomic(data, output_path, temp_tag)
+    if timings is not None:
+        timings["decode"] = decoded - started
+        timings["encode"] = encoded - decoded
+        timings["write"] = time.perf_counter() - encoded
+    return thumb.size
+
+
+def _to_rgb(img):
+    """转换为RGB，有alpha时为RGBA（webp和avif都支持透明度）"""
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    mode = "RGBA" if has_alpha else "RGB"
+    return img.convert(mode) if img.mode != mode else img.copy()
+
+
+def convert_formats(
+    input_path: str,
+    outputs: Dict[str, str],
+    params: Dict[str, dict],
+    max_pixels: Optional[int] = MAX_IMAGE_PIXELS,
+    temp_tag: str = "",
+    timings: Optional[Dict[str, float]] = None
+) -> List[str]:
+    """解码一次，按原尺寸写出多种格式，outputs为 格式 -> 输出路径，返回写出的文件"""
+    started = time.perf_counter()
+    with open_image(input_path, max_pixels) as img:
+        image = _to_rgb(img)
+    decode_seconds = time.perf_counter() - started
+    encode_seconds = 0.0
+    write_seconds = 0.0
+    written = []
+    for fmt, output_path in outputs.items():
+        started = time.perf_counter()
+        data = encode_image(image, _SAVE_FORMATS[fmt], **params.get(fmt, {}))
+        encoded = time.perf_counter()
+        write_atomic(data, output_path, temp_tag)
+        encode_seconds += encoded - started
+        write_seconds += time.perf_counter() - encoded
+        written.append(output_path)
+    if timings is not None:
+        timings["decode"] = decode_seconds
+        timings["encode"] = encode_seconds
+        timings["write"] = write_seconds
+    return written
+
+
+def variant_widths(source_width: int, widths: Iterable[int]) -> List[int]:
+    """从大到小排列的目标宽度，跳过大于源图片宽度的（不放大）"""
+    return sorted({width for width in widths if 0 < width <= source_width}, reverse=True)
+
+
+def variant_path(input_path: str, width: int, fmt: str) -> str:
+    """srcset输出路径，如 photo.png -> photo-960w.webp"""
+    return f"{os.path.splitext(input_path)[0]}-{width}w.{fmt}"
+
+
+def make_variants(
+    input_path: str,
+    widths: Iterable[int] = SRCSET_WIDTHS,
+    formats: Iterable[str] = SRCSET_FORMATS,
+    needed: Optional[Collection[str]] = None,
+    max_pixels: Optional[int] = MAX_IMAGE_PIXELS,
+    temp_tag: str = "",
+    timings: Optional[Dict[str, float]] = None
+) -> List[str]:
+    """只解码一次，从最大宽度逐级缩小，每个宽度写出所有格式，返回写出的文件
+
+    needed为需要写出的路径集合，为None时全部写出。
+    """
+    formats = list(formats)
+    resize_seconds = 0.0
+    encode_seconds = 0.0
+    write_seconds = 0.0
+    outputs = []
+    with open_image(input_path, max_pixels) as img:
+        source_size = img.size
+        targets = variant_widths(img.width, widths)
+        if not targets:
+            return outputs
+        started = time.perf_counter()
+        # 最大目标宽度的两倍仍小于原图时，JPEG以缩小的分辨率解码
+        img.draft(img.mode, scaled_size(source_size[0], source_size[1], targets[0] * 2))
+        current = _to_rgb(img)
+        resize_seconds += time.perf_counter() - started
+
+    for width in targets:
+        paths = {fmt: variant_path(input_path, width, fmt) for fmt in formats}
+        if needed is not None and not any(path in needed for path in paths.values()):
+            continue
+        started = time.perf_counter()
+        size = scaled_size(source_size[0], source_size[1], width)
+        if current.size != size:
+            # 在上一级的结果上继续缩小，越往后需要处理的像素越少
+            current = current.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        resize_seconds += time.perf_counter() - started
+
+        for fmt, path in paths.items():
+            if needed is not None and path not in needed:
+                continue
+            started = time.perf_counter()
+            data = encode_image(current, _SAVE_FORMATS[fmt], quality=SRCSET_QUALITY[fmt])
+            encoded = time.perf_counter()
+            write_atomic(data, path, temp_tag)
+            encode_seconds += encoded - started
+            write_seconds += time.perf_counter() - encoded
+            outputs.append(path)
+
+    if timings is not None:
+        timings["decode"] = resize_seconds
+        timings["encode"] = encode_seconds
+        timings["write"] = write_seconds
+    return outputs
@@ -0,0 +1,157 @@
+"""
+批处理计划（dry-run）
+
+在不处理任何文件的情况下，列出将要处理的文件、被跳过的文件及原因，
+并根据文件头中的尺寸和历史吞吐量估算耗时。
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.core.image_info import read_image_size
+from src.core.image_processor import ImageProcessor, ProcessType
+from src.core.throughput import ThroughputHistory
+
+
+@dataclass
+class PlannedJob:
+    path: str
+    size_bytes: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+    @property
+    def pixels(self) -> int:
+        if self.width is None or self.height is None:
+            return 0
+        return self.width * self.height
+
+
+@dataclass
+class SkippedFile:
+    path: str
+    reason: str
+
+
+@dataclass
+class BatchPlan:
+    process_type: ProcessType
+    concurrency: int
+    jobs: List[PlannedJob] = field(default_factory=list)
+    skipped: List[SkippedFile] = field(default_factory=list)
+    # 没有历史数据时为None
+    estimated_seconds: Optional[float] = None
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(job.size_bytes for job in self.jobs)
+
+    @property
+    def total_pixels(self) -> int:
+        return sum(job.pixels for job in self.jobs)
+
+    def skip_counts(self) -> Dict[str, int]:
+        """按原因统计跳过的文件数"""
+        counts: Dict[str, int] = {}
+        for item in self.skipped:
+            counts[item.reason] = counts.get(item.reason, 0) + 1
+        return counts
+
+    def to_dict(self) -> dict:
+        return {
+            "process_type": self.process_type.value,
+            "concurrency": self.concurrency,
+            "job_count": len(self.jobs),
+            "skipped_count": len(self.skipped),
+            "total_bytes": self.total_bytes,
+            "total_pixels": self.total_pixels,
+            "estimated_seconds": self.estimated_seconds,
+            "skip_counts": self.skip_counts(),
+            "jobs": [
+                {"path": job.path, "size_bytes": job.size_bytes, "width": job.width, "height": job.height}
+                for job in self.jobs
+            ],
+            "skipped": [{"path": item.path, "reason": item.reason} for item in self.skipped],
+        }
+
+
+def _planned_job(path: str) -> PlannedJob:
+    size = read_image_size(path)
+    return PlannedJob(
+        path=path,
+        size_bytes=os.path.getsize(path),
+        width=size[0] if size else None,
+        height=size[1] if size else None
+    )
+
+
+def plan_batch(
+    processor: ImageProcessor,
+    paths: List[str],
+    process_type: ProcessType,
+    history: Optional[ThroughputHistory] = None
+) -> BatchPlan:
+    """生成批处理计划
+
+    目录按process_directory的规则枚举，单独指定的文件按界面选择文件时的规则过滤，
+    两者都会再检查输出是否已是最新，得到的任务集合与实际处理时一致。
+    """
+    plan = BatchPlan(process_type=process_type, concurrency=processor.scheduler.concurrency)
+
+    seen = set()
+
+    def add(path: str, reason: Optional[str]):
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            return
+        seen.add(key)
+        if reason is None:
+            reason = processor.output_skip_reason(path, process_type)
+        if reason is None:
+            plan.jobs.append(_planned_job(path))
+        else:
+            plan.skipped.append(SkippedFile(path, reason))
+
+    for path in paths:
+        if os.path.isdir(path):
+            for file_path, reason in processor.iter_directory(path, process_type):
+                add(file_path, reason)
+        elif not os.path.exists(path):
+            plan.skipped.append(SkippedFile(path, "文件不存在"))
+        else:
+            add(path, processor.selection_skip_reason(path, process_type))
+
+    _estimate(plan, processor, history)
+    return plan
+
+
+def estimate_batch(
+    processor: ImageProcessor,
+    paths: List[str],
+    process_type: ProcessType,
+    history: Optional[ThroughputHistory] = None
+) -> BatchPlan:
+    """只按文件头估算一批文件的大小和耗时，不检查输出是否已是最新，得到的是上限
+
+    界面开始处理时与批处理同时运行：不查询清单也不计算哈希，
+    读取的文件头与任务排序和处理共用缓存，不增加额外的读取。
+    """
+    plan = BatchPlan(process_type=process_type, concurrency=processor.scheduler.concurrency)
+    for path in paths:
+        try:
+            plan.jobs.append(_planned_job(path))
+        except OSError:
+            plan.skipped.append(SkippedFile(path, "文件不存在"))
+    _estimate(plan, processor, history)
+    return plan
+
+
+def _estimate(plan: BatchPlan, processor: ImageProcessor, history: Optional[ThroughputHistory]):
+    """按历史吞吐量估算计划中任务的耗时"""
+    history = history or processor.throughput
+    if history is not None:
+        plan.estimated_seconds = history.estimate(
+            processor.throughput_key(plan.process_type),
+            plan.total_pixels / 1_000_000,
+            plan.concurrency
+        )
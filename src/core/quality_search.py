@@ -0,0 +1,275 @@
+"""
+按目标大小或目标SSIM搜索webp/avif的编码画质
+
+固定的画质参数对照片来说文件偏大，对截图来说又压得过狠。这里对每张图片
+在画质范围内搜索：目标大小模式取不超过字节预算的最高画质，SSIM模式取
+与原图的SSIM不低于阈值的最低画质。两者都随画质单调变化，所以从初始猜测
+出发先按倍增的步长找到区间，再二分，编码次数有上限。
+
+初始猜测优先使用同一源文件（按内容哈希）上次选定的画质，命中时直接编码
+一次，不再搜索；否则使用同样参数下最近几张图片选定画质的中位数。
+SSIM用NumPy在亮度通道上计算，NumPy是可选依赖，只有SSIM模式需要。
+"""
+import io
+import os
+import json
+import time
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 只有SSIM模式需要NumPy
+    np = None
+
+from src.core import pillow_engine
+from src.utils.helpers import get_app_data_dir
+
+TARGET_MODES = ("size", "ssim")
+# 各格式的画质搜索范围
+QUALITY_RANGES = {"webp": (20, 95), "avif": (15, 90)}
+# 单个格式最多编码几次（含最终写出前补编的一次）
+MAX_EVALUATIONS = 8
+# 从初始猜测出发的第一步步长，之后每次加倍
+GUESS_STEP = 4
+# SSIM的滑动窗口边长
+SSIM_WINDOW = 8
+# 超过这个像素数时先缩小再计算SSIM，避免大图占用过多内存
+SSIM_MAX_PIXELS = 4_000_000
+
+MEMO_FILENAME = "quality_memo.json"
+# 记忆的源文件数上限，超过时丢弃最早的记录
+MEMO_MAX_SOURCES = 10000
+# 每种参数保留最近多少次选定的画质，用于估算初始猜测
+MEMO_RECENT = 16
+
+
+@dataclass(frozen=True)
+class QualityTarget:
+    """画质搜索目标：mode为size时value是字节数上限，为ssim时value是SSIM下限"""
+    mode: str
+    value: float
+
+    def __post_init__(self):
+        if self.mode not in TARGET_MODES:
+            raise ValueError(f"未知的搜索目标: {self.mode}")
+        if self.mode == "ssim" and not 0 < self.value < 1:
+            raise ValueError(f"SSIM阈值必须在0和1之间: {self.value}")
+        if self.mode == "size" and self.value <= 0:
+            raise ValueError(f"目标大小必须大于0: {self.value}")
+
+    def params(self) -> dict:
+        """写入清单的参数，目标变化后旧输出会被判定过期"""
+        return {"target": self.mode, "value": self.value}
+
+
+def ssim_available() -> bool:
+    return np is not None
+
+
+def _luma(image):
+    """亮度通道，像素过多时按整数倍缩小"""
+    gray = image.convert("L")
+    factor = 1
+    while gray.width * gray.height / (factor * factor) > SSIM_MAX_PIXELS:
+        factor += 1
+    if factor > 1:
+        gray = gray.reduce(factor)
+    return np.asarray(gray, dtype=np.float64)
+
+
+def _box_mean(values, size: int):
+    """size×size窗口的均值（积分图），输出比输入小size-1"""
+    integral = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    total = integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]
+    return total / (size * size)
+
+
+def ssim(reference, candidate, window: int = SSIM_WINDOW) -> float:
+    """两幅同尺寸灰度图的平均SSIM"""
+    window = max(1, min(window, *reference.shape))
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_a, mu_b = _box_mean(reference, window), _box_mean(candidate, window)
+    var_a = _box_mean(reference * reference, window) - mu_a * mu_a
+    var_b = _box_mean(candidate * candidate, window) - mu_b * mu_b
+    covariance = _box_mean(reference * candidate, window) - mu_a * mu_b
+    numerator = (2 * mu_a * mu_b + c1) * (2 * covariance + c2)
+    denominator = (mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2)
+    return float((numerator / denominator).mean())
+
+
+def find_boundary(above, lo: int, hi: int, guess: int, max_evaluations: int = MAX_EVALUATIONS) -> Tuple[int, int]:
+    """在[lo, hi]中查找above(q)由False变为True的位置
+
+    above须随q单调。返回(left, right)：right是已知满足above的最小值（都不满足时为hi+1），
+    left-1是已知不满足的最大值；达到编码次数上限时两者之间可能还有未测试的画质。
+    """
+    left, right = lo, hi + 1
+    q = min(max(guess, lo), hi)
+    step = GUESS_STEP
+    direction = 0
+    evaluations = 0
+    while left < right and evaluations < max_evaluations:
+        evaluations += 1
+        if above(q):
+            right = q
+            current = -1
+        else:
+            left = q + 1
+            current = 1
+        # 沿同一方向倍增步长找区间，方向反转后改为二分
+        following = q + current * step
+        if direction in (0, current) and left <= following < right:
+            direction = current
+            step *= 2
+            q = following
+        else:
+            direction = None
+            q = (left + right) // 2
+    return left, right
+
+
+def _encode(image, fmt: str, quality: int, params: dict) -> bytes:
+    return pillow_engine.encode_image(image, pillow_engine._SAVE_FORMATS[fmt], quality=quality, **params)
+
+
+def search_format(
+    image, fmt: str, params: dict, target: QualityTarget, guess: int, reference=None,
+    max_pixels: Optional[int] = pillow_engine.MAX_IMAGE_PIXELS
+) -> dict:
+    """为一种格式搜索画质，返回 {"quality", "data", "bytes", "ssim", "evaluations"}"""
+    lo, hi = QUALITY_RANGES[fmt]
+    cache = {}
+
+    def evaluate(quality: int) -> dict:
+        if quality not in cache:
+            data = _encode(image, fmt, quality, params)
+            score = None
+            if target.mode == "ssim":
+                with pillow_engine.open_image(io.BytesIO(data), max_pixels) as decoded:
+                    score = ssim(reference, _luma(decoded))
+            cache[quality] = {"quality": quality, "data": data, "bytes": len(data), "ssim": score}
+        return cache[quality]
+
+    if target.mode == "ssim":
+        # 取SSIM达标的最低画质，都不达标时取最高画质
+        left, right = find_boundary(lambda q: evaluate(q)["ssim"] >= target.value, lo, hi, guess, MAX_EVALUATIONS - 1)
+        quality = min(right, hi)
+    else:
+        # 取不超过预算的最高画质，最低画质也超出时取最低画质
+        left, right = find_boundary(lambda q: evaluate(q)["bytes"] > target.value, lo, hi, guess, MAX_EVALUATIONS - 1)
+        quality = max(left - 1, lo)
+    result = dict(evaluate(quality))
+    result["evaluations"] = len(cache)
+    return result
+
+
+def encode_to_target(
+    input_path: str,
+    outputs: Dict[str, str],
+    params: Dict[str, dict],
+    target: QualityTarget,
+    guesses: Dict[str, Tuple[int, bool]],
+    max_pixels: Optional[int] = pillow_engine.MAX_IMAGE_PIXELS,
+    temp_tag: str = "",
+    timings: Optional[Dict[str, float]] = None
+) -> Dict[str, dict]:
+    """解码一次，为每种格式搜索画质后写出
+
+    outputs为 格式 -> 输出路径，params为不含quality的编码参数，
+    guesses为 格式 -> (初始画质, 是否为该源文件上次选定的画质)，后者为真时不再搜索。
+    返回 格式 -> {"path", "quality", "bytes", "ssim", "evaluations"}。
+    """
+    started = time.perf_counter()
+    with pillow_engine.open_image(input_path, max_pixels) as img:
+        image = pillow_engine._to_rgb(img)
+    reference = _luma(image) if target.mode == "ssim" else None
+    decoded = time.perf_counter()
+    chosen = {}
+    for fmt in outputs:
+        guess, exact = guesses[fmt]
+        if exact:
+            data = _encode(image, fmt, guess, params.get(fmt, {}))
+            chosen[fmt] = {"quality": guess, "data": data, "bytes": len(data), "ssim": None, "evaluations": 1}
+        else:
+            chosen[fmt] = search_format(image, fmt, params.get(fmt, {}), target, guess, reference, max_pixels)
+    encoded = time.perf_counter()
+    for fmt, output_path in outputs.items():
+        pillow_engine.write_atomic(chosen[fmt].pop("data"), output_path, temp_tag)
+        chosen[fmt]["path"] = output_path
+    if timings is not None:
+        timings["decode"] = decoded - started
+        timings["encode"] = encoded - decoded
+        timings["write"] = time.perf_counter() - encoded
+    return chosen
+
+
+def default_memo_path() -> str:
+    """默认的画质记忆文件路径"""
+    return os.path.join(get_app_data_dir(), MEMO_FILENAME)
+
+
+def _config_key(fmt: str, params: dict) -> str:
+    return f"{fmt}:{json.dumps(params, sort_keys=True)}"
+
+
+class QualityMemo:
+    """记录每个源文件在每组参数下选定的画质，重新运行时不必再次搜索
+
+    键为 源文件内容哈希 + 格式 + 编码参数（含搜索目标）。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_memo_path()
+        self._lock = threading.Lock()
+        self._sources: Dict[str, int] = {}
+        self._recent: Dict[str, list] = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._sources = data.get("sources", {})
+            self._recent = data.get("recent", {})
+        except (OSError, ValueError, AttributeError):
+            self._sources, self._recent = {}, {}
+
+    def guess(self, source_hash: str, fmt: str, params: dict, default: int) -> Tuple[int, bool]:
+        """返回(初始画质, 是否为该源文件上次选定的画质)"""
+        config = _config_key(fmt, params)
+        with self._lock:
+            quality = self._sources.get(f"{source_hash}:{config}")
+            if quality is not None:
+                return quality, True
+            recent = sorted(self._recent.get(config, []))
+        if recent:
+            return recent[len(recent) // 2], False
+        return default, False
+
+    def record(self, source_hash: str, fmt: str, params: dict, quality: int):
+        config = _config_key(fmt, params)
+        with self._lock:
+            key = f"{source_hash}:{config}"
+            self._sources.pop(key, None)
+            self._sources[key] = quality
+            while len(self._sources) > MEMO_MAX_SOURCES:
+                del self._sources[next(iter(self._sources))]
+            recent = self._recent.setdefault(config, [])
+            recent.append(quality)
+            del recent[:-MEMO_RECENT]
+            self._dirty = True
+
+    def save(self):
+        """写回磁盘（先写临时文件再替换，避免写坏）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"sources": self._sources, "recent": self._recent}, ensure_ascii=False)
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
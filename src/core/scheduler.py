@@ -0,0 +1,197 @@
+import os
+import time
+import asyncio
+import inspect
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Union
+
+
+def default_concurrency() -> int:
+    """默认并发数（CPU核心数）"""
+    return os.cpu_count() or 1
+
+
+async def maybe_await(value):
+    """回调既可以是普通函数也可以是协程函数"""
+    if inspect.isawaitable(value):
+        await value
+
+
+_DONE = object()
+
+
+async def iterate_in_thread(factory: Callable[[], Iterator[Any]], maxsize: int = 256) -> AsyncIterator[Any]:
+    """在后台线程中运行阻塞的生成器，通过有界缓冲把结果交给事件循环
+
+    消费方跟不上时生产线程会阻塞等待；消费方提前退出时生产线程也会随之停止。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(maxsize)
+    closed = threading.Event()
+
+    def produce():
+        try:
+            for item in factory():
+                slots.acquire()
+                if closed.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            slots.release()
+            yield item
+    finally:
+        closed.set()
+        slots.release()
+
+
+class BatchScheduler:
+    """有界并发调度器
+
+    同时保持最多 concurrency 个任务在运行，每完成一个就立即通过
+    progress_callback 推送结果，should_stop 返回 True 后不再领取新任务。
+    items 也可以是异步迭代器，此时由生产者任务填充有界队列，worker 并发消费，
+    枚举和处理同时进行。
+    """
+
+    def __init__(self, concurrency: Optional[int] = None):
+        self.concurrency = max(1, concurrency or default_concurrency())
+        self._workers = set()
+        self._cancelled = False
+
+    def cancel(self):
+        """立即取消：不再领取新任务，并取消正在运行的worker（需在事件循环线程中调用）
+
+        worker被取消时正在等待的子进程会由调用方负责结束，见child_process.run_child。
+        """
+        self._cancelled = True
+        for task in list(self._workers):
+            task.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        """最近一次批处理是否被cancel()终止"""
+        return self._cancelled
+
+    async def _gather_workers(self, coros):
+        """并发运行worker；单个worker被cancel()取消不会让整个批处理抛出CancelledError"""
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        self._workers.update(tasks)
+        try:
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self._workers.difference_update(tasks)
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+
+    async def run(
+        self,
+        items: Union[Iterable[Any], AsyncIterator[Any]],
+        worker: Callable[[Any], Awaitable[Any]],
+        progress_callback=None,
+        should_stop: Optional[Callable[[], bool]] = None,
+        start_callback=None,
+        error_factory: Optional[Callable[[Any, Exception], Any]] = None,
+        wait_callback: Optional[Callable[[Any, float], None]] = None
+    ) -> List[Any]:
+        """运行批处理，按完成顺序返回结果
+
+        wait_callback(result, seconds) 在推送结果前调用，seconds为任务入队到开始处理的等待时间。
+        """
+        results: List[Any] = []
+        self._cancelled = False
+        user_should_stop = should_stop
+
+        def should_stop():
+            return self._cancelled or bool(user_should_stop and user_should_stop())
+
+        async def handle(item, queued_at):
+            waited = time.perf_counter() - queued_at
+            if start_callback:
+                await maybe_await(start_callback(item))
+            try:
+                result = await worker(item)
+            except Exception as e:
+                if not error_factory:
+                    raise
+                result = error_factory(item, e)
+            if result:  # 确保结果不为None
+                if wait_callback:
+                    wait_callback(result, waited)
+                results.append(result)
+                if progress_callback:
+                    await maybe_await(progress_callback(result))
+
+        if hasattr(items, "__aiter__"):
+            await self._run_stream(items, handle, should_stop)
+            return results
+
+        iterator = iter(items)
+        # 同步迭代的任务视为在批处理开始时全部入队
+        queued_at = time.perf_counter()
+
+        async def run_worker():
+            # 所有worker共享同一个迭代器，next()之间没有await，因此不会重复领取
+            for item in iterator:
+                if should_stop():
+                    break
+                await handle(item, queued_at)
+
+        await self._gather_workers(run_worker() for _ in range(self.concurrency))
+        return results
+
+    async def _run_stream(self, items: AsyncIterator[Any], handle, should_stop):
+        """生产者/消费者模式：生产者填充有界队列，worker并发消费"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        producer_error = []
+
+        async def produce():
+            try:
+                async for item in items:
+                    if should_stop():
+                        break
+                    await queue.put((item, time.perf_counter()))
+            except Exception as e:
+                producer_error.append(e)
+            for _ in range(self.concurrency):
+                await queue.put(_DONE)
+
+        async def run_worker():
+            while True:
+                entry = await queue.get()
+                if entry is _DONE:
+                    break
+                if should_stop():
+                    continue  # 丢弃已入队的任务，直到生产者结束
+                await handle(*entry)
+
+        producer = asyncio.create_task(produce())
+        try:
+            await self._gather_workers(run_worker() for _ in range(self.concurrency))
+        finally:
+            if not producer.done():
+                producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+            if hasattr(items, "aclose"):
+                await items.aclose()
+        if producer_error:
+            raise producer_error[0]
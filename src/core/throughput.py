@@ -0,0 +1,75 @@
+import os
+import json
+import threading
+from typing import Optional
+
+from src.utils.helpers import get_app_data_dir
+
+HISTORY_FILENAME = "throughput.json"
+# 旧数据的衰减系数，保证估算跟得上机器和编码参数的变化
+DECAY = 0.98
+
+
+def default_history_path() -> str:
+    """默认的吞吐量历史文件路径"""
+    return os.path.join(get_app_data_dir(), HISTORY_FILENAME)
+
+
+class ThroughputHistory:
+    """记录历次运行的每百万像素耗时，用于估算批处理时间
+
+    按 "处理类型:后端" 分别累计衰减后的像素数和耗时，
+    耗时是单个任务占用一个worker的时间，估算时再除以并发数。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_history_path()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._stats = json.load(f)
+        except (OSError, ValueError):
+            self._stats = {}
+
+    def record(self, key: str, megapixels: float, seconds: float):
+        """记录一次任务的像素数和耗时"""
+        if megapixels <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(key, {"megapixels": 0.0, "seconds": 0.0, "jobs": 0})
+            stats["megapixels"] = stats["megapixels"] * DECAY + megapixels
+            stats["seconds"] = stats["seconds"] * DECAY + seconds
+            stats["jobs"] += 1
+            self._dirty = True
+
+    def seconds_per_megapixel(self, key: str) -> Optional[float]:
+        """每百万像素耗时，没有历史数据时返回None"""
+        with self._lock:
+            stats = self._stats.get(key)
+            if not stats or stats["megapixels"] <= 0:
+                return None
+            return stats["seconds"] / stats["megapixels"]
+
+    def estimate(self, key: str, megapixels: float, concurrency: int) -> Optional[float]:
+        """估算处理指定像素数所需的墙钟时间（秒）"""
+        rate = self.seconds_per_megapixel(key)
+        if rate is None:
+            return None
+        return rate * megapixels / max(1, concurrency)
+
+    def save(self):
+        """写回磁盘（先写临时文件再替换，避免写坏）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._stats, ensure_ascii=False, indent=2)
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
@@ -0,0 +1,198 @@
+"""
+外部工具（ffmpeg、optimizt、jpegtran）的延迟发现
+
+查找可执行文件只用shutil.which，不启动子进程；只有缓存未命中时才运行
+"ffmpeg -version"之类的探测命令。探测成功的结果按 PATH、可执行文件路径和修改时间
+缓存到磁盘，重复启动时直接读取缓存；探测失败不缓存，下次启动时重新探测。
+"""
+import os
+import json
+import shutil
+import threading
+import subprocess
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional
+
+from src.utils.helpers import get_app_data_dir, get_npm_global_path
+
+CACHE_FILENAME = "tools.json"
+PROBE_TIMEOUT = 15
+# 关心的ffmpeg编码器
+FFMPEG_ENCODERS_OF_INTEREST = ("mjpeg", "libwebp", "libaom-av1", "libsvtav1", "librav1e")
+
+
+@dataclass
+class ToolInfo:
+    name: str
+    path: Optional[str]
+    version: Optional[str] = None
+    capabilities: List[str] = field(default_factory=list)
+
+    @property
+    def available(self) -> bool:
+        return self.path is not None
+
+
+def default_cache_path() -> str:
+    """默认的工具缓存文件路径"""
+    return os.path.join(get_app_data_dir(), CACHE_FILENAME)
+
+
+def _run_probe(cmd: List[str]) -> Optional[str]:
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout + result.stderr
+
+
+def _locate_ffmpeg() -> Optional[str]:
+    return shutil.which("ffmpeg")
+
+
+def _locate_optimizt() -> Optional[str]:
+    path = shutil.which("optimizt")
+    if path:
+        return path
+    npm_path = get_npm_global_path()
+    if npm_path:
+        optimizt_cmd = os.path.join(npm_path, 'optimizt.cmd')
+        if os.path.exists(optimizt_cmd):
+            return optimizt_cmd
+    return None
+
+
+def _probe_ffmpeg(path: str) -> Optional[ToolInfo]:
+    output = _run_probe([path, "-hide_banner", "-version"])
+    if output is None:
+        return None
+    version = output.splitlines()[0].strip() if output.strip() else None
+    encoders = _run_probe([path, "-hide_banner", "-encoders"]) or ""
+    available = set()
+    for line in encoders.splitlines():
+        parts = line.split()
+        # 形如 " V....D mjpeg   MJPEG (Motion JPEG)"
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in "VAS":
+            available.add(parts[1])
+    capabilities = [name for name in FFMPEG_ENCODERS_OF_INTEREST if name in available]
+    return ToolInfo("ffmpeg", path, version, capabilities)
+
+
+def _probe_optimizt(path: str) -> Optional[ToolInfo]:
+    output = _run_probe([path, "--version"])
+    if output is None:
+        return None
+    version = output.strip().splitlines()[0] if output.strip() else None
+    return ToolInfo("optimizt", path, version, ["webp", "avif"])
+
+
+def _locate_jpegtran() -> Optional[str]:
+    return shutil.which("jpegtran")
+
+
+def _probe_jpegtran(path: str) -> Optional[ToolInfo]:
+    output = _run_probe([path, "-version"])
+    if output is None:
+        return None
+    version = output.strip().splitlines()[0] if output.strip() else None
+    return ToolInfo("jpegtran", path, version, ["optimize", "progressive"])
+
+
+LOCATORS = {"ffmpeg": _locate_ffmpeg, "optimizt": _locate_optimizt, "jpegtran": _locate_jpegtran}
+PROBES = {"ffmpeg": _probe_ffmpeg, "optimizt": _probe_optimizt, "jpegtran": _probe_jpegtran}
+
+
+class ToolRegistry:
+    """按需发现外部工具，结果缓存在内存和磁盘中"""
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.cache_path = cache_path if cache_path is not None else default_cache_path()
+        self._lock = threading.Lock()
+        self._tool_locks = {name: threading.Lock() for name in LOCATORS}
+        self._resolved: Dict[str, ToolInfo] = {}
+        self._disk_cache = self._load_cache()
+
+    def _load_cache(self) -> dict:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        with self._lock:
+            data = json.dumps(self._disk_cache, ensure_ascii=False, indent=2)
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _cache_key(path: str) -> Optional[str]:
+        """缓存键：PATH、可执行文件路径和修改时间，任一变化都会重新探测"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        return json.dumps([os.environ.get("PATH", ""), os.path.abspath(path), mtime_ns])
+
+    def get(self, name: str) -> ToolInfo:
+        """获取工具信息，首次调用时才查找和探测（可能阻塞）"""
+        info = self._resolved.get(name)
+        if info is not None:
+            return info
+        with self._tool_locks[name]:
+            info = self._resolved.get(name)
+            if info is None:
+                info = self._discover(name)
+                self._resolved[name] = info
+            return info
+
+    def peek(self, name: str) -> Optional[ToolInfo]:
+        """只返回已经发现的结果，不触发探测"""
+        return self._resolved.get(name)
+
+    def _discover(self, name: str) -> ToolInfo:
+        path = LOCATORS[name]()
+        if path is None:
+            return ToolInfo(name, None)
+
+        key = self._cache_key(path)
+        with self._lock:
+            cached = self._disk_cache.get(name)
+        # 旧版本可能缓存了探测失败的结果，忽略
+        if key is not None and cached and cached.get("key") == key and cached["info"].get("path"):
+            return ToolInfo(**cached["info"])
+
+        info = PROBES[name](path)
+        if info is None:
+            # 探测失败或超时（如Node.js冷启动过慢）可能只是暂时的，不写入磁盘缓存，下次启动时重新探测
+            return ToolInfo(name, None)
+        if key is not None:
+            with self._lock:
+                self._disk_cache[name] = {"key": key, "info": asdict(info)}
+            self._save_cache()
+        return info
+
+    def refresh(self):
+        """清除缓存，下次访问时重新探测"""
+        with self._lock:
+            self._resolved.clear()
+            self._disk_cache.clear()
+
+    def discover_async(self, callback: Optional[Callable[[Dict[str, ToolInfo]], None]] = None,
+                       names: Optional[List[str]] = None) -> threading.Thread:
+        """在后台线程中发现工具，完成后调用callback（在后台线程中调用）"""
+        def run():
+            results = {name: self.get(name) for name in (names or list(LOCATORS))}
+            if callback:
+                callback(results)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
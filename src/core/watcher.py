@@ -0,0 +1,332 @@
+"""
+目录监视模式
+
+Linux上通过inotify接收文件事件，其他平台定时扫描目录。
+事件先进入待处理表，文件在debounce时间内没有新事件、大小和修改时间稳定
+且可以打开读取后才会交给ImageProcessor处理。
+"""
+import os
+import sys
+import time
+import struct
+import asyncio
+import logging
+import ctypes
+import ctypes.util
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from src.core.image_processor import ImageProcessor, ProcessType
+from src.core.scheduler import maybe_await
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 程序自己生成的文件，不能触发处理
+OUTPUT_SUFFIXES = ('_proc.jpg', '.webp', '.avif')
+
+# inotify常量（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+Signature = Tuple[int, int]
+
+
+def is_candidate(path: str) -> bool:
+    """是否为需要监视的源图片"""
+    name = os.path.basename(path).lower()
+    if name.endswith(OUTPUT_SUFFIXES):
+        return False
+    return name.endswith(IMAGE_EXTENSIONS)
+
+
+def _signature(path: str) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _can_open(path: str) -> bool:
+    """Windows上正在写入的文件无法打开读取"""
+    try:
+        with open(path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+
+def scan_tree(directory: str) -> Dict[str, Signature]:
+    """用scandir递归扫描目录，返回候选图片的大小和修改时间"""
+    snapshot = {}
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif is_candidate(entry.name):
+                            st = entry.stat()
+                            snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return snapshot
+
+
+class PollingSource:
+    """定时扫描目录，比较前后两次快照"""
+
+    def __init__(self, directory: str, interval: float = 2.0):
+        self.directory = directory
+        self.interval = interval
+        self._task = None
+
+    async def start(self, notify: Callable[[str], None]):
+        loop = asyncio.get_running_loop()
+        previous = await loop.run_in_executor(None, scan_tree, self.directory)
+
+        async def poll():
+            nonlocal previous
+            while True:
+                await asyncio.sleep(self.interval)
+                current = await loop.run_in_executor(None, scan_tree, self.directory)
+                for path, signature in current.items():
+                    if previous.get(path) != signature:
+                        notify(path)
+                previous = current
+
+        self._task = asyncio.create_task(poll())
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+
+
+class InotifySource:
+    """通过ctypes调用inotify，不需要额外依赖"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self._watches: Dict[int, str] = {}
+        self._notify = None
+        self._loop = None
+        # 在线程池中扫描目录的任务，大目录树不会阻塞事件循环中正在处理的任务
+        self._tasks: Set[asyncio.Task] = set()
+        self._rescan_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @staticmethod
+    def is_supported() -> bool:
+        return sys.platform.startswith("linux") and ctypes.util.find_library("c") is not None
+
+    def _add_tree(self, directory: str):
+        """递归添加目录监视，返回目录中已经存在的图片"""
+        found = []
+        stack = [directory]
+        while stack and not self._closed:
+            current = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), WATCH_MASK)
+            if wd < 0:
+                logging.warning(f"无法监视目录: {current}")
+                continue
+            self._watches[wd] = current
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif is_candidate(entry.name):
+                            found.append(entry.path)
+            except OSError:
+                continue
+        return found
+
+    async def start(self, notify: Callable[[str], None]):
+        self._notify = notify
+        self._loop = asyncio.get_running_loop()
+        await self._loop.run_in_executor(None, self._add_tree, self.directory)
+        self._loop.add_reader(self._fd, self._read_events)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _rescan(self):
+        """事件队列溢出后重新扫描整个目录"""
+        snapshot = await self._loop.run_in_executor(None, scan_tree, self.directory)
+        for path in snapshot:
+            self._notify(path)
+
+    async def _watch_new_directory(self, directory: str):
+        """新建或移入的子目录，里面可能已经有文件"""
+        found = await self._loop.run_in_executor(None, self._add_tree, directory)
+        for path in found:
+            self._notify(path)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，重新扫描整个目录；扫描进行中时再次溢出不必重复扫描
+                if self._rescan_task is None or self._rescan_task.done():
+                    self._rescan_task = self._spawn(self._rescan())
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._spawn(self._watch_new_directory(path))
+            elif is_candidate(path):
+                self._notify(path)
+
+    def close(self):
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        if self._loop is not None:
+            self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+
+
+@dataclass
+class _Pending:
+    last_event: float
+    signature: Optional[Signature]
+
+
+class ImageWatcher:
+    """监视目录，增量处理新增和修改的图片"""
+
+    def __init__(
+        self,
+        processor: ImageProcessor,
+        directory: str,
+        process_types: List[ProcessType],
+        debounce: float = 1.0,
+        poll_interval: float = 2.0,
+        use_inotify: Optional[bool] = None,
+        progress_callback=None
+    ):
+        self.processor = processor
+        self.directory = os.path.abspath(directory)
+        self.process_types = process_types
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = InotifySource.is_supported() if use_inotify is None else use_inotify
+        self.progress_callback = progress_callback
+        self._pending: Dict[str, _Pending] = {}
+        # 上次处理时源文件的大小和修改时间，未变化的文件不会重复处理
+        self._processed: Dict[str, Signature] = {}
+
+    def _touch(self, path: str):
+        """记录文件事件，重新开始计时"""
+        self._pending[path] = _Pending(time.monotonic(), _signature(path))
+
+    def _collect_ready(self) -> List[str]:
+        """取出已经写入完成的文件"""
+        now = time.monotonic()
+        ready = []
+        for path, pending in list(self._pending.items()):
+            if now - pending.last_event < self.debounce:
+                continue
+            signature = _signature(path)
+            if signature is None:
+                # 文件已被删除或移走
+                del self._pending[path]
+                continue
+            if signature != pending.signature:
+                # 仍在写入，重新计时
+                self._pending[path] = _Pending(now, signature)
+                continue
+            if not _can_open(path):
+                continue
+            del self._pending[path]
+            if self._processed.get(path) == signature:
+                continue
+            self._processed[path] = signature
+            ready.append(path)
+        return ready
+
+    def _create_source(self):
+        if self.use_inotify:
+            try:
+                return InotifySource(self.directory)
+            except OSError as e:
+                logging.warning(f"inotify不可用，改用轮询: {e}")
+        return PollingSource(self.directory, self.poll_interval)
+
+    def _needed(self, paths: List[str], process_type: ProcessType) -> List[str]:
+        return [path for path in paths if self.processor.should_process_file(path, process_type)]
+
+    async def _process(self, paths: List[str]):
+        loop = asyncio.get_running_loop()
+        for process_type in self.process_types:
+            # 检查输出是否最新需要stat和查清单，可能还要计算哈希，放到线程池中执行
+            files = await loop.run_in_executor(None, self._needed, paths, process_type)
+            if files:
+                await self.processor.process_files(
+                    files, process_type, progress_callback=self._on_result, checked=True
+                )
+
+    async def _on_result(self, result):
+        if result.source_saved_bytes:
+            # 源文件被无损压缩改写，记下改写后的大小和修改时间，不把自己的写入当作新的修改
+            self._processed[result.input_path] = _signature(result.input_path)
+        if self.progress_callback:
+            await maybe_await(self.progress_callback(result))
+
+    async def run(self, should_stop: Optional[Callable[[], bool]] = None, initial_scan: bool = True):
+        """运行监视循环，直到should_stop返回True或任务被取消"""
+        source = self._create_source()
+        await source.start(self._touch)
+        logging.info(f"开始监视目录: {self.directory} ({type(source).__name__})")
+        try:
+            if initial_scan:
+                loop = asyncio.get_running_loop()
+                snapshot = await loop.run_in_executor(None, scan_tree, self.directory)
+                self._processed.update(snapshot)
+                await self._process(sorted(snapshot))
+
+            while not (should_stop and should_stop()):
+                ready = self._collect_ready()
+                if ready:
+                    await self._process(ready)
+                await asyncio.sleep(min(0.25, self.debounce))
+        finally:
+            source.close()
@@ -3,22 +3,17 @@ import sys
 import asyncio
 import logging
 import traceback
+import multiprocessing
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 import tkinter.messagebox as messagebox
 
-# 设置日志
-logging.basicConfig(
-    filename='app.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from src.ui.main_window import MainWindow
+from src.utils.logging_setup import default_log_path, json_from_env, level_from_env, setup_logging
 
 def get_resource_path(relative_path):
     """获取资源文件的绝对路径"""
@@ -31,6 +26,9 @@ def get_resource_path(relative_path):
 
 def main():
     """主函数"""
+    # 日志经队列由后台线程写入用户数据目录，按大小轮转
+    log_path = default_log_path()
+    setup_logging(log_path, level_from_env(), json_from_env())
     try:
         logging.info("程序启动")
         
@@ -92,8 +90,10 @@ def main():
         # 显示错误对话框
         if 'root' in locals():
             root.destroy()
-        messagebox.showerror("错误", f"程序发生错误：\n{str(e)}\n\n详细信息已记录到 app.log")
+        messagebox.showerror("错误", f"程序发生错误：\n{str(e)}\n\n详细信息已记录到 {log_path}")
         sys.exit(1)
 
 if __name__ == "__main__":
+    # 打包成exe后，进程池的工作进程也从这里启动，须在创建界面之前接管
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
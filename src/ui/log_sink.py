@@ -0,0 +1,56 @@
+"""
+界面日志输出
+
+任意线程都可以写入，消息先进入待显示缓冲区，由Tk线程每帧合并成一次插入；
+文本框只保留最近的若干行。完整日志由logging的后台线程写入日志文件，这里不再写盘。
+"""
+import threading
+from tkinter import Text
+from typing import List, Optional
+
+# 文本框最多保留的行数
+MAX_DISPLAY_LINES = 2000
+
+
+class LogSink:
+    def __init__(self, widget: Text, log_path: Optional[str] = None, max_lines: int = MAX_DISPLAY_LINES):
+        """log_path为完整日志所在的文件，只用于截断时提示用户"""
+        self.widget = widget
+        self.max_lines = max_lines
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._pending: List[str] = []
+        self._truncated = False
+
+    def write(self, message: str):
+        """追加一条日志（线程安全）"""
+        with self._lock:
+            self._pending.append(message)
+
+    def flush(self):
+        """把待显示的日志一次性插入文本框（只能在Tk线程中调用）"""
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if not lines:
+            return
+
+        # 一次刷新的内容超过上限时只插入最后的部分
+        if len(lines) > self.max_lines:
+            lines = lines[-self.max_lines:]
+        text = "\n".join(lines) + "\n"
+
+        widget = self.widget
+        # 用户向上翻看时不自动滚动到底部
+        follow = widget.yview()[1] >= 1.0
+        widget.configure(state="normal")
+        widget.insert("end", text)
+        line_count = int(widget.index("end-1c").split(".")[0]) - 1
+        excess = line_count - self.max_lines
+        if excess > 0:
+            widget.delete("1.0", f"{excess + 1}.0")
+            if not self._truncated and self.log_path:
+                self._truncated = True
+                self.write(f"（只显示最近 {self.max_lines} 行，完整日志见 {self.log_path}）")
+        if follow:
+            widget.see("end")
+        widget.configure(state="disabled")
@@ -1,28 +1,53 @@
 import os
+import time
 import ctypes
+import logging
 import asyncio
 import tkinter as tk
 from tkinter import Text, messagebox, filedialog
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-from typing import Optional, Callable
+from typing import Optional, Callable, Union
 from functools import partial
 import threading
 from queue import Queue
 
 from src.core.image_processor import ImageProcessor, ProcessType, ProcessMode, ProcessResult
+from src.core.journal import JobJournal
+from src.core.lqip import LqipManifest, MANIFEST_FILENAME as LQIP_FILENAME
+from src.core.manifest import BuildManifest
+from src.core.metrics import summarize
+from src.core.planner import estimate_batch
+from src.core.throughput import ThroughputHistory
+from src.ui.log_sink import LogSink
+from src.ui.queue_feed import QueueCounts, QueueFeed
+from src.ui.settings import GuiSettings
+from src.utils.helpers import format_file_size
+from src.utils.logging_setup import default_log_path
+
+# 界面刷新间隔（毫秒）
+REFRESH_INTERVAL = 50
 
 class MainWindow:
     def __init__(self, root: ttk.Window):
         self.root = root
         self.root.title("图片处理工具")
         
-        # 初始化图片处理器
-        self.image_processor = ImageProcessor()
+        # 初始化图片处理器（使用增量构建清单，源文件修改后会重新生成）
+        self.image_processor = ImageProcessor(
+            manifest=self._open_manifest(),
+            throughput=ThroughputHistory(),
+            journal=self._open_journal()
+        )
+        
+        # 界面设置（如占位图清单路径）
+        self.settings = GuiSettings.load()
         
         # 处理状态
         self.processing = False
         self.stop_requested = False
+        # 本次处理的发现/待处理/完成/失败数
+        self.counts = QueueCounts()
         
         # 创建消息队列和事件循环
         self.message_queue = Queue()
@@ -47,6 +72,22 @@ class MainWindow:
         # 设置定期检查消息队列
         self._setup_message_check()
         
+    def _open_manifest(self) -> Optional[BuildManifest]:
+        """打开增量构建清单，失败时退回到按文件是否存在判断"""
+        try:
+            return BuildManifest()
+        except Exception as e:
+            logging.warning(f"打开构建清单失败: {e}")
+            return None
+        
+    def _open_journal(self) -> Optional[JobJournal]:
+        """打开任务日志，失败时不记录（中断后无法继续）"""
+        try:
+            return JobJournal()
+        except Exception as e:
+            logging.warning(f"打开任务日志失败: {e}")
+            return None
+
     def _setup_dpi_awareness(self):
         """设置DPI感知"""
         try:
@@ -101,7 +142,9 @@ class MainWindow:
             text="生成缩略图",
             command=self._process_thumbnail,
             width=10,
-            style="primary.TButton"
+            style="primary.TButton",
+            # 工具检查完成前判断后端是否可用会在Tk线程中探测，检查完成后才启用
+            state="disabled"
         )
         self.thumbnail_button.pack(pady=(0, 5))
         
@@ -121,7 +164,8 @@ class MainWindow:
             text="生成avif/webp",
             command=self._process_avif_webp,
             width=14,
-            style="info.TButton"
+            style="info.TButton",
+            state="disabled"
         )
         self.avif_webp_button.pack(pady=(0, 5))
         
@@ -131,7 +175,64 @@ class MainWindow:
             style="Label.TLabel"
         )
         self.optimizt_status.pack()
-        
+
+        # 选择文件还是整个文件夹
+        mode_frame = ttk.Frame(self.main_frame)
+        mode_frame.pack(pady=(5, 0))
+        self.process_mode = tk.StringVar(value=ProcessMode.SINGLE.value)
+        ttk.Radiobutton(
+            mode_frame, text="选择文件", variable=self.process_mode, value=ProcessMode.SINGLE.value
+        ).pack(side="left", padx=10)
+        ttk.Radiobutton(
+            mode_frame, text="选择文件夹", variable=self.process_mode, value=ProcessMode.FOLDER.value
+        ).pack(side="left", padx=10)
+
+        # 生成缩略图时是否同时写入占位图清单（整个站点一个文件，路径由用户选择）
+        lqip_frame = ttk.Frame(self.main_frame)
+        lqip_frame.pack(pady=(5, 0))
+        self.lqip_enabled = tk.BooleanVar(value=bool(self.settings.lqip_path))
+        ttk.Checkbutton(
+            lqip_frame, text="生成占位图清单", variable=self.lqip_enabled, command=self._toggle_lqip
+        ).pack(side="left", padx=10)
+        self.lqip_label = ttk.Label(lqip_frame, text="", style="Label.TLabel")
+        self.lqip_label.pack(side="left")
+        self._update_lqip_label()
+
+        self.progress_label = ttk.Label(self.main_frame, text="", style="Label.TLabel")
+        self.progress_label.pack(pady=(5, 0))
+        
+    def _toggle_lqip(self):
+        """勾选时选择清单文件（已有的清单会被合并而不是覆盖），取消勾选时不再写清单"""
+        if self.lqip_enabled.get():
+            current = self.settings.lqip_path
+            path = filedialog.asksaveasfilename(
+                parent=self.root,
+                title="选择占位图清单文件",
+                initialdir=os.path.dirname(current) if current else None,
+                initialfile=os.path.basename(current) if current else LQIP_FILENAME,
+                defaultextension=".json",
+                filetypes=[("JSON文件", "*.json")],
+                confirmoverwrite=False
+            )
+            if not path:
+                self.lqip_enabled.set(False)
+                return
+            self.settings.lqip_path = os.path.abspath(path)
+        else:
+            self.settings.lqip_path = None
+        self.settings.save()
+        self._update_lqip_label()
+
+    def _update_lqip_label(self):
+        path = self.settings.lqip_path
+        self.lqip_label.configure(text=os.path.basename(path) if path else "")
+
+    def _lqip_manifest(self, process_type: ProcessType) -> Optional[LqipManifest]:
+        """启用占位图清单时，生成缩略图使用用户选择的清单文件"""
+        if process_type != ProcessType.THUMBNAIL or not self.settings.lqip_path:
+            return None
+        return LqipManifest(self.settings.lqip_path)
+
     def _create_info_display(self):
         """创建信息显示区域"""
         # 创建一个Frame来包含两列
@@ -201,6 +302,12 @@ class MainWindow:
         # 禁用编辑
         self.queue_display.configure(state="disabled")
         self.info_display.configure(state="disabled")
+
+        # 待处理队列随目录枚举逐步加入，按帧合并刷新
+        self.queue_feed = QueueFeed(self.queue_display)
+        
+        # 处理信息按帧合并刷新，完整日志由logging写入日志文件
+        self.log_sink = LogSink(self.info_display, log_path=default_log_path())
         
     def _setup_icon(self):
         """设置窗口图标"""
@@ -209,12 +316,32 @@ class MainWindow:
             self.root.iconbitmap(icon_path)
             
     def _check_environment(self):
-        """检查环境配置"""
+        """在后台线程中检查环境配置，完成后更新状态标签，不阻塞窗口显示"""
+        def on_discovered(tools):
+            for info in tools.values():
+                logging.info(f"{info.name}: {info.path} {info.version or ''} {','.join(info.capabilities)}")
+            self.message_queue.put(self._update_environment_status)
+            # 工具检查完成后才知道能否继续上次的处理
+            self.message_queue.put(self._offer_resume)
+
+        self.image_processor.tools.discover_async(on_discovered)
+        
+    def _update_environment_status(self):
+        """根据已发现的工具更新状态标签，并启用处理按钮"""
+        if not self.processing:
+            self.thumbnail_button.configure(state="normal")
+            self.avif_webp_button.configure(state="normal")
         if self.image_processor._ffmpeg_path:
             self.ffmpeg_status.configure(
                 text="ffmpeg: 已安装 ✓",
                 foreground="green"
             )
+        elif self.image_processor.has_thumbnail_backend:
+            # 没有ffmpeg时缩略图由Pillow在进程内生成
+            self.ffmpeg_status.configure(
+                text="Pillow: 已安装 ✓",
+                foreground="green"
+            )
         else:
             self.ffmpeg_status.configure(
                 text="ffmpeg: 未安装 ✗",
@@ -226,12 +353,49 @@ class MainWindow:
                 text="optimizt: 已安装 ✓",
                 foreground="green"
             )
+        elif self.image_processor.has_avif_webp_backend:
+            # 没有optimizt时avif/webp由Pillow在进程内编码
+            self.optimizt_status.configure(
+                text="Pillow: 已安装 ✓",
+                foreground="green"
+            )
         else:
             self.optimizt_status.configure(
                 text="optimizt: 未安装 ✗",
                 foreground="red"
             )
             
+    def _offer_resume(self):
+        """上次的处理没有完成时询问是否继续，只处理没有完成的文件"""
+        journal = self.image_processor.journal
+        if journal is None or self.processing:
+            return
+        buttons = {
+            ProcessType.THUMBNAIL: (self.thumbnail_button, "生成缩略图", self.image_processor.has_thumbnail_backend),
+            ProcessType.AVIF_WEBP: (self.avif_webp_button, "生成avif/webp", self.image_processor.has_avif_webp_backend),
+        }
+        for run in journal.unfinished_runs():
+            process_type = ProcessType(run.process_type)
+            # 界面没有对应按钮（如命令行的srcset）或缺少工具时留给命令行的--resume
+            if process_type not in buttons or not buttons[process_type][2]:
+                continue
+            button, label, _ = buttons[process_type]
+            started_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(run.created_at))
+            rescan = "" if run.scanned else "，目录也没有扫描完"
+            if not messagebox.askyesno(
+                "继续未完成的处理",
+                f"{started_at} 开始的{label}还有 {run.pending}/{run.total} 个文件没有完成{rescan}，是否继续？"
+            ):
+                journal.discard_run(run.run_id)
+                continue
+            self._update_queue_display(journal.pending_paths(run.run_id))
+            self.processing = True
+            self.stop_requested = False
+            button.configure(text="停止", style="danger.TButton")
+            self.run_async(self._resume_run(run, process_type))
+            # 一次只继续一个运行，其余的下次启动时再询问
+            return
+
     def _start_event_loop(self):
         """在新线程中启动事件循环"""
         def run_event_loop():
@@ -249,9 +413,18 @@ class MainWindow:
             while not self.message_queue.empty():
                 callback = self.message_queue.get_nowait()
                 callback()
-            self.root.after(100, check_messages)
+            self.log_sink.flush()
+            self.queue_feed.flush()
+            self._refresh_progress()
+            self.root.after(REFRESH_INTERVAL, check_messages)
             
-        self.root.after(100, check_messages)
+        self.root.after(REFRESH_INTERVAL, check_messages)
+
+    def _refresh_progress(self):
+        """更新发现/待处理/完成/失败数（只在文字变化时重绘）"""
+        text = self.counts.format() if self.counts.discovered else ""
+        if text != self.progress_label.cget("text"):
+            self.progress_label.configure(text=text)
 
     def run_async(self, coro):
         """在事件循环中运行协程"""
@@ -289,21 +462,32 @@ class MainWindow:
             self.loop.call_soon_threadsafe(self.loop.stop)
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=1.0)
+        self.image_processor.close()
+        if self.image_processor.manifest is not None:
+            self.image_processor.manifest.close()
+        if self.image_processor.journal is not None:
+            self.image_processor.journal.close()
+
+    def _request_stop(self):
+        """停止处理：不再领取新文件，并立即结束正在运行的编码器"""
+        self.stop_requested = True
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.image_processor.cancel)
 
     def _process_thumbnail(self):
         """处理缩略图"""
-        if not self.image_processor._ffmpeg_path:
-            self._show_error("未检测到ffmpeg", "请先安装ffmpeg后再使用此功能。")
+        if not self.image_processor.has_thumbnail_backend:
+            self._show_error("未检测到ffmpeg", "请先安装ffmpeg或Pillow后再使用此功能。")
             return
             
         if self.processing:
-            self.stop_requested = True
+            self._request_stop()
             self.thumbnail_button.configure(state="disabled")
             return
             
         # 选择文件或文件夹
-        paths = self._select_files_or_folder("选择要处理的图片或文件夹", ProcessType.THUMBNAIL)
-        if not paths:
+        target = self._select_files_or_folder("选择要处理的图片或文件夹", ProcessType.THUMBNAIL)
+        if not target:
             return
             
         self.processing = True
@@ -311,22 +495,22 @@ class MainWindow:
         self.thumbnail_button.configure(text="停止", style="danger.TButton")
         
         # 启动处理
-        self.run_async(self._process_paths(paths, ProcessType.THUMBNAIL))
+        self._start_processing(target, ProcessType.THUMBNAIL)
             
     def _process_avif_webp(self):
         """处理avif/webp格式"""
-        if not self.image_processor._optimizt_path:
-            self._show_error("未检测到optimizt", "请先安装optimizt后再使用此功能。")
+        if not self.image_processor.has_avif_webp_backend:
+            self._show_error("未检测到optimizt", "请先安装optimizt或支持AVIF的Pillow后再使用此功能。")
             return
             
         if self.processing:
-            self.stop_requested = True
+            self._request_stop()
             self.avif_webp_button.configure(state="disabled")
             return
             
         # 选择文件或文件夹
-        paths = self._select_files_or_folder("选择要处理的图片或文件夹", ProcessType.AVIF_WEBP)
-        if not paths:
+        target = self._select_files_or_folder("选择要处理的图片或文件夹", ProcessType.AVIF_WEBP)
+        if not target:
             return
             
         self.processing = True
@@ -334,10 +518,20 @@ class MainWindow:
         self.avif_webp_button.configure(text="停止", style="danger.TButton")
         
         # 启动处理
-        self.run_async(self._process_paths(paths, ProcessType.AVIF_WEBP))
+        self._start_processing(target, ProcessType.AVIF_WEBP)
+
+    def _start_processing(self, target: Union[list, str], process_type: ProcessType):
+        """文件夹模式下target为目录，否则为文件列表"""
+        if isinstance(target, str):
+            self.run_async(self._process_folder(target, process_type))
+        else:
+            self.run_async(self._process_paths(target, process_type))
+
+    def _select_files_or_folder(self, title: str, process_type: ProcessType) -> Union[list, str]:
+        """按当前模式选择文件（返回过滤后的文件列表）或文件夹（返回目录路径）"""
+        if self.process_mode.get() == ProcessMode.FOLDER.value:
+            return filedialog.askdirectory(parent=self.root, title=title, mustexist=True)
 
-    def _select_files_or_folder(self, title: str, process_type: ProcessType) -> list:
-        """选择文件"""
         files = filedialog.askopenfilenames(
             parent=self.root,
             title=title,
@@ -345,33 +539,10 @@ class MainWindow:
         )
         
         # 过滤文件
-        filtered_files = []
-        for file in files:
-            # 获取文件名（不含扩展名）和扩展名
-            filename = os.path.splitext(os.path.basename(file))[0]
-            ext = os.path.splitext(file)[1].lower()
-            
-            # 根据处理类型应用不同的排除规则
-            if process_type == ProcessType.THUMBNAIL:
-                # 缩略图处理的排除规则
-                # 1. 跳过webp和avif格式
-                if ext in ['.webp', '.avif']:
-                    continue
-                    
-                # 2. 跳过index和banner文件（精确匹配）
-                if filename in ['index', 'banner']:
-                    continue
-                    
-                # 3. 跳过以_proc结尾的文件
-                if filename.endswith('_proc'):
-                    continue
-            else:
-                # avif/webp处理的排除规则
-                # 只跳过webp和avif格式
-                if ext in ['.webp', '.avif']:
-                    continue
-                
-            filtered_files.append(file)
+        filtered_files = [
+            file for file in files
+            if self.image_processor.selection_skip_reason(file, process_type) is None
+        ]
             
         # 更新待处理队列显示
         if filtered_files:
@@ -388,73 +559,141 @@ class MainWindow:
             # 获取第一个文件的目录作为基准目录
             base_dir = os.path.dirname(paths[0])
             self._display_info(f"开始处理目录: {os.path.basename(base_dir)}")
+            self.counts = QueueCounts(discovered=len(paths), queued=len(paths))
             
-            for path in paths:
-                if self.stop_requested:
-                    break
-                    
-                # 处理单个文件
-                self._display_info(f"处理文件: {os.path.basename(path)}")
-                if process_type == ProcessType.THUMBNAIL:
-                    result = await self.image_processor.process_thumbnail(path)
-                else:
-                    result = await self.image_processor.process_avif_webp(path)
-                self._display_result(result)
+            # 本次任务量和预计耗时与处理同时估算，不推迟第一个文件开始处理
+            estimate_task = asyncio.ensure_future(self._show_estimate(paths, process_type))
+            
+            self.image_processor.lqip_manifest = self._lqip_manifest(process_type)
+
+            # 并发处理，每完成一个文件立即显示结果
+            started = time.perf_counter()
+            results = await self.image_processor.process_files(
+                paths,
+                process_type,
+                progress_callback=self._display_result,
+                should_stop=lambda: self.stop_requested,
+                start_callback=lambda path: self._display_info(f"处理文件: {os.path.basename(path)}")
+            )
+            if not estimate_task.done():
+                estimate_task.cancel()
                     
-            if not self.stop_requested:
-                self._display_info("所有文件处理完成！")
-            else:
-                self._display_info("处理已终止！")
+            await self._report_run(results, started)
                 
         except Exception as e:
             self._display_info(f"处理过程出错: {str(e)}")
         finally:
             self._reset_processing_state()
 
-    def _display_info(self, message: str):
-        """显示处理信息"""
-        def update():
-            self.info_display.configure(state="normal")
-            self.info_display.insert("end", message + "\n")
-            self.info_display.see("end")
-            self.info_display.configure(state="disabled")
-            
-        if threading.current_thread() is threading.main_thread():
-            update()
+    async def _show_estimate(self, paths: list, process_type: ProcessType):
+        """显示文件列表的总大小和预计耗时（按文件头估算，已是最新的文件也计算在内）"""
+        try:
+            plan = await asyncio.get_running_loop().run_in_executor(
+                None, estimate_batch, self.image_processor, paths, process_type
+            )
+        except Exception as e:
+            logging.warning(f"估算耗时失败: {e}")
+            return
+        estimate = "未知" if plan.estimated_seconds is None else f"最多 {plan.estimated_seconds:.0f} 秒"
+        self._display_info(
+            f"共 {len(plan.jobs)} 个文件，{format_file_size(plan.total_bytes)}，预计耗时 {estimate}"
+        )
+
+    async def _process_folder(self, directory: str, process_type: ProcessType):
+        """处理整个目录树：后台线程边枚举边处理，待处理队列和计数随之更新"""
+        try:
+            self._display_info(f"开始处理目录: {os.path.basename(directory) or directory}")
+            self.counts = QueueCounts()
+            self.queue_feed.reset()
+
+            def on_discovered(path: str, reason: Optional[str]):
+                # 在枚举线程中调用，只更新计数和缓冲区，由Tk线程按帧刷新
+                self.counts.discovered += 1
+                if reason is None:
+                    self.counts.queued += 1
+                    self.queue_feed.add(os.path.relpath(path, directory))
+
+            self.image_processor.lqip_manifest = self._lqip_manifest(process_type)
+
+            started = time.perf_counter()
+            results = await self.image_processor.process_directory(
+                directory,
+                process_type,
+                progress_callback=self._display_result,
+                should_stop=lambda: self.stop_requested,
+                start_callback=lambda path: self._display_info(f"处理文件: {os.path.basename(path)}"),
+                discover_callback=on_discovered
+            )
+            if not self.counts.discovered:
+                self._display_info("目录中没有找到图片")
+            await self._report_run(results, started)
+
+        except Exception as e:
+            self._display_info(f"处理过程出错: {str(e)}")
+        finally:
+            self._reset_processing_state()
+
+    async def _resume_run(self, run, process_type: ProcessType):
+        """继续任务日志中的运行；由ImageProcessor.resume先取得运行，已在其他窗口或命令行中继续时不重复处理"""
+        try:
+            self._display_info(f"继续未完成的处理: 剩余 {run.pending}/{run.total} 个文件")
+            self.counts = QueueCounts(discovered=run.pending, queued=run.pending)
+            self.image_processor.lqip_manifest = self._lqip_manifest(process_type)
+
+            started = time.perf_counter()
+            resumed_type, results = await self.image_processor.resume(
+                run.run_id,
+                progress_callback=self._display_result,
+                should_stop=lambda: self.stop_requested,
+                start_callback=lambda path: self._display_info(f"处理文件: {os.path.basename(path)}")
+            )
+            if resumed_type is None:
+                self._display_info("这次处理已在其他窗口或命令行中继续")
+                return
+            await self._report_run(results, started)
+
+        except Exception as e:
+            self._display_info(f"处理过程出错: {str(e)}")
+        finally:
+            self._reset_processing_state()
+
+    async def _report_run(self, results: list, started: float):
+        """显示并保存本次运行的统计"""
+        if not self.stop_requested:
+            self._display_info("所有文件处理完成！")
         else:
-            self.message_queue.put(update)
+            self._display_info("处理已终止！")
+
+        summary = summarize(results, time.perf_counter() - started)
+        for line in summary.format_lines():
+            self._display_info(line)
+        try:
+            path = await asyncio.get_running_loop().run_in_executor(None, summary.write_json)
+            logging.info(f"运行统计已保存: {path}")
+        except OSError as e:
+            logging.warning(f"保存运行统计失败: {e}")
+
+    def _display_info(self, message: str):
+        """显示处理信息（任意线程均可调用，下一帧统一刷新）"""
+        self.log_sink.write(message)
 
     def _update_queue_display(self, files: list):
-        """更新待处理队列显示"""
-        def update():
-            self.queue_display.configure(state="normal")
-            self.queue_display.delete("1.0", "end")
-            for file in files:
-                self.queue_display.insert("end", os.path.basename(file) + "\n")
-            self.queue_display.see("end")
-            self.queue_display.configure(state="disabled")
-            
-        if threading.current_thread() is threading.main_thread():
-            update()
-        else:
-            self.message_queue.put(update)
+        """更新待处理队列显示（下一帧刷新）"""
+        self.queue_feed.reset(os.path.basename(file) for file in files)
 
     def _display_result(self, result: ProcessResult):
         """显示处理结果"""
-        def update():
-            rel_path = os.path.basename(result.input_path)
-            if result.success:
-                self._display_info(f"处理完成: {rel_path}")
-                if result.output_paths:
-                    for output_path in result.output_paths:
-                        self._display_info(f"  └─ 输出: {os.path.basename(output_path)}")
-            else:
-                self._display_info(f"处理失败: {rel_path} - {result.message}")
-                
-        if threading.current_thread() is threading.main_thread():
-            update()
+        if result.success:
+            self.counts.done += 1
+        else:
+            self.counts.failed += 1
+        rel_path = os.path.basename(result.input_path)
+        if result.success:
+            self._display_info(f"处理完成: {rel_path}")
+            for output_path in result.output_paths:
+                self._display_info(f"  └─ 输出: {os.path.basename(output_path)}")
         else:
-            self.message_queue.put(update)
+            self._display_info(f"处理失败: {rel_path} - {result.message}")
         
     def _reset_processing_state(self):
         """重置处理状态"""
@@ -0,0 +1,74 @@
+"""
+待处理队列显示
+
+文件夹模式下目录在后台线程中边枚举边处理，找到的文件随时加入队列；
+和LogSink一样先放进缓冲区，由Tk线程每帧合并成一次插入。文本框最多显示
+若干个文件名，其余的只计数，几万个文件的目录树也不会拖慢界面。
+"""
+import threading
+from dataclasses import dataclass
+from tkinter import Text
+from typing import Iterable, List
+
+# 待处理队列最多显示的文件数
+MAX_QUEUE_LINES = 1000
+
+
+@dataclass
+class QueueCounts:
+    """发现的图片数、其中需要处理的文件数，以及已完成和失败的文件数"""
+    discovered: int = 0
+    queued: int = 0
+    done: int = 0
+    failed: int = 0
+
+    def format(self) -> str:
+        return f"发现 {self.discovered} · 待处理 {self.queued} · 完成 {self.done} · 失败 {self.failed}"
+
+
+class QueueFeed:
+    def __init__(self, widget: Text, max_lines: int = MAX_QUEUE_LINES):
+        self.widget = widget
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        self._pending: List[str] = []
+        self._clear = False
+        self._shown = 0
+        self._hidden = 0
+
+    def reset(self, names: Iterable[str] = ()):
+        """清空队列，可同时加入一批文件名（线程安全）"""
+        with self._lock:
+            self._pending = list(names)
+            self._clear = True
+
+    def add(self, name: str):
+        """加入一个文件名（线程安全）"""
+        with self._lock:
+            self._pending.append(name)
+
+    def flush(self):
+        """把新加入的文件名插入文本框（只能在Tk线程中调用）"""
+        with self._lock:
+            names, self._pending = self._pending, []
+            clear, self._clear = self._clear, False
+        if not names and not clear:
+            return
+
+        widget = self.widget
+        widget.configure(state="normal")
+        if clear:
+            widget.delete("1.0", "end")
+            self._shown = self._hidden = 0
+        elif self._hidden:
+            # 删除上一次的"另有N个文件"行
+            widget.delete(f"{self._shown + 1}.0", "end")
+        room = max(0, self.max_lines - self._shown)
+        if room and names:
+            visible = names[:room]
+            widget.insert("end", "\n".join(visible) + "\n")
+            self._shown += len(visible)
+        self._hidden += len(names) - min(room, len(names))
+        if self._hidden:
+            widget.insert("end", f"... 另有 {self._hidden} 个文件\n")
+        widget.configure(state="disabled")
@@ -0,0 +1,45 @@
+"""
+界面设置
+
+保存在用户数据目录的gui_settings.json中，下次启动时恢复。
+"""
+import os
+import json
+import logging
+from dataclasses import asdict, dataclass, fields
+from typing import Optional
+
+from src.utils.helpers import get_app_data_dir
+
+SETTINGS_FILENAME = "gui_settings.json"
+
+
+@dataclass
+class GuiSettings:
+    # 占位图清单路径，None表示生成缩略图时不写清单
+    lqip_path: Optional[str] = None
+
+    @staticmethod
+    def default_path() -> str:
+        return os.path.join(get_app_data_dir(), SETTINGS_FILENAME)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "GuiSettings":
+        """读取设置，文件不存在或损坏时使用默认值"""
+        try:
+            with open(path or cls.default_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            known = {item.name for item in fields(cls)}
+            return cls(**{key: value for key, value in data.items() if key in known})
+        except (OSError, ValueError, TypeError, AttributeError):
+            return cls()
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.default_path()
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(asdict(self), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"保存界面设置失败: {e}")
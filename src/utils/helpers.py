@@ -21,6 +21,16 @@ def get_npm_global_path() -> Optional[str]:
         return os.path.join(os.environ.get('USERPROFILE', ''), 'AppData', 'Roaming', 'npm')
     return None
 
+def get_app_data_dir() -> str:
+    """获取程序数据目录（清单、缓存等），不存在时自动创建"""
+    if is_windows():
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.environ.get('USERPROFILE', ''), 'AppData', 'Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'blog-image-tool')
+    os.makedirs(path, exist_ok=True)
+    return path
+
 def format_file_size(size_in_bytes: int) -> str:
     """格式化文件大小"""
     for unit in ['B', 'KB', 'MB', 'GB']:
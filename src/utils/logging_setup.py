@@ -0,0 +1,126 @@
+"""
+日志配置
+
+调用方线程只把日志记录放进队列，由后台线程写文件，界面线程和事件循环线程
+都不会因为写日志而阻塞在磁盘I/O上。日志文件按大小轮转，可选输出JSON Lines，
+每个处理任务的记录带有job_id和各阶段耗时等字段，方便用脚本统计。
+
+日志级别和格式可以通过环境变量设置（命令行模式另有同名参数）：
+
+    BLOG_IMAGE_TOOL_LOG_LEVEL   DEBUG/INFO/WARNING/ERROR，默认INFO
+    BLOG_IMAGE_TOOL_LOG_FORMAT  text（默认）或json
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Optional
+
+from src.utils.helpers import get_app_data_dir
+
+LOG_FILENAME = "app.log"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# 单个日志文件的大小上限和保留的旧文件数
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+LOG_LEVEL_ENV = "BLOG_IMAGE_TOOL_LOG_LEVEL"
+LOG_FORMAT_ENV = "BLOG_IMAGE_TOOL_LOG_FORMAT"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+# 通过extra传入、JSON格式中单独输出的字段
+STRUCTURED_FIELDS = ("job_id", "process_type", "input_path", "success", "timings", "input_bytes", "output_bytes")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def default_log_path() -> str:
+    """默认的日志文件路径"""
+    return os.path.join(get_app_data_dir(), LOG_FILENAME)
+
+
+def level_from_env(default: str = "INFO") -> str:
+    level = os.environ.get(LOG_LEVEL_ENV, default).upper()
+    return level if level in LOG_LEVELS else default
+
+
+def json_from_env() -> bool:
+    return os.environ.get(LOG_FORMAT_ENV, "").lower() == "json"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in STRUCTURED_FIELDS:
+            if hasattr(record, name):
+                data[name] = getattr(record, name)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(
+    log_path: Optional[str] = None,
+    level: str = "INFO",
+    json_lines: bool = False,
+    console_level: Optional[str] = None
+):
+    """配置根日志记录器：所有记录经队列交给后台线程写出
+
+    log_path为日志文件路径（按大小轮转），为None时不写文件；
+    console_level不为None时同时输出到标准错误。
+    """
+    global _listener
+    shutdown_logging()
+
+    handlers = []
+    if log_path:
+        try:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+            )
+        except OSError as e:
+            print(f"无法写入日志文件 {log_path}: {e}", file=sys.stderr)
+        else:
+            file_handler.setLevel(level)
+            file_handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+            handlers.append(file_handler)
+    if console_level is not None:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(console_level)
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(console_handler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if not handlers:
+        root.setLevel(level)
+        return
+    # 根记录器的级别取各输出中最低的，低于该级别的调用不会创建日志记录
+    root.setLevel(min(handler.level for handler in handlers))
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """停止后台线程，写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+
+from src.core import output_budget
+from src.core.child_process import ChildTimeoutError, _spawn_options, kill_process_tree, run_child
+from src.core.executor import PixelExecutor
+from src.core.image_processor import ImageProcessor
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="按Unix信号和进程组测试")
+
+# 忽略SIGTERM的子进程，再启动一个同样忽略SIGTERM的孙进程，打印两者的pid后一直运行
+STUBBORN_SCRIPT = """
+import sys, time, signal, subprocess
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+child = subprocess.Popen([sys.executable, "-c",
+    "import time, signal; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('ready', flush=True); time.sleep(60)"],
+    stdout=subprocess.PIPE)
+child.stdout.readline()
+print(child.pid, flush=True)
+time.sleep(60)
+"""
+
+# 先写出一部分输出再一直运行，模拟卡住的编码器
+HANGING_ENCODER = "import sys, time; open(sys.argv[1], 'wb').write(b'partial'); time.sleep(60)"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # 已退出但还没被回收的进程
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def _square(value, timings):
+    return value * value
+
+
+def _sleep(seconds, timings):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_kill_process_tree_forces_stubborn_children_after_grace():
+    async def main():
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", STUBBORN_SCRIPT, stdout=asyncio.subprocess.PIPE, **_spawn_options()
+        )
+        grandchild = int(await process.stdout.readline())
+        started = time.perf_counter()
+        await kill_process_tree(process, grace=0.3)
+        return process, grandchild, time.perf_counter() - started
+
+    process, grandchild, elapsed = asyncio.run(main())
+    assert process.returncode is not None
+    assert 0.3 <= elapsed < 2.0
+    deadline = time.monotonic() + 2.0
+    while _alive(grandchild) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _alive(grandchild)
+
+
+def test_run_child_timeout_kills_child():
+    timings = {}
+    started = time.perf_counter()
+    with pytest.raises(ChildTimeoutError):
+        asyncio.run(run_child([sys.executable, "-c", "import time; time.sleep(60)"], 0.5, timings))
+    assert time.perf_counter() - started < 5.0
+    assert set(timings) == {"spawn", "encode"}
+
+
+def test_timed_out_source_rewrite_leaves_no_temp_file(tmp_path, monkeypatch):
+    source = tmp_path / "photo.jpg"
+    source.write_bytes(b"original")
+    monkeypatch.setattr(ImageProcessor, "_jpegtran_path", property(lambda self: sys.executable))
+    monkeypatch.setattr(
+        output_budget, "jpegtran_command",
+        lambda jpegtran, input_path, output_path: [jpegtran, "-c", HANGING_ENCODER, output_path]
+    )
+    processor = ImageProcessor(concurrency=1, executor=PixelExecutor("thread"), job_timeout=0.5)
+    try:
+        assert asyncio.run(processor._rewrite_source(str(source))) == 0
+    finally:
+        processor.close()
+    assert os.listdir(tmp_path) == ["photo.jpg"]
+    assert source.read_bytes() == b"original"
+
+
+def test_pool_is_usable_after_recycle():
+    executor = PixelExecutor("process", max_workers=1)
+
+    async def main():
+        assert await executor.run(_square, 3) == 9
+        first_pool = executor._pool
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(executor.run(_sleep, 30), 1.0)
+        # 卡住的任务终止了整个进程池，下一个任务使用新的进程池
+        assert executor._pool is not first_pool
+        timings = {}
+        assert await executor.run(_square, 4, timings=timings) == 16
+        assert "pool_wait" in timings
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
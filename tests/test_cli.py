@@ -0,0 +1,82 @@
+import json
+
+import pytest
+from PIL import Image
+
+from src import cli
+
+
+@pytest.fixture(autouse=True)
+def app_data(tmp_path, monkeypatch):
+    """清单、任务日志和工具缓存写到临时目录"""
+    data_dir = tmp_path / "app-data"
+    data_dir.mkdir()
+    monkeypatch.setenv("XDG_CACHE_HOME", str(data_dir))
+    monkeypatch.setenv("LOCALAPPDATA", str(data_dir))
+    return data_dir
+
+
+@pytest.fixture
+def images(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    Image.new("RGB", (64, 48), (200, 80, 40)).save(directory / "photo.png")
+    return directory
+
+
+def _usage_error(argv) -> int:
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(argv)
+    return excinfo.value.code
+
+
+def test_parser_errors(images):
+    assert _usage_error([]) == cli.EXIT_USAGE
+    assert _usage_error(["process"]) == cli.EXIT_USAGE
+    assert _usage_error(["process", "--resume", str(images)]) == cli.EXIT_USAGE
+    assert _usage_error(["process", "--resume", "--no-journal"]) == cli.EXIT_USAGE
+    assert _usage_error(["process", str(images), "--target-size", "10KB", "--avif-webp-backend", "optimizt"]) \
+        == cli.EXIT_USAGE
+
+
+def test_missing_path(tmp_path, capsys):
+    assert cli.main(["process", str(tmp_path / "missing"), "-q"]) == cli.EXIT_USAGE
+    assert "missing" in capsys.readouterr().err
+    assert cli.main(["watch", str(tmp_path / "missing"), "-q"]) == cli.EXIT_USAGE
+
+
+def test_resume_without_unfinished_runs(tmp_path):
+    assert cli.main(["process", "--resume", "--journal", str(tmp_path / "journal.sqlite3")]) == cli.EXIT_OK
+
+
+def test_missing_tool(images, tmp_path, monkeypatch):
+    empty = tmp_path / "empty-path"
+    empty.mkdir()
+    monkeypatch.setenv("PATH", str(empty))
+    argv = ["process", str(images), "--mode", "avif-webp", "--avif-webp-backend", "optimizt", "--no-manifest", "-q"]
+    assert cli.main(argv) == cli.EXIT_MISSING_TOOL
+
+
+def test_process_thumbnails(images, capsys):
+    argv = ["process", str(images), "--mode", "thumbnail", "--thumbnail-backend", "pillow",
+            "--executor", "thread", "--json"]
+    assert cli.main(argv) == cli.EXIT_OK
+    output = json.loads(capsys.readouterr().out)
+    assert output["summary"]["failed"] == 0
+    assert [record["success"] for record in output["results"]] == [True]
+
+
+def test_failed_file(images, capsys):
+    (images / "broken.png").write_bytes(b"\x89PNG\r\n\x1a\nnot an image")
+    argv = ["process", str(images / "broken.png"), "--mode", "thumbnail", "--thumbnail-backend", "pillow",
+            "--executor", "thread", "--json"]
+    assert cli.main(argv) == cli.EXIT_FAILED
+    output = json.loads(capsys.readouterr().out)
+    assert output["summary"]["failed"] == 1
+
+
+def test_plan(images, capsys):
+    argv = ["plan", str(images), "--mode", "thumbnail", "--thumbnail-backend", "pillow", "--json"]
+    assert cli.main(argv) == cli.EXIT_OK
+    plans = json.loads(capsys.readouterr().out)["plans"]
+    assert len(plans) == 1
@@ -0,0 +1,78 @@
+import os
+import asyncio
+
+from src.core import dedup
+from src.core.dedup import DuplicateIndex, break_hardlink, materialize
+
+
+def test_materialize_hardlinks(tmp_path):
+    source = tmp_path / "a.webp"
+    source.write_bytes(b"encoded")
+    target = tmp_path / "b.webp"
+    target.write_bytes(b"stale")
+    assert materialize(str(source), str(target)) == "hardlink"
+    assert target.read_bytes() == b"encoded"
+    assert os.path.samefile(source, target)
+    assert sorted(os.listdir(tmp_path)) == ["a.webp", "b.webp"]
+
+
+def test_materialize_falls_back_to_copy(tmp_path, monkeypatch):
+    def unsupported(source, target):
+        raise OSError("不支持")
+
+    monkeypatch.setattr(dedup.os, "link", unsupported)
+    monkeypatch.setattr(dedup, "_reflink", unsupported)
+    source = tmp_path / "a.webp"
+    source.write_bytes(b"encoded")
+    target = tmp_path / "b.webp"
+    assert materialize(str(source), str(target)) == "copy"
+    assert target.read_bytes() == b"encoded"
+    assert not os.path.samefile(source, target)
+
+
+def test_break_hardlink(tmp_path):
+    source = tmp_path / "a.webp"
+    source.write_bytes(b"encoded")
+    linked = tmp_path / "b.webp"
+    os.link(source, linked)
+    break_hardlink(str(linked))
+    assert not linked.exists()
+    assert source.read_bytes() == b"encoded"
+    # 没有其他链接的文件保持不变
+    break_hardlink(str(source))
+    assert source.exists()
+
+
+def test_duplicate_index(tmp_path):
+    files = {"a.png": b"same", "b.png": b"diff", "c.png": b"same", "d.png": b"longer"}
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+
+    def path(name):
+        return str(tmp_path / name)
+
+    async def main():
+        index = DuplicateIndex()
+        found = {name: await index.find(path(name)) for name in files}
+        assert found == {"a.png": None, "b.png": None, "c.png": path("a.png"), "d.png": None}
+        # 大小不重复的文件不计算哈希
+        assert path("d.png") not in index._hashes
+        index.publish(path("a.png"), "结果")
+        assert await index.result_of(path("a.png")) == "结果"
+
+    asyncio.run(main())
+
+
+def test_duplicate_index_concurrent_lookups(tmp_path):
+    for name in ("a.png", "b.png", "c.png"):
+        (tmp_path / name).write_bytes(b"same")
+
+    async def main():
+        index = DuplicateIndex()
+        return await asyncio.gather(*(index.find(str(tmp_path / name)) for name in ("a.png", "b.png", "c.png")))
+
+    found = asyncio.run(main())
+    # 同时查找时只有一个文件被登记为原件，其余都指向它
+    originals = [item for item in found if item is None]
+    assert len(originals) == 1
+    assert len(set(item for item in found if item is not None)) == 1
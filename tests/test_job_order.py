@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from PIL import Image
+
+from src.core.image_info import read_image_size
+from src.core.job_order import order_paths, order_stream
+
+
+@pytest.fixture
+def images(tmp_path):
+    """像素数: small < medium < large"""
+    paths = {}
+    for name, size in (("medium", (40, 40)), ("small", (10, 10)), ("large", (80, 60))):
+        path = tmp_path / f"{name}.png"
+        Image.new("RGB", size).save(path)
+        paths[name] = str(path)
+    return paths
+
+
+def test_order_paths(images):
+    paths = [images["medium"], images["small"], images["large"]]
+    assert order_paths(paths, "fifo") == paths
+    assert order_paths(paths, "largest-first") == [images["large"], images["medium"], images["small"]]
+    assert order_paths(paths, "smallest-first") == [images["small"], images["medium"], images["large"]]
+
+
+def test_unreadable_file_uses_file_size(images, tmp_path):
+    text = tmp_path / "notes.png"
+    text.write_bytes(b"x" * 10 ** 6)
+    paths = [images["large"], str(text)]
+    assert order_paths(paths, "largest-first") == [str(text), images["large"]]
+
+
+def _collect(paths, order, window):
+    produced = []
+
+    async def source():
+        for path in paths:
+            produced.append(path)
+            yield path
+
+    async def main():
+        consumed = []
+        async for path in order_stream(source(), order, window):
+            # 记录交出每个文件时上游已经枚举了多少个
+            consumed.append((path, len(produced)))
+        return consumed
+
+    return asyncio.run(main())
+
+
+def test_order_stream_first_item_does_not_wait(images):
+    paths = [images["small"], images["medium"], images["large"]]
+    consumed = _collect(paths, "largest-first", 64)
+    assert consumed[0] == (images["small"], 1)
+    assert sorted(path for path, _ in consumed) == sorted(paths)
+
+
+def test_order_stream_window_grows(tmp_path):
+    paths = []
+    for index in range(8):
+        path = tmp_path / f"{index}.png"
+        Image.new("RGB", (index + 1, 1)).save(path)
+        paths.append(str(path))
+    consumed = _collect(paths, "largest-first", 4)
+    # 窗口依次为1、2、4，之后保持4
+    assert [seen for _, seen in consumed[:5]] == [1, 3, 6, 7, 8]
+    assert [path for path, _ in consumed] == [paths[i] for i in (0, 2, 5, 6, 7, 4, 3, 1)]
+
+
+def test_order_stream_fifo(images):
+    paths = [images["large"], images["small"], images["medium"]]
+    assert [path for path, _ in _collect(paths, "fifo", 64)] == paths
+
+
+def test_image_size_cache_follows_changes(tmp_path):
+    path = tmp_path / "a.png"
+    Image.new("RGB", (10, 20)).save(path)
+    assert read_image_size(str(path)) == (10, 20)
+    Image.new("RGB", (30, 40)).save(path)
+    assert read_image_size(str(path)) == (30, 40)
@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import asyncio
+import subprocess
+
+import pytest
+
+from src.core import journal as journal_module
+from src.core.journal import JobJournal
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.sqlite3")
+
+
+def _paths(tmp_path, count):
+    return [os.path.abspath(str(tmp_path / f"{index}.png")) for index in range(count)]
+
+
+def test_resume_returns_unfinished_files(tmp_path, journal_path):
+    paths = _paths(tmp_path, 4)
+    journal = JobJournal(journal_path)
+    run_id = journal.start_run("thumbnail")
+    journal.queued_many(run_id, paths)
+    journal.started(run_id, paths[0])
+    journal.finished(run_id, paths[0], True)
+    journal.started(run_id, paths[1])
+    journal.finished(run_id, paths[1], False, "坏文件")
+    journal.started(run_id, paths[2])
+    journal.close()
+
+    journal = JobJournal(journal_path)
+    try:
+        runs = journal.unfinished_runs()
+        assert [(run.run_id, run.process_type, run.total, run.pending) for run in runs] == [
+            (run_id, "thumbnail", 4, 2)
+        ]
+        # 处理到一半的文件也要重新处理，已失败的不再处理
+        assert journal.pending_paths(run_id) == paths[2:]
+    finally:
+        journal.close()
+
+
+def test_finished_run_is_not_offered(tmp_path, journal_path):
+    paths = _paths(tmp_path, 2)
+    journal = JobJournal(journal_path)
+    run_id = journal.start_run("avif-webp")
+    journal.queued_many(run_id, paths)
+    journal.finish_run(run_id)
+    assert journal.unfinished_runs() == []
+    assert not os.path.exists(f"{journal_path}.run{run_id}.lock")
+    journal.close()
+
+
+def test_run_with_every_file_done_is_closed(tmp_path, journal_path):
+    paths = _paths(tmp_path, 2)
+    journal = JobJournal(journal_path)
+    run_id = journal.start_run("thumbnail")
+    journal.queued_many(run_id, paths)
+    for path in paths:
+        journal.finished(run_id, path, True)
+    journal.close()
+
+    journal = JobJournal(journal_path)
+    try:
+        assert journal.unfinished_runs() == []
+        assert journal.pending_paths(run_id) == []
+    finally:
+        journal.close()
+
+
+def test_live_run_is_not_offered(tmp_path, journal_path):
+    owner = JobJournal(journal_path)
+    run_id = owner.start_run("thumbnail")
+    owner.queued_many(run_id, _paths(tmp_path, 3))
+
+    other = JobJournal(journal_path)
+    try:
+        assert other.unfinished_runs() == []
+        assert not other.claim(run_id)
+        owner.release(run_id)
+        assert [run.run_id for run in other.unfinished_runs()] == [run_id]
+        assert other.claim(run_id)
+    finally:
+        other.close()
+        owner.close()
+
+
+def test_crashed_run_is_offered(tmp_path, journal_path):
+    script = (
+        "import os, sys\n"
+        "sys.path.insert(0, sys.argv[1])\n"
+        "from src.core.journal import JobJournal\n"
+        "journal = JobJournal(sys.argv[2])\n"
+        "run_id = journal.start_run('thumbnail')\n"
+        "journal.queued_many(run_id, sys.argv[3:])\n"
+        "os._exit(0)\n"
+    )
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = _paths(tmp_path, 2)
+    subprocess.run([sys.executable, "-c", script, project_root, journal_path] + paths, check=True)
+
+    journal = JobJournal(journal_path)
+    try:
+        runs = journal.unfinished_runs()
+        assert [run.pending for run in runs] == [2]
+        assert journal.pending_paths(runs[0].run_id) == paths
+    finally:
+        journal.close()
+
+
+def test_timer_flushes_last_state(tmp_path, journal_path, monkeypatch):
+    monkeypatch.setattr(journal_module, "FLUSH_INTERVAL", 0.05)
+    paths = _paths(tmp_path, 2)
+    journal = JobJournal(journal_path)
+    run_id = journal.start_run("thumbnail")
+    journal.queued_many(run_id, paths)
+    journal.finished(run_id, paths[0], True)
+
+    reader = JobJournal(journal_path)
+    try:
+        deadline = time.monotonic() + 5
+        while reader.pending_paths(run_id) != paths[1:] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        # 没有调用flush()，状态由定时器写入
+        assert reader.pending_paths(run_id) == paths[1:]
+    finally:
+        reader.close()
+        journal.close()
+
+
+CRASH_SCRIPT = """
+import os, sys, asyncio
+sys.path.insert(0, sys.argv[1])
+from src.core.executor import PixelExecutor
+from src.core.image_processor import ImageProcessor, ProcessType
+from src.core.journal import JobJournal
+
+processor = ImageProcessor(concurrency=1, thumbnail_backend="pillow", executor=PixelExecutor("thread"),
+                           journal=JobJournal(sys.argv[2]), job_order="fifo")
+done = []
+
+def on_result(result):
+    done.append(result)
+    if len(done) == 3:
+        os._exit(0)
+
+asyncio.run(processor.process_directory(sys.argv[3], ProcessType.THUMBNAIL, progress_callback=on_result))
+"""
+
+
+def test_directory_run_crashed_mid_scan_is_rescanned(tmp_path, journal_path, monkeypatch):
+    from PIL import Image
+
+    from src.core.executor import PixelExecutor
+    from src.core.image_processor import ImageProcessor, ProcessType
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    directory = tmp_path / "img"
+    directory.mkdir()
+    for index in range(12):
+        Image.new("RGB", (800, 600), (index * 20, 0, 0)).save(directory / f"i{index}.png")
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", CRASH_SCRIPT, project_root, journal_path, str(directory)],
+                   check=True, env=dict(os.environ))
+    missing = [index for index in range(12) if not (directory / f"i{index}_proc.jpg").exists()]
+    assert missing
+
+    journal = JobJournal(journal_path)
+    processor = ImageProcessor(concurrency=1, thumbnail_backend="pillow", executor=PixelExecutor("thread"),
+                               journal=journal)
+    try:
+        [run] = journal.unfinished_runs()
+        assert run.directory == str(directory) and not run.scanned
+        process_type, results = asyncio.run(processor.resume(run.run_id))
+        assert process_type == ProcessType.THUMBNAIL
+        assert all(result.success for result in results)
+        assert all((directory / f"i{index}_proc.jpg").exists() for index in range(12))
+        assert journal.unfinished_runs() == []
+    finally:
+        processor.close()
+        journal.close()
+
+
+def test_unscanned_directory_run_without_jobs_is_offered(tmp_path, journal_path):
+    journal = JobJournal(journal_path)
+    run_id = journal.start_run("thumbnail", str(tmp_path))
+    journal.release(run_id)
+    try:
+        [run] = journal.unfinished_runs()
+        assert (run.run_id, run.pending, run.scanned) == (run_id, 0, False)
+        journal.mark_scanned(run_id)
+        assert journal.unfinished_runs() == []
+    finally:
+        journal.close()
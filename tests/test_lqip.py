@@ -0,0 +1,73 @@
+import os
+import json
+
+import pytest
+
+from src.core import lqip, pillow_engine
+
+pytestmark = pytest.mark.skipif(not pillow_engine.is_available(), reason="Pillow未安装")
+needs_numpy = pytest.mark.skipif(lqip.np is None, reason="NumPy未安装")
+
+
+def _image(path, size=(170, 100), color=(255, 0, 0)):
+    pillow_engine.Image.new("RGB", size, color).save(path)
+    return str(path)
+
+
+@needs_numpy
+def test_blurhash_of_solid_color():
+    pixels = lqip.np.zeros((30, 40, 3), dtype=lqip.np.uint8)
+    pixels[...] = (255, 0, 0)
+    result = lqip.blurhash(pixels)
+    # 分量数标记、最大值、直流分量（平均色）各占1、1、4位，11个交流分量各占2位
+    assert len(result) == 6 + 2 * 11
+    assert result[0] == lqip._encode83(3 + 2 * 9, 1)
+    assert result[2:6] == lqip._encode83(0xff0000, 4)
+    assert len(lqip.blurhash(pixels, (1, 1))) == 6
+
+
+@needs_numpy
+def test_dominant_color_picks_largest_group():
+    pixels = lqip.np.zeros((10, 10, 3), dtype=lqip.np.uint8)
+    pixels[:7] = (16, 32, 48)
+    pixels[7:] = (250, 250, 250)
+    assert lqip.dominant_color(pixels) == "#102030"
+
+
+def test_thumbnail_with_placeholder(tmp_path):
+    source = _image(tmp_path / "a.png")
+    output = str(tmp_path / "a_proc.jpg")
+    timings = {}
+    entry = lqip.make_thumbnail_with_placeholder(source, output, timings=timings)
+    assert (entry["width"], entry["height"]) == (170, 100)
+    assert entry["placeholder"].startswith("data:image/jpeg;base64,")
+    assert entry["color"].startswith("#")
+    assert set(timings) == {"decode", "encode", "write"}
+    # 从已有的缩略图补充时内联同一个缩略图（颜色由解码后的JPEG计算，可能略有差别）
+    from_file = lqip.placeholder_from_file(source, output)
+    assert {key: from_file[key] for key in ("width", "height", "placeholder")} == {
+        key: entry[key] for key in ("width", "height", "placeholder")
+    }
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / lqip.MANIFEST_FILENAME)
+    manifest = lqip.LqipManifest(path)
+    image = str(tmp_path / "posts" / "a.png")
+    manifest.add(image, {"width": 1})
+    manifest.save()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == {"version": lqip.MANIFEST_VERSION, "images": {"posts/a.png": {"width": 1}}}
+
+    reloaded = lqip.LqipManifest(path)
+    assert reloaded.has(image)
+    assert not reloaded.has(str(tmp_path / "b.png"))
+    # 清单目录之外的图片使用绝对路径作为键
+    outside = os.path.abspath(str(tmp_path.parent / "c.png"))
+    assert reloaded.key(outside) == outside.replace(os.sep, "/")
+
+
+def test_manifest_ignores_other_versions(tmp_path):
+    path = tmp_path / lqip.MANIFEST_FILENAME
+    path.write_text(json.dumps({"version": lqip.MANIFEST_VERSION + 1, "images": {"a.png": {}}}), encoding="utf-8")
+    assert lqip.LqipManifest(str(path)).entries == {}
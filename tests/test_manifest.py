@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from src.core import manifest as manifest_module
+from src.core.manifest import BuildManifest, hash_file, hash_source
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = BuildManifest(str(tmp_path / "manifest.sqlite3"))
+    yield manifest
+    manifest.close()
+
+
+def _write(path, data: bytes, mtime_ns=None):
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def _touch(path, offset_ns):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + offset_ns))
+
+
+def test_recorded_output_is_up_to_date(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source")
+    output = _write(tmp_path / "a.webp", b"out")
+    manifest.record(source, output, "pillow", {"quality": 80})
+    assert manifest.is_up_to_date(source, output, "pillow", {"quality": 80})
+
+
+def test_params_or_backend_change(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source")
+    output = _write(tmp_path / "a.webp", b"out")
+    manifest.record(source, output, "pillow", {"quality": 80})
+    assert not manifest.is_up_to_date(source, output, "pillow", {"quality": 70})
+    assert not manifest.is_up_to_date(source, output, "optimizt", {"quality": 80})
+
+
+def test_touched_source_with_same_content(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source")
+    output = _write(tmp_path / "a.webp", b"out")
+    manifest.record(source, output, "pillow")
+    _touch(source, 10 ** 9)
+    assert manifest.is_up_to_date(source, output, "pillow")
+
+
+def test_changed_source_content(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source")
+    output = _write(tmp_path / "a.webp", b"out")
+    manifest.record(source, output, "pillow")
+    mtime_ns = os.stat(source).st_mtime_ns
+    # 大小相同、内容不同
+    _write(tmp_path / "a.png", b"SOURCE", mtime_ns + 10 ** 9)
+    assert not manifest.is_up_to_date(source, output, "pillow")
+
+
+def test_modified_or_missing_output(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source")
+    output = _write(tmp_path / "a.webp", b"out")
+    manifest.record(source, output, "pillow")
+    _write(tmp_path / "a.webp", b"edited output")
+    assert not manifest.is_up_to_date(source, output, "pillow")
+    os.remove(output)
+    assert not manifest.is_up_to_date(source, output, "pillow")
+
+
+def test_existing_output_is_adopted(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source", 10 ** 18)
+    output = _write(tmp_path / "a.webp", b"out", 10 ** 18 + 10 ** 9)
+    assert manifest.is_up_to_date(source, output, "pillow")
+    # 登记后按记录的参数判断
+    assert not manifest.is_up_to_date(source, output, "pillow", {"quality": 70})
+
+
+def test_older_existing_output_is_not_adopted(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source", 10 ** 18)
+    output = _write(tmp_path / "a.webp", b"out", 10 ** 18 - 10 ** 9)
+    assert not manifest.is_up_to_date(source, output, "pillow")
+
+
+def test_dropped_output(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source")
+    output = str(tmp_path / "a.webp")
+    manifest.record_dropped(source, output, "pillow")
+    assert manifest.is_dropped(output)
+    assert not manifest.is_up_to_date(source, output, "pillow")
+    assert manifest.is_up_to_date(source, output, "pillow", allow_dropped=True)
+    assert not manifest.is_up_to_date(source, output, "pillow", {"quality": 70}, allow_dropped=True)
+
+
+def test_refresh_source_keeps_outputs_valid(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source")
+    output = _write(tmp_path / "a.webp", b"out")
+    manifest.record(source, output, "pillow")
+    previous_stat = os.stat(source)
+    _write(tmp_path / "a.png", b"smaller", previous_stat.st_mtime_ns + 10 ** 9)
+    assert not manifest.is_up_to_date(source, output, "pillow")
+    manifest.refresh_source(source, previous_stat, None)
+    assert manifest.is_up_to_date(source, output, "pillow")
+
+
+def test_forget(tmp_path, manifest):
+    source = _write(tmp_path / "a.png", b"source", 10 ** 18)
+    output = _write(tmp_path / "a.webp", b"out", 10 ** 18 - 10 ** 9)
+    manifest.record(source, output, "pillow")
+    manifest.forget(output)
+    assert not manifest.is_up_to_date(source, output, "pillow")
+
+
+def test_hash_source_reads_each_version_once(tmp_path, monkeypatch):
+    source = _write(tmp_path / "a.png", b"source", mtime_ns=1_000_000_000)
+    calls = []
+    monkeypatch.setattr(manifest_module, "hash_file", lambda path: calls.append(path) or hash_file(path))
+    manifest_module._cached_hash.cache_clear()
+    first = hash_source(source)
+    assert hash_source(source) == first
+    assert len(calls) == 1
+
+    _write(tmp_path / "a.png", b"changed", mtime_ns=2_000_000_000)
+    assert hash_source(source) != first
+    assert len(calls) == 2
+
+
+def test_record_uses_given_source_hash(tmp_path, manifest, monkeypatch):
+    source = _write(tmp_path / "a.png", b"source")
+    outputs = [_write(tmp_path / "a.webp", b"out"), _write(tmp_path / "a.avif", b"out")]
+    source_hash = hash_file(source)
+    monkeypatch.setattr(manifest_module, "hash_file", lambda path: pytest.fail("source hashed again"))
+    for output in outputs:
+        manifest.record(source, output, "pillow", {"quality": 80}, source_hash)
+    manifest.record_dropped(source, str(tmp_path / "a.jpg"), "pillow", {"quality": 80}, source_hash)
+    assert all(manifest.is_up_to_date(source, output, "pillow", {"quality": 80}) for output in outputs)
+    assert manifest.is_dropped(str(tmp_path / "a.jpg"))
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from src.core.executor import PixelExecutor
+from src.core.image_processor import DECODE_BYTES_PER_PIXEL, ImageProcessor, ProcessResult, ProcessType
+from src.core.memory_budget import MemoryBudget
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def test_reservations_wait_for_budget():
+    budget = MemoryBudget(100)
+    events = []
+
+    async def job(name, nbytes, hold):
+        async with budget.reserve(nbytes):
+            events.append(("start", name, budget.used))
+            await asyncio.sleep(hold)
+        events.append(("end", name))
+
+    async def main():
+        await asyncio.gather(job("a", 60, 0.05), job("b", 60, 0.0), job("c", 30, 0.0))
+
+    asyncio.run(main())
+    # b要等a释放才能开始，c可以和a同时运行
+    assert events.index(("start", "b", 60)) > events.index(("end", "a"))
+    assert ("start", "c", 90) in events
+    assert budget.used == 0
+
+
+def test_oversized_reservation_runs_alone():
+    budget = MemoryBudget(100)
+    seen = []
+
+    async def job(nbytes):
+        async with budget.reserve(nbytes):
+            seen.append(budget.used)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(job(500), job(500))
+
+    asyncio.run(main())
+    assert seen == [500, 500]
+
+
+class _RecordingBudget(MemoryBudget):
+    def __init__(self):
+        super().__init__(10 ** 12)
+        self.reserved = []
+
+    def reserve(self, nbytes):
+        self.reserved.append(nbytes)
+        return super().reserve(nbytes)
+
+
+def test_optimizt_chunks_reserve_memory(tmp_path, monkeypatch):
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"{index}.png"
+        Image.new("RGB", (10 * (index + 1), 10)).save(path)
+        paths.append(str(path))
+    budget = _RecordingBudget()
+    processor = ImageProcessor(
+        concurrency=1, avif_webp_backend="optimizt", optimizt_chunk_size=4, executor=PixelExecutor("thread"),
+        memory_budget=budget, deduplicate=False, job_order="fifo"
+    )
+    monkeypatch.setattr(ImageProcessor, "_optimizt_path", property(lambda self: "optimizt"))
+    held = []
+
+    async def fake_chunk(chunk):
+        held.append(budget.used)
+        return [ProcessResult(success=True, message="处理成功", input_path=job[0], output_paths=[]) for job in chunk]
+
+    monkeypatch.setattr(processor, "_run_optimizt_chunk", fake_chunk)
+    try:
+        results = asyncio.run(processor.process_files(paths, ProcessType.AVIF_WEBP))
+    finally:
+        processor.close()
+
+    assert sorted(result.input_path for result in results) == sorted(paths)
+    # 块大小从1开始倍增：第一块1个文件，第二块2个文件
+    per_pixel = DECODE_BYTES_PER_PIXEL["avif_webp"]
+    assert budget.reserved == [100 * per_pixel, (200 + 300) * per_pixel]
+    assert held == budget.reserved
+    assert all("memory_wait" in result.timings for result in results)
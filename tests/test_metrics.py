@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from src.core import pillow_engine
+from src.core.executor import PixelExecutor
+from src.core.image_processor import ImageProcessor, ProcessResult, ProcessType
+from src.core.metrics import summarize
+
+
+def _result(path, input_bytes, kind_bytes, source_saved_bytes=0, **kwargs):
+    return ProcessResult(
+        success=True, message="处理成功", input_path=path, output_paths=[],
+        timings={"total": 1.0, "encode": 0.5, "write": 0.1},
+        input_bytes=input_bytes, output_bytes=sum(kind_bytes.values()), kind_bytes=kind_bytes,
+        source_saved_bytes=source_saved_bytes, **kwargs
+    )
+
+
+def test_source_counted_once_across_process_types():
+    results = [
+        _result("a.png", 1000, {"thumbnail": 50}),
+        _result("a.png", 1000, {"webp": 300, "avif": 200}),
+    ]
+    summary = summarize(results, 2.0)
+    assert summary.input_bytes == 1000
+    assert summary.output_bytes == 550
+    # 只按最小的同尺寸输出计算一次
+    assert summary.bytes_saved == 800
+
+
+def test_thumbnails_and_srcset_are_not_savings():
+    results = [_result("a.png", 1000, {"thumbnail": 50, "srcset-webp": 120})]
+    summary = summarize(results, 1.0)
+    assert summary.bytes_saved == 0
+    assert summary.savings["thumbnail"].saved is None
+    assert summary.savings["srcset-webp"].output_bytes == 120
+    assert all("节省" not in line for line in summary.format_lines())
+    assert summary.to_dict()["savings"]["thumbnail"]["bytes_saved"] is None
+
+
+def test_per_kind_savings():
+    results = [
+        _result("a.png", 1000, {"webp": 300, "avif": 200}),
+        _result("b.png", 500, {"webp": 600}),
+    ]
+    summary = summarize(results, 1.0)
+    assert (summary.savings["webp"].files, summary.savings["webp"].input_bytes) == (2, 1500)
+    assert summary.savings["webp"].saved == 600
+    assert summary.savings["avif"].saved == 800
+    # 输出比源文件大时计为负数
+    assert summary.bytes_saved == 800 - 100
+
+
+def test_optimized_source():
+    results = [_result("a.png", 1000, {"webp": 900}, source_saved_bytes=300)]
+    summary = summarize(results, 1.0)
+    assert summary.savings["source"].saved == 300
+    assert summary.bytes_saved == 300
+
+
+def test_skipped_and_failed_results():
+    results = [
+        _result("a.png", 1000, {"webp": 300}),
+        _result("b.png", 1000, {"webp": 300}, skipped=True),
+        ProcessResult(success=False, message="处理出错", input_path="c.png", output_paths=[]),
+    ]
+    summary = summarize(results, 1.0)
+    assert (summary.total, summary.succeeded, summary.skipped, summary.failed) == (3, 2, 1, 1)
+    assert summary.processed == 1
+    assert summary.input_bytes == 1000
+    assert summary.stage_seconds["encode"] == 0.5
+
+
+@pytest.mark.skipif(len(pillow_engine.supported_formats(["webp", "avif"])) < 2, reason="Pillow不支持webp/avif")
+def test_summary_of_real_run(tmp_path):
+    source = tmp_path / "a.png"
+    pillow_engine.Image.effect_noise((120, 80), 60).convert("RGB").save(source)
+    processor = ImageProcessor(
+        concurrency=1, thumbnail_backend="pillow", avif_webp_backend="pillow", executor=PixelExecutor("thread")
+    )
+
+    async def main():
+        results = []
+        for process_type in (ProcessType.THUMBNAIL, ProcessType.AVIF_WEBP):
+            results += await processor.process_files([str(source)], process_type)
+        return results
+
+    try:
+        results = asyncio.run(main())
+    finally:
+        processor.close()
+    sizes = {path.suffix: path.stat().st_size for path in tmp_path.iterdir() if path.name != "a.png"}
+    summary = summarize(results, 1.0)
+    assert summary.input_bytes == source.stat().st_size
+    assert summary.output_bytes == sum(sizes.values())
+    assert summary.bytes_saved == source.stat().st_size - min(sizes[".webp"], sizes[".avif"])
+    assert summary.savings["thumbnail"].output_bytes == sizes[".jpg"]
+    for stage in ("decode", "encode", "write"):
+        assert summary.stage_seconds[stage] > 0
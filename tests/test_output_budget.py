@@ -0,0 +1,53 @@
+import pytest
+
+from src.core import output_budget, pillow_engine
+
+
+def _write(path, size):
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_outputs_must_be_smaller_than_source(tmp_path):
+    source = _write(tmp_path / "a.png", 1000)
+    webp = _write(tmp_path / "a.webp", 980)
+    avif = _write(tmp_path / "a.avif", 1200)
+    rejected = output_budget.check_outputs(source, [webp, avif], 0.05)
+    assert set(rejected) == {webp, avif}
+    assert "只比源文件小2%" in rejected[webp]
+    assert "比源文件大20%" in rejected[avif]
+
+
+def test_avif_must_be_smaller_than_webp(tmp_path):
+    source = _write(tmp_path / "a.png", 1000)
+    webp = _write(tmp_path / "a.webp", 300)
+    avif = _write(tmp_path / "a.avif", 400)
+    assert output_budget.check_outputs(source, [webp, avif], 0.05) == {avif: "a.avif不比webp小"}
+    # 较早生成的webp也参与比较
+    assert output_budget.check_outputs(source, [avif], 0.05) == {avif: "a.avif不比webp小"}
+
+
+def test_good_outputs_pass(tmp_path):
+    source = _write(tmp_path / "a.png", 1000)
+    webp = _write(tmp_path / "a.webp", 300)
+    avif = _write(tmp_path / "a.avif", 200)
+    assert output_budget.check_outputs(source, [webp, avif], 0.05) == {}
+
+
+@pytest.mark.skipif(not pillow_engine.is_available(), reason="Pillow未安装")
+def test_optimize_png_is_lossless(tmp_path):
+    Image = pillow_engine.Image
+    path = tmp_path / "a.png"
+    image = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
+    image.paste((255, 0, 0, 255), (0, 0, 32, 32))
+    image.save(path, compress_level=0)
+    original = path.stat().st_size
+    timings = {}
+    saved = output_budget.optimize_png(str(path), temp_tag="job", timings=timings)
+    assert saved == original - path.stat().st_size > 0
+    with Image.open(path) as optimized:
+        assert optimized.tobytes() == image.tobytes()
+    assert [p.name for p in tmp_path.iterdir()] == ["a.png"]
+    assert set(timings) == {"decode", "encode", "write"}
+    # 已经是最优压缩时不改写
+    assert output_budget.optimize_png(str(path)) == 0
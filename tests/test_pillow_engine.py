@@ -0,0 +1,120 @@
+import os
+import stat
+
+import pytest
+
+from src.core import pillow_engine
+
+
+def test_write_atomic_replaces_output(tmp_path):
+    output = tmp_path / "a.webp"
+    pillow_engine.write_atomic(b"first", str(output))
+    pillow_engine.write_atomic(b"second", str(output), "job")
+    assert output.read_bytes() == b"second"
+    assert os.listdir(tmp_path) == ["a.webp"]
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Windows没有Unix权限")
+def test_write_atomic_uses_normal_file_mode(tmp_path):
+    output = tmp_path / "a.webp"
+    pillow_engine.write_atomic(b"data", str(output))
+    assert stat.S_IMODE(os.stat(output).st_mode) == 0o666 & ~pillow_engine._UMASK
+    os.chmod(output, 0o640)
+    pillow_engine.write_atomic(b"data", str(output))
+    assert stat.S_IMODE(os.stat(output).st_mode) == 0o640
+
+
+def test_temp_files_are_unique_per_writer(tmp_path):
+    output = str(tmp_path / "a.avif")
+    # 被中断的运行遗留的工作进程还在写同一个输出
+    orphan = tmp_path / (pillow_engine.temp_prefix(output, "old") + "x" + pillow_engine.TEMP_SUFFIX)
+    orphan.write_bytes(b"partial")
+    pillow_engine.write_atomic(b"new", output, "new")
+    assert orphan.read_bytes() == b"partial"
+    assert (tmp_path / "a.avif").read_bytes() == b"new"
+
+
+def test_remove_temp_files_only_removes_own_tag(tmp_path):
+    output = str(tmp_path / "a.avif")
+    mine = tmp_path / (pillow_engine.temp_prefix(output, "mine") + "1" + pillow_engine.TEMP_SUFFIX)
+    other = tmp_path / (pillow_engine.temp_prefix(output, "other") + "2" + pillow_engine.TEMP_SUFFIX)
+    mine.write_bytes(b"")
+    other.write_bytes(b"")
+    pillow_engine.remove_temp_files([output], "mine")
+    assert not mine.exists()
+    assert other.exists()
+
+
+Image = pillow_engine.Image
+needs_pillow = pytest.mark.skipif(not pillow_engine.is_available(), reason="Pillow未安装")
+needs_webp_avif = pytest.mark.skipif(
+    len(pillow_engine.supported_formats(["webp", "avif"])) < 2, reason="Pillow不支持webp/avif"
+)
+
+
+def _image(path, size=(64, 48), mode="RGB", color=(200, 80, 40)):
+    Image.new(mode, size, color).save(path)
+    return str(path)
+
+
+@needs_pillow
+def test_open_image_rejects_decompression_bombs(tmp_path):
+    source = _image(tmp_path / "big.png", size=(100, 100))
+    with pytest.raises(Image.DecompressionBombError):
+        pillow_engine.open_image(source, max_pixels=5000)
+    with pillow_engine.open_image(source, max_pixels=10000) as img:
+        assert img.size == (100, 100)
+    with pillow_engine.open_image(source, max_pixels=None) as img:
+        assert img.size == (100, 100)
+
+
+@needs_pillow
+def test_bomb_guard_leaves_no_output(tmp_path):
+    source = _image(tmp_path / "big.png", size=(100, 100))
+    output = str(tmp_path / "big_proc.jpg")
+    with pytest.raises(Image.DecompressionBombError):
+        pillow_engine.make_thumbnail(source, output, max_pixels=5000, temp_tag="job")
+    assert os.listdir(tmp_path) == ["big.png"]
+
+
+@needs_pillow
+def test_make_thumbnail(tmp_path):
+    source = _image(tmp_path / "a.png", size=(170, 100), mode="RGBA", color=(0, 0, 255, 128))
+    output = str(tmp_path / "a_proc.jpg")
+    timings = {}
+    size = pillow_engine.make_thumbnail(source, output, timings=timings)
+    assert size == (pillow_engine.THUMBNAIL_WIDTH, 10)
+    with Image.open(output) as thumb:
+        assert (thumb.format, thumb.mode, thumb.size) == ("JPEG", "RGB", size)
+    assert set(timings) == {"decode", "encode", "write"}
+
+
+@pytest.mark.parametrize("width, scale", [(100, 1), (136, 2), (1000, 8), (100000, 8)])
+def test_draft_scale(width, scale):
+    assert pillow_engine.draft_scale(width, pillow_engine.THUMBNAIL_WIDTH) == scale
+
+
+@needs_webp_avif
+def test_convert_formats_keeps_alpha(tmp_path):
+    source = _image(tmp_path / "a.png", mode="RGBA", color=(10, 20, 30, 0))
+    outputs = {"webp": str(tmp_path / "a.webp"), "avif": str(tmp_path / "a.avif")}
+    timings = {}
+    written = pillow_engine.convert_formats(source, outputs, {"webp": {"lossless": True}}, timings=timings)
+    assert written == list(outputs.values())
+    with Image.open(outputs["webp"]) as img:
+        assert img.mode == "RGBA" and img.size == (64, 48)
+        assert img.getpixel((0, 0))[3] == 0
+    assert set(timings) == {"decode", "encode", "write"}
+
+
+@needs_webp_avif
+def test_make_variants_skips_upscaling_and_unneeded(tmp_path):
+    source = _image(tmp_path / "a.png", size=(1000, 500))
+    needed = {pillow_engine.variant_path(source, 480, "webp"), pillow_engine.variant_path(source, 960, "avif")}
+    written = pillow_engine.make_variants(source, needed=needed)
+    assert sorted(written) == sorted(needed)
+    with Image.open(pillow_engine.variant_path(source, 480, "webp")) as img:
+        assert img.size == (480, 240)
+    # 1600宽度大于源图片，不放大
+    assert not os.path.exists(pillow_engine.variant_path(source, 1600, "webp"))
+    assert pillow_engine.variant_widths(1000, pillow_engine.SRCSET_WIDTHS) == [960, 480]
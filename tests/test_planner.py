@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from src.core.executor import PixelExecutor
+from src.core.image_processor import THUMBNAIL_PARAMS, ImageProcessor, ProcessType
+from src.core.manifest import BuildManifest
+from src.core.planner import plan_batch
+from src.core.throughput import ThroughputHistory
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _image(path, size=(100, 50)):
+    Image.new("RGB", size).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def processor(tmp_path):
+    manifest = BuildManifest(str(tmp_path / "manifest.sqlite3"))
+    processor = ImageProcessor(
+        concurrency=2, thumbnail_backend="pillow", manifest=manifest, executor=PixelExecutor("thread")
+    )
+    yield processor
+    processor.close()
+    manifest.close()
+
+
+def test_plan_matches_processing_rules(tmp_path, processor):
+    site = tmp_path / "site"
+    (site / "posts").mkdir(parents=True)
+    new = _image(site / "posts" / "new.png")
+    _image(site / "banner.png")
+    done = _image(site / "done.png")
+    picked = _image(tmp_path / "index-cover.png", size=(200, 100))
+    processor.manifest.record(done, _image(site / "done_proc.jpg", size=(17, 9)), "pillow",
+                              THUMBNAIL_PARAMS["pillow"])
+
+    plan = plan_batch(processor, [str(site), picked, str(tmp_path / "missing.png")], ProcessType.THUMBNAIL)
+    # 目录中文件名包含index/banner/proc的都排除，单独选择的文件只排除名为index/banner的
+    assert sorted(job.path for job in plan.jobs) == sorted([new, picked])
+    assert plan.skip_counts() == {"文件名包含banner/index/proc": 1, "缩略图文件": 1, "缩略图已是最新": 1, "文件不存在": 1}
+    assert (plan.total_pixels, plan.total_bytes) == (
+        100 * 50 + 200 * 100, os.path.getsize(new) + os.path.getsize(picked)
+    )
+    assert plan.estimated_seconds is None
+    data = plan.to_dict()
+    assert (data["job_count"], data["skipped_count"], data["process_type"]) == (2, 4, "thumbnail")
+
+
+def test_estimate_from_history(tmp_path, processor):
+    history = ThroughputHistory(str(tmp_path / "throughput.json"))
+    history.record(processor.throughput_key(ProcessType.THUMBNAIL), 1.0, 4.0)
+    path = _image(tmp_path / "a.png", size=(1000, 1000))
+    plan = plan_batch(processor, [path], ProcessType.THUMBNAIL, history)
+    # 每百万像素4秒，两个并发
+    assert plan.estimated_seconds == pytest.approx(2.0)
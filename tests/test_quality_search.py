@@ -0,0 +1,57 @@
+import itertools
+
+import pytest
+from PIL import Image
+
+from src.core import pillow_engine
+from src.core.quality_search import QualityTarget, find_boundary, search_format
+
+
+def _counted(threshold):
+    calls = []
+
+    def above(q):
+        calls.append(q)
+        return q >= threshold
+    return above, calls
+
+
+@pytest.mark.parametrize("threshold, guess", list(itertools.product([0, 1, 37, 50, 99, 100, 101], [0, 50, 80, 100])))
+def test_find_boundary_is_exact(threshold, guess):
+    above, calls = _counted(threshold)
+    left, right = find_boundary(above, 0, 100, guess, max_evaluations=100)
+    assert left == right == threshold
+    assert len(calls) == len(set(calls))
+    # 倍增找区间再二分，远少于逐个尝试
+    assert len(calls) <= 12
+
+
+@pytest.mark.parametrize("threshold, guess", list(itertools.product([0, 13, 64, 101], [0, 40, 100])))
+def test_find_boundary_respects_evaluation_cap(threshold, guess):
+    above, calls = _counted(threshold)
+    left, right = find_boundary(above, 0, 100, guess, max_evaluations=3)
+    assert len(calls) <= 3
+    # 返回的区间始终包含真实的边界
+    assert left <= threshold <= right
+
+
+def test_guess_near_boundary_needs_few_evaluations():
+    above, calls = _counted(72)
+    assert find_boundary(above, 0, 100, 71, max_evaluations=100) == (72, 72)
+    assert len(calls) <= 4
+
+
+@pytest.fixture
+def image():
+    image = Image.new("RGB", (96, 96))
+    image.putdata([((x * 7) % 256, (y * 5) % 256, (x * y) % 256) for y in range(96) for x in range(96)])
+    return image
+
+
+@pytest.mark.skipif("webp" not in pillow_engine.supported_formats(["webp"]), reason="Pillow不支持webp")
+def test_search_format_fits_size_budget(image):
+    largest = search_format(image, "webp", {}, QualityTarget("size", 10 ** 9), 50)
+    budget = largest["bytes"] // 2
+    result = search_format(image, "webp", {}, QualityTarget("size", budget), 50)
+    assert result["bytes"] <= budget
+    assert result["evaluations"] <= 8
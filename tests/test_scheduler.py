@@ -0,0 +1,103 @@
+import asyncio
+
+from src.core.scheduler import BatchScheduler
+
+
+async def _items(values):
+    for value in values:
+        await asyncio.sleep(0)
+        yield value
+
+
+def test_concurrency_is_bounded():
+    scheduler = BatchScheduler(concurrency=2)
+    running = 0
+    peak = 0
+
+    async def worker(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return item
+
+    results = asyncio.run(scheduler.run(range(1, 7), worker))
+    assert sorted(results) == list(range(1, 7))
+    assert peak == 2
+
+
+def test_stream_items_are_all_processed():
+    scheduler = BatchScheduler(concurrency=3)
+
+    async def worker(item):
+        await asyncio.sleep(0)
+        return item * 10
+
+    results = asyncio.run(scheduler.run(_items(range(1, 8)), worker))
+    assert sorted(results) == [10, 20, 30, 40, 50, 60, 70]
+
+
+def test_worker_error_uses_error_factory():
+    scheduler = BatchScheduler(concurrency=2)
+
+    async def worker(item):
+        if item == 2:
+            raise ValueError("坏文件")
+        return item
+
+    results = asyncio.run(scheduler.run([1, 2, 3], worker, error_factory=lambda item, e: f"{item}: {e}"))
+    assert sorted(map(str, results)) == ["1", "2: 坏文件", "3"]
+
+
+def _run_cancelled(items):
+    """处理到一半时取消，返回(结果, 开始的任务, 被取消的任务, 调度器)"""
+    scheduler = BatchScheduler(concurrency=2)
+    started = []
+    interrupted = []
+
+    async def worker(item):
+        started.append(item)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            interrupted.append(item)
+            raise
+        return item
+
+    async def main():
+        batch = asyncio.create_task(scheduler.run(items(), worker))
+        while len(started) < 2:
+            await asyncio.sleep(0)
+        scheduler.cancel()
+        return await asyncio.wait_for(batch, 5)
+
+    results = asyncio.run(main())
+    return results, started, interrupted, scheduler
+
+
+def test_cancel_stops_running_workers():
+    results, started, interrupted, scheduler = _run_cancelled(lambda: range(10))
+    assert results == []
+    assert sorted(started) == [0, 1]
+    assert sorted(interrupted) == [0, 1]
+    assert scheduler.cancelled
+
+
+def test_cancel_stops_stream():
+    results, started, interrupted, scheduler = _run_cancelled(lambda: _items(range(10)))
+    assert results == []
+    assert sorted(started) == [0, 1]
+    assert sorted(interrupted) == [0, 1]
+    assert scheduler.cancelled
+
+
+def test_cancel_flag_resets_on_next_run():
+    scheduler = BatchScheduler(concurrency=1)
+    scheduler.cancel()
+
+    async def worker(item):
+        return item
+
+    assert asyncio.run(scheduler.run([1, 2], worker)) == [1, 2]
+    assert not scheduler.cancelled
@@ -0,0 +1,57 @@
+import os
+import asyncio
+
+import pytest
+
+from src.core import pillow_engine
+from src.core.executor import PixelExecutor
+from src.core.image_processor import ImageProcessor, ProcessType
+from src.core.manifest import BuildManifest
+
+pytestmark = pytest.mark.skipif(
+    len(pillow_engine.supported_formats(["webp", "avif"])) < 2, reason="Pillow不支持webp/avif"
+)
+
+
+@pytest.fixture
+def processor(tmp_path):
+    manifest = BuildManifest(str(tmp_path / "manifest.sqlite3"))
+    processor = ImageProcessor(
+        concurrency=1, manifest=manifest, executor=PixelExecutor("thread"), srcset_widths=(200, 400, 800)
+    )
+    yield processor
+    processor.close()
+    manifest.close()
+
+
+def _image(path, size):
+    pillow_engine.Image.new("RGB", size, (30, 120, 200)).save(path)
+    return str(path)
+
+
+def _run(processor, paths):
+    return asyncio.run(processor.process_files(paths, ProcessType.SRCSET))
+
+
+def test_srcset_widths_and_incremental_rebuild(tmp_path, processor):
+    source = _image(tmp_path / "a.png", (500, 250))
+    [result] = _run(processor, [source])
+    expected = [pillow_engine.variant_path(source, width, fmt) for width in (400, 200) for fmt in ("webp", "avif")]
+    assert result.success and sorted(result.output_paths) == sorted(expected)
+    with pillow_engine.Image.open(expected[0]) as img:
+        assert img.size == (400, 200)
+    assert set(result.kind_bytes) == {"srcset-webp", "srcset-avif"}
+
+    [result] = _run(processor, [source])
+    assert result.skipped
+
+    # 删除一个输出后只重新生成这一个
+    os.remove(expected[2])
+    [result] = _run(processor, [source])
+    assert result.output_paths == [expected[2]]
+
+
+def test_source_smaller_than_all_widths(tmp_path, processor):
+    source = _image(tmp_path / "tiny.png", (100, 50))
+    [result] = _run(processor, [source])
+    assert result.skipped and result.output_paths == []
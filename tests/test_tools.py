@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from src.core import tools
+from src.core.tools import ToolInfo, ToolRegistry
+
+
+@pytest.fixture
+def optimizt(tmp_path, monkeypatch):
+    """假的optimizt可执行文件，probe_results依次为每次探测的结果"""
+    path = tmp_path / "optimizt"
+    path.write_text("")
+    probe_results = []
+    monkeypatch.setitem(tools.LOCATORS, "optimizt", lambda: str(path))
+    monkeypatch.setitem(tools.PROBES, "optimizt", lambda found: probe_results.pop(0))
+    return probe_results
+
+
+def test_successful_probe_is_cached(tmp_path, optimizt):
+    cache_path = str(tmp_path / "tools.json")
+    optimizt.append(ToolInfo("optimizt", "/usr/bin/optimizt", "1.0"))
+    assert ToolRegistry(cache_path).get("optimizt").version == "1.0"
+    # 第二次启动直接读取缓存，不再探测
+    assert ToolRegistry(cache_path).get("optimizt").version == "1.0"
+    assert optimizt == []
+
+
+def test_failed_probe_is_not_cached(tmp_path, optimizt):
+    cache_path = str(tmp_path / "tools.json")
+    optimizt.extend([None, ToolInfo("optimizt", "/usr/bin/optimizt", "1.0")])
+    assert not ToolRegistry(cache_path).get("optimizt").available
+    assert ToolRegistry(cache_path).get("optimizt").available
+
+
+def test_cached_failure_from_older_version_is_ignored(tmp_path, optimizt):
+    cache_path = tmp_path / "tools.json"
+    registry = ToolRegistry(str(cache_path))
+    key = registry._cache_key(tools.LOCATORS["optimizt"]())
+    cache_path.write_text(json.dumps({"optimizt": {"key": key, "info": {"name": "optimizt", "path": None}}}))
+    optimizt.append(ToolInfo("optimizt", "/usr/bin/optimizt", "1.0"))
+    assert ToolRegistry(str(cache_path)).get("optimizt").available
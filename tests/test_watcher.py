@@ -0,0 +1,70 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from src.core.executor import PixelExecutor
+from src.core.image_processor import ImageProcessor, ProcessType
+from src.core.watcher import ImageWatcher, is_candidate, scan_tree
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _image(path, size=(40, 20)):
+    Image.new("RGB", size).save(path)
+    return str(path)
+
+
+def test_outputs_are_not_candidates():
+    assert is_candidate("a.PNG") and is_candidate("b.jpeg")
+    assert not any(is_candidate(name) for name in ("a_proc.jpg", "a.webp", "a.avif", "notes.txt"))
+
+
+def test_scan_tree_finds_nested_sources(tmp_path):
+    (tmp_path / "posts").mkdir()
+    nested = _image(tmp_path / "posts" / "a.png")
+    _image(tmp_path / "a_proc.jpg")
+    assert list(scan_tree(str(tmp_path))) == [nested]
+
+
+def test_changes_are_debounced_and_processed_once(tmp_path):
+    watcher = ImageWatcher(None, str(tmp_path), [ProcessType.THUMBNAIL], debounce=0.2, use_inotify=False)
+    path = _image(tmp_path / "a.png")
+    watcher._touch(path)
+    assert watcher._collect_ready() == []
+    time.sleep(0.25)
+    assert watcher._collect_ready() == [path]
+    # 大小和修改时间未变的文件再次收到事件时不重复处理
+    watcher._touch(path)
+    time.sleep(0.25)
+    assert watcher._collect_ready() == []
+
+
+def test_watch_processes_existing_and_new_files(tmp_path):
+    existing = _image(tmp_path / "a.png")
+    processor = ImageProcessor(concurrency=1, thumbnail_backend="pillow", executor=PixelExecutor("thread"))
+    results = []
+    added = []
+
+    def on_result(result):
+        results.append(result)
+        if not added:
+            added.append(_image(tmp_path / "b.png"))
+
+    watcher = ImageWatcher(
+        processor, str(tmp_path), [ProcessType.THUMBNAIL], debounce=0.1, poll_interval=0.1,
+        use_inotify=False, progress_callback=on_result
+    )
+    deadline = time.monotonic() + 10
+
+    def should_stop():
+        return len(results) >= 2 or time.monotonic() > deadline
+
+    try:
+        asyncio.run(watcher.run(should_stop))
+    finally:
+        processor.close()
+    assert [result.input_path for result in results] == [existing] + added
+    assert all(result.success for result in results)
+    assert os.path.exists(str(tmp_path / "b_proc.jpg"))